@@ -1,6 +1,22 @@
 # -*- coding: utf-8 -*-
+import json
+
 from django.db import models
+from django.conf.urls import patterns
+from django.conf.urls import url
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
 from django.contrib.contenttypes.admin import GenericTabularInline
 
 from django_admin_bootstrapped.admin.models import SortableInline
@@ -19,7 +35,21 @@ from .models import Documentation
 from .models import TaggedItem
 from .models import TestMe
 from .models import TestSortable
+from .models import HasDoc
+from .bulk import save_formset
+from . import clusters
+from . import facets
+from . import fulltext
+from . import ranking
 from .forms import CountryForm
+from .export import ExportMixin
+from .filters import FacetListFilter
+from .filters import RollupDateFieldListFilter
+from .filters import TagListFilter
+from .forms import DiffSaveModelForm
+from .forms import RankedInlineFormSet
+from .forms import RankedModelForm
+from .pagination import KeysetPaginationMixin
 
 
 DEFAULT_FORMFIELD_OVERRIDES = {
@@ -29,7 +59,35 @@ DEFAULT_FORMFIELD_OVERRIDES = {
     }
 
 
-class BaseInline(admin.TabularInline):
+class BatchSaveInlineMixin(object):
+    """
+    Inline mixin marking its formsets to be saved by
+    :class:`BatchSaveAdminMixin`.
+    """
+    # save rows with bulk statements, see project.bulk.save_formset
+    batch_save = True
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super(BatchSaveInlineMixin, self).get_formset(request, obj, **kwargs)
+        formset.batch_save = self.batch_save
+        return formset
+
+
+class BatchSaveAdminMixin(object):
+    """
+    ModelAdmin mixin saving the formsets of :class:`BatchSaveInlineMixin`
+    inlines with :func:`project.bulk.save_formset`.
+    """
+
+    def save_formset(self, request, form, formset, change):
+        if getattr(formset, 'batch_save', False):
+            save_formset(formset)
+        else:
+            formset.save()
+
+
+class BaseInline(BatchSaveInlineMixin, admin.TabularInline):
+    form = DiffSaveModelForm
     extra = 0
     formfield_overrides = DEFAULT_FORMFIELD_OVERRIDES
     fields = ['name', 'documentation']
@@ -60,51 +118,169 @@ class TaggedItemInline(GenericTabularInline):
     verbose_name_plural = '%ss' % verbose_name
 
 
-class BaseAdmin(admin.ModelAdmin):
+class DocumentationColumnMixin(object):
+    """
+    ModelAdmin mixin adding a sortable "Docs" column to changelists of
+    HasDoc models, counted and fetched in one query each per page. Only
+    the changelist rows are annotated, see
+    :class:`project.pagination.KeysetChangeList`.
+    """
+
+    def has_documentation(self):
+        return issubclass(self.model, HasDoc)
+
+    def get_changelist_queryset(self, request, queryset):
+        if self.has_documentation():
+            queryset = queryset.with_doc_count().with_documentation()
+        return queryset
+
+    def get_list_display(self, request):
+        list_display = super(DocumentationColumnMixin, self).get_list_display(request)
+        if self.has_documentation():
+            list_display = list(list_display) + ['documentation_list']
+        return list_display
+
+    def documentation_list(self, obj):
+        return ', '.join(doc.name for doc in obj.documentation.all())
+    documentation_list.short_description = 'Docs'
+    documentation_list.admin_order_field = 'doc_count'
+
+
+class BaseAdmin(DocumentationColumnMixin, ExportMixin, KeysetPaginationMixin,
+                BatchSaveAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'created', 'modified']
     search_fields = ['name']
     list_editable = ['name']
-    list_filter = ['created', 'modified']
+    list_filter = [
+        ('created', RollupDateFieldListFilter),
+        ('modified', RollupDateFieldListFilter),
+        ]
     list_per_page = 10
     save_as = True
     date_hierarchy = 'created'
+    # renders the date hierarchy from project.rollups
+    change_list_template = 'project/admin_change_list.html'
     fields = ['name', 'documentation']
+    form = DiffSaveModelForm
     formfield_overrides = DEFAULT_FORMFIELD_OVERRIDES
 
-    def save_formset(self, request, form, formset, change):
-        instances = formset.save(commit=False)
-        for instance in instances:
-            instance.save()
-        super(BaseAdmin, self).save_formset(request, form, formset, change)
-        formset.save_m2m()
 
-        return form.save(commit=False)
+class TaggedAdmin(BaseAdmin):
+    """
+    Admin for models with tags, the tags of a changelist page are fetched
+    in one query.
+    """
+    list_display = BaseAdmin.list_display + ['tag_list']
+    list_filter = BaseAdmin.list_filter + [TagListFilter]
+
+    def get_queryset(self, request):
+        qs = super(TaggedAdmin, self).get_queryset(request)
+        return qs.prefetch_related('tags')
+
+    def tag_list(self, obj):
+        return ', '.join(sorted(item.tag for item in obj.tags.all()))
+    tag_list.short_description = 'Tags'
+
+
+class FullTextSearchMixin(object):
+    """
+    ModelAdmin mixin searching the full text index of the model rather than
+    scanning ``search_fields`` with LIKE.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return fulltext.get_index(self.model).filter(queryset, search_term), False
+
+
+class FacetMixin(object):
+    """
+    ModelAdmin mixin adding a ``facets/<field>/`` JSON view of the values
+    and counts of its ``FacetListFilter`` fields a page at a time, for the
+    values left out of the changelist sidebar. The changelist parameters
+    passed to it are kept in the links it returns.
+    """
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urlpatterns = patterns(
+            '',
+            url(r'^facets/(?P<field_path>\w+)/$',
+                self.admin_site.admin_view(self.facets_view),
+                name='%s_%s_facets' % info),
+            )
+        return urlpatterns + super(FacetMixin, self).get_urls()
+
+    def get_facet_fields(self, request):
+        return [
+            list_filter[0] for list_filter in self.get_list_filter(request)
+            if isinstance(list_filter, (list, tuple))
+            and issubclass(list_filter[1], FacetListFilter)]
+
+    def facets_view(self, request, field_path):
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied
+        if field_path not in self.get_facet_fields(request):
+            raise Http404('No facets for %s.' % field_path)
+        field = self.model._meta.get_field(field_path)
+        offset, limit, query = facets.page_params(request.GET)
+        rows, more = facets.value_counts(self.model, field_path, offset, limit, query)
+
+        ignored = (facets.OFFSET_VAR, facets.LIMIT_VAR, facets.QUERY_VAR, PAGE_VAR,
+                   field_path, '%s__isnull' % field_path)
+        params = dict(
+            (name, value) for name, value in request.GET.items() if name not in ignored)
+        values = []
+        for value, count in rows:
+            lookup = dict(params, **facets.lookup_params(field_path, value))
+            values.append({
+                'display': facets.display_value(field, value),
+                'count': count,
+                'query_string': '?%s' % urlencode(sorted(lookup.items())),
+                })
+        data = {'values': values, 'more': more, 'offset': offset + len(rows)}
+        return HttpResponse(json.dumps(data), content_type='application/json')
 
 
 @admin.register(Documentation)
-class DocumentationAdmin(BaseAdmin):
+class DocumentationAdmin(FullTextSearchMixin, BaseAdmin):
     model = Documentation
     search_form = searchform_factory(Documentation)
     search_fields = ['name']
-    fields = ['name']
+    fields = ['name', 'body']
 
 
 @admin.register(Town)
-class TownAdmin(BaseAdmin):
+class TownAdmin(FullTextSearchMixin, TaggedAdmin):
+    # searches the names of the country, organisations, tags and
+    # documentation of each town too
     model = Town
     search_form = searchform_factory(Town)
     search_fields = ['name']
-    fields = ['name', 'sister_towns', 'documentation']
+    fields = ['name', 'sister_towns', 'sister_town_cluster', 'documentation']
+    readonly_fields = ['sister_town_cluster']
     inlines = [
         OrganisationTownInline,
         TaggedItemInline
         ]
 
+    def sister_town_cluster(self, obj):
+        cluster = clusters.cluster_of(obj) if obj.pk else None
+        if cluster is None:
+            return 'No sister towns'
+        return format_html(
+            '<a href="{0}?cluster={1}">{2} towns</a>',
+            reverse('admin:project_town_changelist'), cluster,
+            clusters.size(obj))
+    sister_town_cluster.short_description = 'Reachable towns'
 
-class CountryAdmin(BaseAdmin):
+
+class CountryAdmin(TaggedAdmin):
     # this one has the form defined to give direct ediing of m2m town_set
     form = CountryForm
     search_form = searchform_factory(Country)
+    list_display = TaggedAdmin.list_display + ['town_count']
     fields = ['name', 'towns', 'documentation']
     inlines = [
         TaggedItemInline
@@ -118,10 +294,11 @@ admin.site.register(Country, CountryAdmin)
 
 
 @admin.register(Organisation)
-class OrganisationAdmin(BaseAdmin):
+class OrganisationAdmin(TaggedAdmin):
     model = Organisation
     search_form = searchform_factory(Organisation)
     search_fields = ['name']
+    list_display = TaggedAdmin.list_display + ['town_count']
     inlines = [
         TownOrganisationInline,
         TaggedItemInline
@@ -129,13 +306,17 @@ class OrganisationAdmin(BaseAdmin):
 
 
 @admin.register(OrganisationTown)
-class OrganisationTownAdmin(admin.ModelAdmin):
+class OrganisationTownAdmin(DocumentationColumnMixin, ExportMixin, KeysetPaginationMixin,
+                            admin.ModelAdmin):
     model = OrganisationTown
     fields = ['organisation', 'town', 'joined', 'documentation']
     list_display = ['custom_name', 'created', 'modified']
+    list_select_related = ['town', 'organisation']
     search_fields = ['town__name', 'organisation__name']
     save_as = True
     date_hierarchy = 'created'
+    change_list_template = 'project/admin_change_list.html'
+    form = DiffSaveModelForm
     search_form = searchform_factory(OrganisationTown)
     formfield_overrides = DEFAULT_FORMFIELD_OVERRIDES
 
@@ -147,25 +328,108 @@ class OrganisationTownAdmin(admin.ModelAdmin):
 @admin.register(TaggedItem)
 class TaggedItemAdmin(admin.ModelAdmin):
     model = TaggedItem
+    list_display = ['tag', 'content_type', 'content_object']
+    list_select_related = ['content_type']
     search_fields = ['tag']
     formfield_overrides = {
         models.ForeignKey: {'widget': AutocompleteCTWidget},
         }
 
+    def get_queryset(self, request):
+        # one query per content type for the tagged objects of a page
+        qs = super(TaggedItemAdmin, self).get_queryset(request)
+        return qs.prefetch_related('content_object')
+
 
-class TestSortable(admin.TabularInline, SortableInline):
+class TestSortable(BatchSaveInlineMixin, admin.TabularInline, SortableInline):
     model = TestSortable
+    form = RankedModelForm
+    # only the rows out of place get a new position, see project.ranking
+    formset = RankedInlineFormSet
     start_collapsed = True
     extra = 0
 
 
+class ReorderMixin(object):
+    """
+    ModelAdmin mixin adding a ``<id>/reorder/<model>/`` view that takes the
+    primary keys of the rows of an inline with a ``RankedInlineFormSet``
+    in their new order, posted as ``order``, and answers the positions
+    changed as JSON:
+
+        >>> import datetime
+        >>> from django.contrib.auth.models import User
+        >>> from django.test import RequestFactory
+        >>> testme = TestMe.objects.create(
+        ...     test_ip='127.0.0.1', test_url='http://example.com', test_int=1,
+        ...     test_date=datetime.date(2015, 1, 1), test_char='x',
+        ...     test_time=datetime.time(12), test_slug='x', test_text='x',
+        ...     test_email='x@example.com', test_float=1, test_bigint=1,
+        ...     test_positive_integer=1, test_decimal=1,
+        ...     test_comma_separated_int='1', test_small_int=1,
+        ...     test_positive_small_int=1)
+        >>> rows = [testme.testsortable_set.create(position=position, test_char=char)
+        ...         for position, char in zip(ranking.spread(4), 'abcd')]
+        >>> request = RequestFactory().post('/', {'order': [rows[3].pk] + [row.pk for row in rows[:3]]})
+        >>> request.user = User(is_active=True, is_superuser=True)
+        >>> response = admin.site._registry[TestMe].reorder_view(request, str(testme.pk), 'testsortable')
+        >>> json.loads(response.content.decode('utf-8')) == {str(rows[3].pk): 512}
+        True
+        >>> [row.test_char for row in testme.testsortable_set.all()]
+        ['d', 'a', 'b', 'c']
+        >>> testme.delete()
+    """
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urlpatterns = patterns(
+            '',
+            url(r'^(?P<object_id>.+)/reorder/(?P<model_name>\w+)/$',
+                self.admin_site.admin_view(self.reorder_view),
+                name='%s_%s_reorder' % info),
+            )
+        return urlpatterns + super(ReorderMixin, self).get_urls()
+
+    def get_ranked_inline(self, request, model_name):
+        for inline in self.get_inline_instances(request):
+            if (inline.model._meta.model_name == model_name
+                    and issubclass(inline.formset, RankedInlineFormSet)):
+                return inline
+        raise Http404('No ordered rows of %s.' % model_name)
+
+    @method_decorator(require_POST)
+    def reorder_view(self, request, object_id, model_name):
+        obj = self.get_object(request, unquote(object_id))
+        if obj is None:
+            raise Http404('No %s with primary key %s.' % (
+                self.model._meta.verbose_name, object_id))
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+        inline = self.get_ranked_inline(request, model_name)
+        fk = inline.get_formset(request, obj).fk
+        pk_field = inline.model._meta.pk
+        try:
+            pks = [pk_field.to_python(pk) for pk in request.POST.getlist('order')]
+        except ValidationError:
+            return HttpResponseBadRequest('Invalid order.')
+        queryset = inline.get_queryset(request).filter(**{fk.name: obj})
+        positions = ranking.reorder(queryset, pks, inline.form.rank_field)
+        data = dict((str(pk), position) for pk, position in positions.items())
+        return HttpResponse(json.dumps(data, sort_keys=True), content_type='application/json')
+
+
 @admin.register(TestMe)
-class TestMeAdmin(admin.ModelAdmin):
+class TestMeAdmin(ReorderMixin, FacetMixin, BatchSaveAdminMixin, admin.ModelAdmin):
     search_fields = ['test_ip', 'test_url', ]
     list_editable = ['test_int', ]
-    list_filter = ['test_ip', 'test_url', 'test_int', ]
+    list_filter = [
+        ('test_ip', FacetListFilter),
+        ('test_url', FacetListFilter),
+        ('test_int', FacetListFilter),
+        ]
     list_per_page = 3
     date_hierarchy = 'test_date'
+    change_list_template = 'project/admin_change_list.html'
     inlines = [TestSortable]
     save_as = True
     save_on_top = True
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from django.apps import AppConfig
+
+
+class ProjectConfig(AppConfig):
+    name = 'project'
+
+    def ready(self):
+        from . import signals  # noqa
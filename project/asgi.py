@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI config, Python 3.5 and later.
+
+The ``api/lookup/<name>`` autocomplete lookups are served here without a
+worker thread per request: each waits out a short debounce on the event
+loop, and a newer lookup from the same browser for the same name
+supersedes it, answered ``204 No Content`` and its query interrupted if
+already running. Queries run on a bounded pool of threads. Every other
+request is passed to the WSGI application on a separate pool.
+
+Run with any ASGI server, for example::
+
+    $ uvicorn project.asgi:application
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
+
+import django  # noqa
+django.setup()
+
+from django.conf import settings  # noqa
+from django.core.wsgi import get_wsgi_application  # noqa
+from django.db import close_old_connections  # noqa
+from django.db import connections  # noqa
+from django.db import router  # noqa
+
+from . import routers  # noqa
+from .models import API_LOOKUP_PATH  # noqa
+from .views import AUTOCOMPLETE_LIMIT  # noqa
+from .views import AUTOCOMPLETE_MAX_LIMIT  # noqa
+from .views import autocomplete_models  # noqa
+from .views import autocomplete_results  # noqa
+
+
+DEFAULTS = {
+    # seconds a lookup waits for a newer one before querying
+    'DEBOUNCE': 0.05,
+    # threads running autocomplete queries
+    'QUERY_THREADS': 4,
+    # threads running the WSGI application
+    'WSGI_THREADS': 8,
+    }
+
+SESSION_COOKIE = getattr(settings, 'SESSION_COOKIE_NAME', 'sessionid')
+
+CLIENT_HEADER = b'x-autocomplete-client'
+
+
+def get_options():
+    return dict(DEFAULTS, **getattr(settings, 'ASYNC_AUTOCOMPLETE', {}))
+
+
+def interrupt(raw):
+    """
+    Abort the statement running on the database driver connection ``raw``
+    from another thread, where the driver can.
+    """
+    if hasattr(raw, 'interrupt'):
+        # sqlite3
+        raw.interrupt()
+    elif hasattr(raw, 'cancel'):
+        raw.cancel()
+
+
+def get_limit(params):
+    try:
+        limit = int(params.get('limit', [AUTOCOMPLETE_LIMIT])[0])
+    except ValueError:
+        limit = AUTOCOMPLETE_LIMIT
+    return max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+
+def client_key(scope, params):
+    """
+    What identifies the browser sending a lookup, its session or an
+    explicit client id. Lookups without one never supersede each other.
+    """
+    headers = dict(scope.get('headers') or [])
+    if CLIENT_HEADER in headers:
+        return headers[CLIENT_HEADER].decode('latin-1')
+    if 'client' in params:
+        return params['client'][0]
+    for cookie in headers.get(b'cookie', b'').decode('latin-1').split(';'):
+        name, _, value = cookie.strip().partition('=')
+        if name == SESSION_COOKIE and value:
+            return value
+    return None
+
+
+class Lookup(object):
+    """
+    A lookup being served, with the driver connection its query runs on
+    once a thread has taken it. Django connections belong to the thread
+    that opened them, so the driver connection is taken on that thread.
+    """
+
+    def __init__(self):
+        self.superseded = False
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def supersede(self):
+        with self.lock:
+            self.superseded = True
+            if self.connection is not None:
+                interrupt(self.connection)
+
+
+class AutocompleteApplication(object):
+    """
+    ASGI application answering autocomplete lookups itself and passing
+    everything else to ``fallback``.
+    """
+
+    def __init__(self, fallback, options=None):
+        options = options or get_options()
+        self.fallback = fallback
+        self.debounce = options['DEBOUNCE']
+        self.executor = ThreadPoolExecutor(options['QUERY_THREADS'])
+        self.path_re = re.compile(r'^/%s/(?P<name>[\w-]+)/?$' % API_LOOKUP_PATH)
+        self.names = autocomplete_models()
+        # (client, name) -> the latest Lookup
+        self.latest = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            match = self.path_re.match(scope['path'])
+            if match and match.group('name') in self.names:
+                return await self.autocomplete(scope, send, match.group('name'))
+        return await self.fallback(scope, receive, send)
+
+    def run_query(self, lookup, name, query, limit):
+        model = self.names[name]
+        close_old_connections()
+        routers.start_request()
+        try:
+            # the query must run on the connection taken here, the primary
+            # as results are cached, see project.routers
+            with routers.use_primary():
+                alias = router.db_for_read(model)
+            connection = connections[alias]
+            connection.ensure_connection()
+            with lookup.lock:
+                if lookup.superseded:
+                    return None
+                lookup.connection = connection.connection
+            with routers.use_database(alias):
+                return autocomplete_results(name, query, limit)
+        except Exception:
+            if lookup.superseded:
+                return None
+            raise
+        finally:
+            with lookup.lock:
+                lookup.connection = None
+            routers.end_request()
+            close_old_connections()
+
+    async def autocomplete(self, scope, send, name):
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        query = params.get('q', params.get('term', ['']))[0]
+        limit = get_limit(params)
+
+        lookup = Lookup()
+        client = client_key(scope, params)
+        key = (client, name)
+        if client is not None:
+            previous = self.latest.get(key)
+            if previous is not None:
+                previous.supersede()
+            self.latest[key] = lookup
+        try:
+            await asyncio.sleep(self.debounce)
+            results = None
+            if not lookup.superseded:
+                loop = asyncio.get_event_loop()
+                results = await loop.run_in_executor(
+                    self.executor, self.run_query, lookup, name, query, limit)
+        finally:
+            if self.latest.get(key) is lookup:
+                del self.latest[key]
+
+        if results is None:
+            await send_response(send, 204, b'')
+        else:
+            data = [{'pk': pk, 'name': value} for pk, value in results]
+            await send_response(send, 200, json.dumps(data).encode('utf-8'),
+                                b'application/json')
+
+
+async def send_response(send, status, body, content_type=b'text/plain'):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type),
+                    (b'content-length', str(len(body)).encode('ascii'))],
+        })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class WSGIApplication(object):
+    """
+    Serve ASGI HTTP requests with a WSGI application run on ``threads``
+    threads, streaming its response.
+    """
+
+    def __init__(self, application, threads):
+        self.application = application
+        self.executor = ThreadPoolExecutor(threads)
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+            }
+        for name, value in scope.get('headers') or []:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+            else:
+                key = 'HTTP_%s' % name
+                environ[key] = '%s,%s' % (environ[key], value) if key in environ else value
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope type %s' % scope['type'])
+        body = BytesIO()
+        more = True
+        while more:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more = message.get('more_body', False)
+        body.seek(0)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        loop = asyncio.get_event_loop()
+        environ = self.environ(scope, body)
+        response = await loop.run_in_executor(
+            self.executor, self.application, environ, start_response)
+        result = iter(response)
+        try:
+            first = await loop.run_in_executor(self.executor, next, result, None)
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': started['headers']})
+            chunk = first
+            while chunk is not None:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, result, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                await loop.run_in_executor(self.executor, response.close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+application = AutocompleteApplication(
+    WSGIApplication(get_wsgi_application(), get_options()['WSGI_THREADS']))
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Timings of the admin and API paths, written as JSON and compared with a
+stored baseline.
+
+A path regresses when its median time grows by more than ``tolerance`` or
+its median number of queries grows at all:
+
+    >>> baseline = {'results': {
+    ...     'town.changelist': {'median_ms': 10.0, 'median_queries': 5},
+    ...     'town.search': {'median_ms': 10.0, 'median_queries': 5}}}
+    >>> current = {'results': {
+    ...     'town.changelist': {'median_ms': 13.0, 'median_queries': 5},
+    ...     'town.search': {'median_ms': 9.0, 'median_queries': 6},
+    ...     'town.save': {'median_ms': 30.0, 'median_queries': 12}}}
+    >>> for line in compare(current, baseline, tolerance=0.2):
+    ...     print(line)
+    town.changelist: median 13.0 ms, baseline 10.0 ms (+30%)
+    town.search: 6 queries, baseline 5
+
+"""
+import datetime
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.urlresolvers import reverse
+from django.db.models.fields.files import FieldFile
+from django.db import connection
+from django.forms.widgets import MultiWidget
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.crypto import get_random_string
+
+from .cache import get_cache
+from .views import autocomplete_models
+
+
+BENCHMARK_USER = 'benchmark'
+REPEAT = 5
+TOLERANCE = 0.25
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """
+    Describe the paths of ``current`` slower than in ``baseline`` by more
+    than ``tolerance`` or running more queries.
+    """
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append('%s: median %.1f ms, baseline %.1f ms (%+d%%)' % (
+                name, result['median_ms'], base['median_ms'],
+                round(100.0 * result['median_ms'] / base['median_ms'] - 100)))
+        if result['median_queries'] > base['median_queries']:
+            regressions.append('%s: %d queries, baseline %d' % (
+                name, result['median_queries'], base['median_queries']))
+    return regressions
+
+
+def client_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def benchmark_client():
+    """
+    A test client logged in as a superuser made for the benchmark.
+    """
+    User = get_user_model()
+    password = get_random_string()
+    user, created = User.objects.get_or_create(**{User.USERNAME_FIELD: BENCHMARK_USER})
+    user.is_staff = user.is_superuser = user.is_active = True
+    user.set_password(password)
+    user.save()
+    client = Client(HTTP_HOST=client_host())
+    client.login(username=BENCHMARK_USER, password=password)
+    return client
+
+
+def form_data(form):
+    """
+    POST data resubmitting the values ``form`` was rendered with.
+    """
+    data = {}
+    for bound in form:
+        value = bound.value()
+        if value is None or value is False:
+            continue
+        widget = bound.field.widget
+        if isinstance(widget, MultiWidget):
+            for i, part in enumerate(widget.decompress(value)):
+                if part is not None:
+                    data['%s_%s' % (bound.html_name, i)] = part
+        elif isinstance(value, (list, tuple)):
+            data[bound.html_name] = [str(v) for v in value]
+        elif value is True:
+            data[bound.html_name] = 'on'
+        elif not isinstance(value, FieldFile):
+            # files cannot be resubmitted, the stored one is kept
+            data[bound.html_name] = value
+    return data
+
+
+def change_form_data(response):
+    context = response.context_data
+    data = form_data(context['adminform'].form)
+    for inline in context['inline_admin_formsets']:
+        formset = inline.formset
+        data.update(form_data(formset.management_form))
+        for form in formset.forms:
+            data.update(form_data(form))
+    return data
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+class Benchmark(object):
+    """
+    Time the changelist, search, change form and save paths of every admin
+    of the project and the autocomplete API, ``repeat`` times each.
+    """
+
+    def __init__(self, client=None, repeat=REPEAT, app_label='project'):
+        self.client = client or benchmark_client()
+        self.repeat = repeat
+        self.app_label = app_label
+        self.results = OrderedDict()
+
+    def measure(self, name, request, setup=None):
+        times = []
+        counts = []
+        for i in range(self.repeat):
+            if setup is not None:
+                setup()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.time()
+                response = request()
+                if response.streaming:
+                    for chunk in response.streaming_content:
+                        pass
+                times.append((time.time() - started) * 1000)
+            counts.append(len(queries))
+        self.results[name] = {
+            'median_ms': round(median(times), 3),
+            'min_ms': round(min(times), 3),
+            'max_ms': round(max(times), 3),
+            'median_queries': median(counts),
+            'min_queries': min(counts),
+            'status': response.status_code,
+            }
+        return response
+
+    def search_term(self, model_admin):
+        fields = model_admin.get_search_fields(None)
+        if not fields:
+            return None
+        field = fields[0].lstrip('^=@')
+        values = model_admin.model._default_manager.exclude(
+            **{field: ''}).order_by('pk').values_list(field, flat=True)[:1]
+        return values[0][:3] if values else None
+
+    def run_admin(self, model, model_admin):
+        info = model._meta.app_label, model._meta.model_name
+        prefix = model._meta.model_name
+        changelist = reverse('admin:%s_%s_changelist' % info)
+        client = self.client
+
+        self.measure('%s.changelist' % prefix, lambda: client.get(changelist))
+        self.measure('%s.changelist_page' % prefix,
+                     lambda: client.get(changelist, {'p': 1}))
+        term = self.search_term(model_admin)
+        if term:
+            self.measure('%s.search' % prefix,
+                         lambda: client.get(changelist, {'q': term}))
+
+        obj = model._default_manager.order_by('pk').first()
+        if obj is None:
+            return
+        change = reverse('admin:%s_%s_change' % info, args=[obj.pk])
+        response = self.measure('%s.change_form' % prefix, lambda: client.get(change))
+        if response.status_code == 200:
+            data = change_form_data(response)
+            self.measure('%s.save' % prefix, lambda: client.post(change, data))
+
+    def run_autocomplete(self):
+        for name, model in sorted(autocomplete_models().items()):
+            names = model._default_manager.order_by('pk').values_list('name', flat=True)[:1]
+            query = names[0][:2] if names else ''
+            url = reverse('autocomplete', kwargs={'name': name})
+            # timed uncached, hits only measure the cache
+            self.measure(
+                'autocomplete.%s' % name,
+                lambda: self.client.get(url, {'q': query}),
+                setup=lambda: get_cache().invalidate(name))
+
+    def run(self):
+        for model, model_admin in sorted(
+                admin.site._registry.items(), key=lambda item: item[0]._meta.model_name):
+            if model._meta.app_label == self.app_label:
+                self.run_admin(model, model_admin)
+        self.run_autocomplete()
+        return self.report()
+
+    def report(self):
+        counts = {}
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label == self.app_label:
+                counts[model._meta.model_name] = model._default_manager.count()
+        return {
+            'created': datetime.datetime.utcnow().isoformat(),
+            'database': connection.vendor,
+            'repeat': self.repeat,
+            'counts': counts,
+            'results': self.results,
+            }
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Batched persistence helpers.
+
+Bulk writes bypass ``pre_save`` and ``post_save`` so
+:data:`pre_bulk_create`, :data:`pre_bulk_update`, :data:`post_bulk_create`
+and :data:`post_bulk_update` are sent instead for receivers that maintain
+derived data.
+
+    >>> from project.models import Documentation
+    >>> docs = [Documentation.objects.create(name=name) for name in 'abc']
+    >>> for doc, name in zip(docs, ['x', 'y', 'z']):
+    ...     doc.name = name
+    >>> bulk_update(docs, ['name'])
+    >>> sorted(Documentation.objects.filter(
+    ...     pk__in=[d.pk for d in docs]).values_list('name', 'search_key'))
+    [('x', 'x'), ('y', 'y'), ('z', 'z')]
+    >>> created = bulk_create(Documentation, [Documentation(name='Ünïcode')])
+    >>> Documentation.objects.filter(name='Ünïcode').values_list('search_key', flat=True)
+    ['unicode']
+
+Clean up
+
+    >>> Documentation.objects.filter(pk__in=[d.pk for d in docs]).delete()
+    >>> Documentation.objects.filter(name='Ünïcode').delete()
+
+"""
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.models import AutoField
+from django.dispatch import Signal
+
+
+# receivers may set derived fields of ``instances`` and, on update, append
+# their names to ``fields``
+pre_bulk_create = Signal(providing_args=['instances'])
+pre_bulk_update = Signal(providing_args=['instances', 'fields'])
+post_bulk_create = Signal(providing_args=['instances'])
+post_bulk_update = Signal(providing_args=['instances', 'fields'])
+
+# stay below the 999 variables SQLite allows in one statement
+MAX_QUERY_PARAMS = 900
+
+
+def _placeholder(field, connection):
+    # PostgreSQL cannot infer the type of a parameter in a CASE result
+    if connection.vendor != 'postgresql':
+        return '%s'
+    if isinstance(field, AutoField):
+        return 'CAST(%s AS integer)'
+    return 'CAST(%%s AS %s)' % field.db_type(connection)
+
+
+def _update_sql(opts, fields, batch, connection):
+    """
+    ``(sql, params)`` of the ``UPDATE`` writing ``fields`` of the objects
+    of ``batch``.
+    """
+    qn = connection.ops.quote_name
+    pk = opts.pk
+    pks = [pk.get_db_prep_value(obj.pk, connection) for obj in batch]
+    assignments = []
+    params = []
+    for field in fields:
+        when = 'WHEN %s THEN %s' % (
+            _placeholder(pk, connection), _placeholder(field, connection))
+        assignments.append('%s = CASE %s %s END' % (
+            qn(field.column), qn(pk.column), ' '.join([when] * len(batch))))
+        for obj, pk_value in zip(batch, pks):
+            params.append(pk_value)
+            params.append(field.get_db_prep_save(
+                getattr(obj, field.attname), connection=connection))
+    params.extend(pks)
+    sql = 'UPDATE %s SET %s WHERE %s IN (%s)' % (
+        qn(opts.db_table), ', '.join(assignments), qn(pk.column),
+        ', '.join(['%s'] * len(batch)))
+    return sql, params
+
+
+def bulk_update(objs, fields, using=None):
+    """
+    Write ``fields`` of every object in ``objs`` with a single ``UPDATE ...
+    SET field = CASE pk WHEN ... END`` statement per batch. Fields with
+    ``auto_now`` are refreshed and written as ``save()`` would.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    model = objs[0].__class__
+    opts = model._meta
+    db = using or router.db_for_write(model)
+    connection = connections[db]
+
+    fields = list(fields)
+    pre_bulk_update.send(sender=model, instances=objs, fields=fields, using=db)
+    fields = [opts.get_field(name) for name in fields]
+    for field in opts.concrete_fields:
+        if getattr(field, 'auto_now', False) and field not in fields:
+            fields.append(field)
+    if not fields:
+        return
+    for obj in objs:
+        for field in fields:
+            if getattr(field, 'auto_now', False):
+                field.pre_save(obj, False)
+
+    batch_size = max(1, MAX_QUERY_PARAMS // (2 * len(fields) + 1))
+    with transaction.atomic(using=db, savepoint=False):
+        cursor = connection.cursor()
+        for start in range(0, len(objs), batch_size):
+            cursor.execute(*_update_sql(opts, fields, objs[start:start + batch_size], connection))
+
+    post_bulk_update.send(
+        sender=model, instances=objs, fields=[f.name for f in fields], using=db)
+
+
+def bulk_create(model, objs, using=None):
+    """
+    ``bulk_create`` that sends :data:`pre_bulk_create` and
+    :data:`post_bulk_create`.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    db = using or router.db_for_write(model)
+    pre_bulk_create.send(sender=model, instances=objs, using=db)
+    model._default_manager.using(db).bulk_create(objs)
+    post_bulk_create.send(sender=model, instances=objs, using=db)
+    return objs
+
+
+def save_formset(formset):
+    """
+    Persist a model formset in batches: new objects go through one
+    ``bulk_create``, changed objects through one :func:`bulk_update` of the
+    changed fields and deleted objects through one ``DELETE``.
+
+    The formset's ``new_objects``, ``changed_objects`` and
+    ``deleted_objects`` are left as ``save()`` leaves them so admin change
+    messages stay correct.
+    """
+    model = formset.model
+    opts = model._meta
+    concrete = set(f.name for f in opts.concrete_fields if not f.primary_key)
+    m2m_names = set(f.name for f in opts.many_to_many)
+
+    with transaction.atomic():
+        formset.save(commit=False)
+        forms = dict((id(form.instance), form) for form in formset.saved_forms)
+
+        if formset.deleted_objects:
+            model._default_manager.filter(
+                pk__in=[obj.pk for obj in formset.deleted_objects]).delete()
+
+        # auto_now fields are written even when only relations changed
+        changed_fields = set()
+        for obj, fields in formset.changed_objects:
+            changed_fields.update(concrete.intersection(fields))
+        bulk_update(
+            [obj for obj, fields in formset.changed_objects],
+            sorted(changed_fields))
+
+        # objects with many to many data need a primary key to link to,
+        # which bulk_create does not return on every backend
+        batch = []
+        for obj in formset.new_objects:
+            form = forms[id(obj)]
+            if any(form[name].value() for name in m2m_names if name in form.fields):
+                obj.save()
+            else:
+                batch.append(obj)
+        bulk_create(model, batch)
+
+        new = set(id(obj) for obj in formset.new_objects)
+        for form in formset.saved_forms:
+            if form.instance.pk is None:
+                continue
+            if id(form.instance) in new or m2m_names.intersection(form.changed_data):
+                form.save_m2m()
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .routers import use_primary
+from .text import normalize
+
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 1000,
+    'TIMEOUT': 300,
+    'CACHE_ALIAS': 'default',
+    }
+
+MISSING = object()
+
+
+def new_generation():
+    # never a value an evicted counter may have had
+    return int(time.time() * 1000000)
+
+
+def get_generation(cache, key):
+    """
+    The generation counter ``key`` of ``cache``. A missing counter, never
+    set or evicted, starts again from a new value so that entries cached
+    under an earlier one are not read again:
+
+        >>> from django.core.cache import caches
+        >>> shared = caches['shared']
+        >>> first = get_generation(shared, 'test:generation')
+        >>> bump_generation(shared, 'test:generation')
+        >>> get_generation(shared, 'test:generation') == first + 1
+        True
+        >>> shared.delete('test:generation')
+        >>> get_generation(shared, 'test:generation') > first + 1
+        True
+
+    """
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, new_generation(), None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, new_generation(), None)
+
+
+class LocalBackend(object):
+    """
+    Bounded in-process LRU cache whose entries also expire after
+    ``timeout`` seconds. A value computed before the last invalidation of
+    its name is not stored.
+
+        >>> backend = LocalBackend(max_size=2, timeout=60)
+        >>> backend.set(('town', 'a', 10), [1])
+        >>> backend.set(('town', 'b', 10), [2])
+        >>> backend.get(('town', 'a', 10))
+        [1]
+        >>> backend.set(('country', 'c', 10), [3])
+        >>> backend.get(('town', 'b', 10)) is MISSING
+        True
+        >>> backend.invalidate('town')
+        >>> backend.get(('town', 'a', 10)) is MISSING
+        True
+        >>> backend.get(('country', 'c', 10))
+        [3]
+        >>> generation = backend.generation('town')
+        >>> backend.invalidate('town')
+        >>> backend.set(('town', 'a', 10), [1], generation)
+        >>> backend.get(('town', 'a', 10)) is MISSING
+        True
+
+    """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._generations = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def generation(self, name):
+        return self._generations[name]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires < time.time():
+                del self._data[key]
+                return MISSING
+            # mark as most recently used
+            del self._data[key]
+            self._data[key] = entry
+            return value
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generations[key[0]]:
+                return
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.timeout, value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, name):
+        with self._lock:
+            self._generations[name] += 1
+            for key in [k for k in self._data if k[0] == name]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend(object):
+    """
+    Shared cache on a Django cache alias. Entries cannot be enumerated so
+    each autocomplete name carries a generation number that is bumped to
+    invalidate everything cached for it. A value computed before the last
+    invalidation is stored under the old generation, where it is never
+    read.
+    """
+
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def generation_key(self, name):
+        return 'autocomplete:generation:%s' % name
+
+    def generation(self, name):
+        return get_generation(self.cache, self.generation_key(name))
+
+    def make_key(self, key, generation=None):
+        name, query, limit = key
+        if generation is None:
+            generation = self.generation(name)
+        digest = hashlib.md5(query.encode('utf-8')).hexdigest()
+        return 'autocomplete:%s:%s:%s:%s' % (name, generation, limit, digest)
+
+    def get(self, key):
+        return self.cache.get(self.make_key(key), MISSING)
+
+    def set(self, key, value, generation=None):
+        self.cache.set(self.make_key(key, generation), value, self.timeout)
+
+    def invalidate(self, name):
+        bump_generation(self.cache, self.generation_key(name))
+
+
+class AutocompleteCache(object):
+    """
+    Cache of autocomplete results keyed by ``(name, normalized query,
+    limit)``, counting hits and misses so that it can be sized.
+
+        >>> cache = AutocompleteCache(LocalBackend(max_size=10, timeout=60))
+        >>> cache.get_or_compute('town', u'Chr', 10, lambda: [(5, 'Christchurch')])
+        [(5, 'Christchurch')]
+        >>> cache.get_or_compute('town', u'chr ', 10, lambda: [])
+        [(5, 'Christchurch')]
+        >>> sorted(cache.stats().items())
+        [('backend', 'LocalBackend'), ('hits', 1), ('invalidations', 0), ('misses', 1)]
+
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, name, query, limit, compute):
+        key = (name, normalize(query), limit)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        # what compute reads may be changed meanwhile
+        generation = self.backend.generation(name)
+        with use_primary():
+            value = compute()
+        self.backend.set(key, value, generation)
+        return value
+
+    def invalidate(self, name):
+        self.invalidations += 1
+        self.backend.invalidate(name)
+
+    def stats(self):
+        return {
+            'backend': self.backend.__class__.__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            }
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    Return the process wide autocomplete cache configured by the
+    ``AUTOCOMPLETE_CACHE`` setting.
+    """
+    global _cache
+    if _cache is None:
+        options = dict(DEFAULTS, **getattr(settings, 'AUTOCOMPLETE_CACHE', {}))
+        if options['BACKEND'] == 'django':
+            backend = DjangoCacheBackend(options['CACHE_ALIAS'], options['TIMEOUT'])
+        else:
+            backend = LocalBackend(options['MAX_SIZE'], options['TIMEOUT'])
+        _cache = AutocompleteCache(backend)
+    return _cache
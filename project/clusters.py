@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Connected components of the sister town graph.
+
+Every town with sister towns stores the smallest primary key of the towns
+reachable from it in ``Town.cluster``, towns without sister towns have none.
+Adding links merges the clusters of both ends with a single UPDATE, removing
+links recomputes the one cluster they were in:
+
+    >>> from project.models import Town
+    >>> a, b, c, d = [Town.objects.create(name=name) for name in 'abcd']
+    >>> a.sister_towns.add(b)
+    >>> c.sister_towns.add(d)
+    >>> sizes([a, b, c, d])
+    [2, 2, 2, 2]
+    >>> b.sister_towns.add(c)
+    >>> [t.name for t in members(a)]
+    ['a', 'b', 'c', 'd']
+    >>> b.sister_towns.remove(c)
+    >>> [t.name for t in members(c)], size(a)
+    (['c', 'd'], 2)
+    >>> a.sister_towns.clear()
+    >>> [t.name for t in members(a)]
+    ['a']
+
+Deleting a town splits the cluster it is in, even when the instance was
+loaded before the cluster was written:
+
+    >>> d.delete()
+    >>> cluster_of(c) is None
+    True
+
+Clean up
+
+    >>> for town in (a, b, c):
+    ...     town.delete()
+
+"""
+from collections import defaultdict
+
+from django.db.models import Count
+from django.db.models import Q
+
+from .bulk import MAX_QUERY_PARAMS
+from .models import Town
+
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def links():
+    return Town.sister_towns.through._default_manager
+
+
+def cluster_of(town):
+    return Town.objects.filter(pk=town.pk).values_list('cluster', flat=True)[0]
+
+
+def set_cluster(pks, cluster):
+    pks = sorted(pks)
+    for start in range(0, len(pks), MAX_QUERY_PARAMS):
+        Town.objects.filter(pk__in=pks[start:start + MAX_QUERY_PARAMS]).update(
+            cluster=cluster)
+
+
+def merge(pks):
+    """
+    Put the towns ``pks`` and every town linked to them in one cluster.
+    """
+    pks = set(pks)
+    roots = set(
+        cluster or pk for pk, cluster in
+        Town.objects.filter(pk__in=pks).values_list('pk', 'cluster'))
+    if not roots:
+        return
+    root = min(roots)
+    Town.objects.filter(Q(cluster__in=roots) | Q(pk__in=pks)).exclude(
+        cluster=root).update(cluster=root)
+
+
+def components(edges):
+    """
+    The connected components of the graph of ``edges`` pairs, as sets.
+
+        >>> sorted(sorted(c) for c in components([(1, 2), (3, 4), (2, 5)]))
+        [[1, 2, 5], [3, 4]]
+
+    """
+    parent = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for left, right in edges:
+        left, right = find(left), find(right)
+        if left != right:
+            parent[max(left, right)] = min(left, right)
+    groups = defaultdict(set)
+    for node in list(parent):
+        groups[find(node)].add(node)
+    return list(groups.values())
+
+
+def split(cluster):
+    """
+    Recompute ``cluster`` after links between its towns were removed.
+    """
+    if cluster is None:
+        return
+    towns = set(Town.objects.filter(cluster=cluster).values_list('pk', flat=True))
+    edges = links().filter(from_town__cluster=cluster).values_list(
+        'from_town', 'to_town')
+    grouped = set()
+    for component in components(edges):
+        grouped |= component
+        root = min(component)
+        if root != cluster:
+            set_cluster(component, root)
+    set_cluster(towns - grouped, None)
+
+
+def rebuild():
+    """
+    Recompute every cluster from the links, for links written without
+    ``m2m_changed``.
+    """
+    edges = []
+    last = 0
+    while True:
+        chunk = list(links().filter(pk__gt=last).order_by('pk').values_list(
+            'pk', 'from_town', 'to_town')[:REBUILD_CHUNK_SIZE])
+        if not chunk:
+            break
+        edges.extend((left, right) for pk, left, right in chunk)
+        last = chunk[-1][0]
+    Town.objects.exclude(cluster=None).update(cluster=None)
+    for component in components(edges):
+        set_cluster(component, min(component))
+
+
+def members(town):
+    """
+    The towns reachable from ``town`` through sister links, itself included.
+    """
+    cluster = cluster_of(town)
+    if cluster is None:
+        return Town.objects.filter(pk=town.pk)
+    return Town.objects.filter(cluster=cluster).order_by('pk')
+
+
+def size(town):
+    cluster = cluster_of(town)
+    if cluster is None:
+        return 1
+    return Town.objects.filter(cluster=cluster).count()
+
+
+def sizes(towns):
+    """
+    Cluster sizes of ``towns`` in two queries.
+    """
+    clusters = dict(Town.objects.filter(
+        pk__in=[t.pk for t in towns]).values_list('pk', 'cluster'))
+    counts = dict(Town.objects.filter(
+        cluster__in=set(clusters.values()) - set([None])
+        ).values('cluster').annotate(n=Count('pk')).values_list('cluster', 'n'))
+    return [counts.get(clusters.get(t.pk), 1) for t in towns]
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Counts of related objects stored on the object they point at, such as the
+towns of a country, maintained incrementally from model signals:
+
+    >>> from project.models import Country
+    >>> from project.models import Town
+    >>> usa = Country.objects.create(name='usa')
+    >>> canada = Country.objects.create(name='canada')
+    >>> town = Town.objects.create(name='Seattle', country=usa)
+    >>> portland = Town.objects.create(name='Portland', country=usa)
+    >>> def counts():
+    ...     return [Country.objects.get(pk=c.pk).town_count for c in (usa, canada)]
+    >>> counts()
+    [2, 0]
+    >>> town.country = canada
+    >>> town.save()
+    >>> counts()
+    [1, 1]
+    >>> town.delete()
+    >>> counts()
+    [1, 0]
+
+Changes made with ``QuerySet.update()`` or raw SQL are not seen, they are
+put right by :func:`rebuild`, run by the ``repaircounters`` command:
+
+    >>> Town.objects.filter(country=usa).update(country=canada)
+    1
+    >>> counts()
+    [1, 0]
+    >>> rebuild(Country)
+    >>> counts()
+    [0, 1]
+
+Clean up
+
+    >>> Town.objects.filter(country=canada).delete()
+    >>> usa.delete()
+    >>> canada.delete()
+
+"""
+from collections import Counter
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+
+from .bulk import MAX_QUERY_PARAMS
+from .bulk import post_bulk_create
+from .bulk import post_bulk_update
+
+
+# model -> [(foreign key, counter field name)]
+TRACKED = {}
+
+REBUILD_CHUNK_SIZE = 2000
+
+
+def track(model, fk_name, counter_name):
+    """
+    Keep ``counter_name`` of the object each ``model`` points at through
+    ``fk_name`` equal to the number of those ``model`` objects.
+    """
+    field = model._meta.get_field(fk_name)
+    TRACKED.setdefault(model, []).append((field, counter_name))
+    uid = 'counters.%s.%s' % (model._meta.app_label, model._meta.model_name)
+    post_init.connect(remember_targets, sender=model, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, dispatch_uid=uid)
+    post_bulk_create.connect(bulk_created, sender=model, dispatch_uid=uid)
+    post_bulk_update.connect(bulk_updated, sender=model, dispatch_uid=uid)
+
+
+def counted(target):
+    """
+    ``(model, foreign key, counter field name)`` of the counters stored on
+    ``target``.
+    """
+    return [(model, field, counter_name)
+            for model, counters in TRACKED.items()
+            for field, counter_name in counters
+            if field.rel.to is target]
+
+
+def targets(*models):
+    """
+    The models holding counters of any of ``models``.
+    """
+    return sorted(set(
+        field.rel.to for model in models for field, counter_name in TRACKED.get(model, ())),
+        key=lambda target: target._meta.model_name)
+
+
+def adjust(field, counter_name, deltas):
+    """
+    Add the ``{pk: delta}`` changes to ``counter_name`` of the objects
+    ``field`` points at, with one UPDATE per distinct delta.
+    """
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if pk is not None and delta:
+            by_delta[delta].append(pk)
+    manager = field.rel.to._default_manager
+    # a move is applied whole or not at all
+    with transaction.atomic():
+        for delta, pks in by_delta.items():
+            for start in range(0, len(pks), MAX_QUERY_PARAMS):
+                manager.filter(pk__in=pks[start:start + MAX_QUERY_PARAMS]).update(
+                    **{counter_name: F(counter_name) + delta})
+
+
+def adjust_moves(field, queryset, target):
+    """
+    Adjust the counters kept through ``field`` for the rows of ``queryset``
+    about to be pointed at ``target`` with ``QuerySet.update()``, which
+    sends no signals, from one grouped count of their current targets.
+    """
+    counter_names = [name for tracked, name in TRACKED.get(field.model, ()) if tracked == field]
+    if not counter_names:
+        return
+    deltas = Counter()
+    rows = queryset.order_by().values_list(field.attname).annotate(count=Count('pk'))
+    for pk, count in rows:
+        deltas[pk] -= count
+        deltas[target] += count
+    for counter_name in counter_names:
+        adjust(field, counter_name, deltas)
+
+
+def remember_targets(sender, instance, **kwargs):
+    instance._counter_values = dict(
+        (field.attname, getattr(instance, field.attname))
+        for field, counter_name in TRACKED[instance.__class__])
+
+
+def saved(sender, instance, created, **kwargs):
+    values = getattr(instance, '_counter_values', {})
+    for field, counter_name in TRACKED[sender]:
+        new = getattr(instance, field.attname)
+        old = None if created else values.get(field.attname, new)
+        if old != new:
+            adjust(field, counter_name, {new: 1, old: -1})
+    remember_targets(sender, instance)
+
+
+def deleted(sender, instance, **kwargs):
+    values = getattr(instance, '_counter_values', {})
+    for field, counter_name in TRACKED[sender]:
+        adjust(field, counter_name, {
+            values.get(field.attname, getattr(instance, field.attname)): -1})
+
+
+def bulk_created(sender, instances, **kwargs):
+    for field, counter_name in TRACKED[sender]:
+        adjust(field, counter_name, Counter(
+            getattr(obj, field.attname) for obj in instances))
+    for obj in instances:
+        remember_targets(sender, obj)
+
+
+def bulk_updated(sender, instances, fields, **kwargs):
+    for field, counter_name in TRACKED[sender]:
+        if field.name not in fields:
+            continue
+        deltas = Counter()
+        for obj in instances:
+            new = getattr(obj, field.attname)
+            old = getattr(obj, '_counter_values', {}).get(field.attname, new)
+            if old != new:
+                deltas[new] += 1
+                deltas[old] -= 1
+        adjust(field, counter_name, deltas)
+    for obj in instances:
+        remember_targets(sender, obj)
+
+
+def rebuild(target):
+    """
+    Recount the counters stored on ``target`` from the tables of the
+    counted models, ``REBUILD_CHUNK_SIZE`` objects at a time.
+    """
+    manager = target._default_manager
+    for model, field, counter_name in counted(target):
+        last = None
+        while True:
+            pks = manager.order_by('pk').values_list('pk', flat=True)
+            if last is not None:
+                pks = pks.filter(pk__gt=last)
+            pks = list(pks[:REBUILD_CHUNK_SIZE])
+            if not pks:
+                break
+            with transaction.atomic():
+                deltas = {}
+                for chunk in range(0, len(pks), MAX_QUERY_PARAMS):
+                    keys = pks[chunk:chunk + MAX_QUERY_PARAMS]
+                    counts = dict(model._default_manager.filter(**{
+                        '%s__in' % field.attname: keys}).values_list(
+                        field.attname).annotate(count=Count('pk')).order_by())
+                    # only the objects counted wrong are written
+                    for pk, value in manager.filter(pk__in=keys).values_list(
+                            'pk', counter_name):
+                        deltas[pk] = counts.get(pk, 0) - value
+                adjust(field, counter_name, deltas)
+            last = pks[-1]
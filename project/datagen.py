@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic data for benchmarks.
+
+:func:`generate` yields objects as ``dumpdata`` writes them, so they can be
+inserted in batches by :class:`project.loading.BulkLoader`. The same scale,
+seed and starting keys always give the same data:
+
+    >>> from collections import Counter
+    >>> objects = list(generate(scale=0.01, seed=1))
+    >>> sorted(Counter(obj['model'] for obj in objects).items())
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('project.country', 2), ('project.documentation', 5), ('project.organisation', 2),
+     ('project.organisationtown', 40), ('project.taggeditem', 20), ('project.town', 20)]
+    >>> objects == list(generate(scale=0.01, seed=1))
+    True
+    >>> objects == list(generate(scale=0.01, seed=2))
+    False
+
+Sister town links are listed from both ends:
+
+    >>> towns = dict((obj['pk'], obj) for obj in objects if obj['model'] == 'project.town')
+    >>> all(pk in towns[other]['fields']['sister_towns']
+    ...     for pk, town in towns.items() for other in town['fields']['sister_towns'])
+    True
+
+"""
+import datetime
+import random
+import zlib
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from .models import Country
+from .models import Documentation
+from .models import Organisation
+from .models import OrganisationTown
+from .models import TaggedItem
+from .models import Town
+
+
+# objects of each model at scale 1
+SIZES = [
+    (Country, 200),
+    (Documentation, 500),
+    (Organisation, 200),
+    (Town, 2000),
+    (OrganisationTown, 4000),
+    (TaggedItem, 2000),
+    ]
+
+# towns link to towns up to this many keys away
+SISTER_DISTANCES = (1, 3, 7)
+SISTER_CHANCE = 0.2
+DOCUMENTED_CHANCE = 0.1
+
+EPOCH = datetime.datetime(2012, 1, 1)
+DAYS = 3 * 365
+
+SYLLABLES = [
+    'ka', 'ri', 'to', 'wa', 'ne', 'mo', 'lu', 'bel', 'ham', 'ton', 'ford',
+    'ash', 'vil', 'port', 'ster', 'gen', 'dor', 'ma', 'pe', 'ru', 'sa', 'le',
+    ]
+
+WORDS = [
+    'river', 'council', 'rates', 'harbour', 'bridge', 'school', 'library',
+    'earthquake', 'flood', 'rebuild', 'insurance', 'report', 'budget',
+    'transport', 'water', 'power', 'housing', 'park', 'museum', 'festival',
+    'policy', 'planning', 'review', 'annual', 'district', 'regional',
+    'heritage', 'market', 'tourism', 'trade', 'agreement', 'exchange',
+    ]
+
+
+def sizes(scale):
+    return [(model, max(1, int(round(count * scale)))) for model, count in SIZES]
+
+
+def chance(seed, *key):
+    """
+    A number in [0, 1) fixed by ``seed`` and ``key``, the same from every
+    process and Python version.
+    """
+    text = ':'.join(str(part) for part in (seed,) + key)
+    return (zlib.crc32(text.encode('utf-8')) & 0xffffffff) / 4294967296.0
+
+
+def make_name(rng, number=None):
+    name = ''.join(rng.choice(SYLLABLES) for i in range(rng.randint(2, 4))).capitalize()
+    if number is not None:
+        name = '%s %s' % (name, number)
+    return name[:30]
+
+
+def make_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for i in range(words)).capitalize()
+
+
+def make_timestamps(rng):
+    created = EPOCH + datetime.timedelta(
+        days=rng.randrange(DAYS), seconds=rng.randrange(86400))
+    modified = created + datetime.timedelta(days=rng.randrange(30))
+    if settings.USE_TZ:
+        created = timezone.make_aware(created, timezone.utc)
+        modified = timezone.make_aware(modified, timezone.utc)
+    return {'created': created, 'modified': modified}
+
+
+def zipf_choice(rng, values):
+    # earlier values are picked far more often, as tags are in practice
+    weights = [1.0 / (rank + 1) for rank in range(len(values))]
+    point = rng.random() * sum(weights)
+    for value, weight in zip(values, weights):
+        point -= weight
+        if point < 0:
+            return value
+    return values[-1]
+
+
+def pick(rng, counts, first, model):
+    return first[model] + rng.randrange(counts[model])
+
+
+def documentation(rng, counts, first):
+    if rng.random() < DOCUMENTED_CHANCE:
+        return [pick(rng, counts, first, Documentation)]
+    return []
+
+
+def countries(rng, seed, counts, first):
+    for i in range(counts[Country]):
+        fields = {'name': make_name(rng), 'documentation': documentation(rng, counts, first)}
+        fields.update(make_timestamps(rng))
+        yield {'model': 'project.country', 'pk': first[Country] + i, 'fields': fields}
+
+
+def documentations(rng, seed, counts, first):
+    for i in range(counts[Documentation]):
+        fields = {
+            'name': make_text(rng, 2)[:30],
+            'body': make_text(rng, rng.randint(20, 80)),
+            }
+        fields.update(make_timestamps(rng))
+        yield {'model': 'project.documentation', 'pk': first[Documentation] + i,
+               'fields': fields}
+
+
+def organisations(rng, seed, counts, first):
+    for i in range(counts[Organisation]):
+        fields = {'name': make_name(rng, i), 'documentation': documentation(rng, counts, first)}
+        fields.update(make_timestamps(rng))
+        yield {'model': 'project.organisation', 'pk': first[Organisation] + i,
+               'fields': fields}
+
+
+def sister_towns(seed, towns, first, i):
+    sisters = []
+    for distance in SISTER_DISTANCES:
+        # each link is decided once for the pair so both ends agree
+        if i + distance < towns and chance(seed, 'sister', i, distance) < SISTER_CHANCE:
+            sisters.append(first + i + distance)
+        if i - distance >= 0 and chance(seed, 'sister', i - distance, distance) < SISTER_CHANCE:
+            sisters.append(first + i - distance)
+    return sorted(sisters)
+
+
+def towns(rng, seed, counts, first):
+    for i in range(counts[Town]):
+        fields = {
+            'name': make_name(rng),
+            'country': pick(rng, counts, first, Country),
+            'sister_towns': sister_towns(seed, counts[Town], first[Town], i),
+            'documentation': documentation(rng, counts, first),
+            }
+        fields.update(make_timestamps(rng))
+        yield {'model': 'project.town', 'pk': first[Town] + i, 'fields': fields}
+
+
+def organisation_towns(rng, seed, counts, first):
+    for i in range(counts[OrganisationTown]):
+        fields = {
+            'town': pick(rng, counts, first, Town),
+            'organisation': pick(rng, counts, first, Organisation),
+            'documentation': documentation(rng, counts, first),
+            }
+        fields.update(make_timestamps(rng))
+        fields['joined'] = fields['created'].date()
+        yield {'model': 'project.organisationtown', 'pk': first[OrganisationTown] + i,
+               'fields': fields}
+
+
+def tagged_items(rng, seed, counts, first):
+    tagged = [Town, Country, Organisation]
+    content_types = ContentType.objects.get_for_models(*tagged)
+    for i in range(counts[TaggedItem]):
+        model = zipf_choice(rng, tagged)
+        fields = {
+            'tag': zipf_choice(rng, WORDS),
+            'content_type': content_types[model].pk,
+            'object_id': pick(rng, counts, first, model),
+            }
+        fields.update(make_timestamps(rng))
+        yield {'model': 'project.taggeditem', 'pk': first[TaggedItem] + i, 'fields': fields}
+
+
+# in the order of their random draws, which the data of a seed depends on
+GENERATORS = [
+    countries,
+    documentations,
+    organisations,
+    towns,
+    organisation_towns,
+    tagged_items,
+    ]
+
+
+def generate(scale=1.0, seed=0, start=None):
+    """
+    Yield the serialized objects of a dataset ``scale`` times the size of
+    :data:`SIZES`. Keys of each model start at ``start[model]``, 1 by
+    default.
+    """
+    rng = random.Random(seed)
+    start = start or {}
+    counts = dict(sizes(scale))
+    first = dict((model, start.get(model, 1)) for model in counts)
+    for generator in GENERATORS:
+        for obj in generator(rng, seed, counts, first):
+            yield obj
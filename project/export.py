@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of admin changelists.
+
+Rows are read in chunks seeking on the primary key and written out as they
+are read, so memory use is flat and the first bytes are sent before the
+table has been read:
+
+    >>> from project.models import Country
+    >>> from project.models import Town
+    >>> usa = Country.objects.create(name='usa')
+    >>> for name in ['redmond', 'cupertino', 'twin peaks']:
+    ...     town = Town.objects.create(name=name, country=usa)
+    >>> columns = export_columns(Town)
+    >>> [name for name, path in columns]
+    ['id', 'created', 'modified', 'name', 'country', 'cluster']
+    >>> rows = iter_rows(Town.objects.filter(country=usa), columns, chunk_size=2)
+    >>> [row[3:5] for row in rows]
+    [('redmond', 'usa'), ('cupertino', 'usa'), ('twin peaks', 'usa')]
+    >>> lines = list(iter_csv(Town.objects.filter(country=usa), columns))
+    >>> lines[0], len(lines)
+    ('id,created,modified,name,country,cluster\\r\\n', 4)
+
+Clean up
+
+    >>> Town.objects.filter(country=usa).delete()
+    >>> usa.delete()
+
+"""
+import csv
+import json
+
+from django.conf.urls import patterns
+from django.conf.urls import url
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.views.main import ERROR_FLAG
+from django.core.exceptions import PermissionDenied
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.http import Http404
+from django.http import HttpResponseRedirect
+from django.http import StreamingHttpResponse
+from django.utils import six
+from django.utils.encoding import force_text
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    }
+
+
+def export_columns(model, exclude=('search_key',)):
+    """
+    ``(header, lookup)`` pairs of the concrete fields of ``model``. Foreign
+    keys to models with a ``name`` are exported as that name, joined in
+    the same query.
+    """
+    columns = []
+    for field in model._meta.concrete_fields:
+        if field.name in exclude:
+            continue
+        if field.rel:
+            names = [f.name for f in field.rel.to._meta.concrete_fields]
+            if 'name' in names:
+                columns.append((field.name, '%s__name' % field.name))
+                continue
+            columns.append((field.name, field.attname))
+        else:
+            columns.append((field.name, field.attname))
+    return columns
+
+
+def iter_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the ``columns`` of every row of ``queryset`` in primary key
+    order, one query per ``chunk_size`` rows.
+    """
+    # the key is fetched last to seek on, then dropped
+    lookups = [lookup for header, lookup in columns] + ['pk']
+    queryset = queryset.order_by('pk').values_list(*lookups)
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(chunk[:chunk_size])
+        for row in rows:
+            yield row[:-1]
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][-1]
+
+
+class Echo(object):
+    """
+    File like object handing back what the csv writer writes.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if six.PY2:
+        return force_text(value).encode('utf-8')
+    return force_text(value)
+
+
+def iter_csv(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, lookup in columns])
+    for row in iter_rows(queryset, columns, chunk_size):
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def iter_jsonl(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    headers = [header for header, lookup in columns]
+    for row in iter_rows(queryset, columns, chunk_size):
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'jsonl': iter_jsonl,
+    }
+
+
+class ExportChangeList(ChangeList):
+    """
+    ChangeList that only applies the filters and search, the rows are read
+    by the export.
+    """
+
+    def get_results(self, request):
+        pass
+
+
+class ExportMixin(object):
+    """
+    ModelAdmin mixin adding ``export/csv/`` and ``export/jsonl/`` views
+    that stream the rows matching the changelist's current filters and
+    search.
+    """
+    export_formats = ['csv', 'jsonl']
+    export_exclude = ['search_key']
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        urlpatterns = patterns(
+            '',
+            url(r'^export/(?P<format>\w+)/$',
+                self.admin_site.admin_view(self.export_view),
+                name='%s_%s_export' % info),
+            )
+        return urlpatterns + super(ExportMixin, self).get_urls()
+
+    def get_export_columns(self, request):
+        return export_columns(self.model, self.export_exclude)
+
+    def get_export_queryset(self, request):
+        list_display = self.get_list_display(request)
+        try:
+            cl = ExportChangeList(
+                request, self.model, list_display,
+                self.get_list_display_links(request, list_display),
+                self.get_list_filter(request), self.date_hierarchy,
+                self.get_search_fields(request), self.list_select_related,
+                self.list_per_page, self.list_max_show_all,
+                self.list_editable, self)
+        except IncorrectLookupParameters:
+            return None
+        return cl.queryset
+
+    def export_view(self, request, format):
+        if format not in self.export_formats:
+            raise Http404('Unknown export format %s.' % format)
+        if not self.has_change_permission(request, None):
+            raise PermissionDenied
+        queryset = self.get_export_queryset(request)
+        if queryset is None:
+            # back to the changelist, which shows the lookup error
+            info = self.model._meta.app_label, self.model._meta.model_name
+            return HttpResponseRedirect(reverse(
+                'admin:%s_%s_changelist' % info,
+                current_app=self.admin_site.name) + '?' + ERROR_FLAG + '=1')
+        response = StreamingHttpResponse(
+            WRITERS[format](queryset, self.get_export_columns(request)),
+            content_type=CONTENT_TYPES[format])
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            self.model._meta.model_name, format)
+        return response
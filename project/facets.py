@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Cached value counts of admin filter fields.
+
+The counts of a tracked field are read one page at a time, most common
+value first, and cached until an object of the model is written:
+
+    >>> import datetime
+    >>> from project.models import TestMe
+    >>> def testme(url, number):
+    ...     return TestMe.objects.create(
+    ...         test_ip='127.0.0.1', test_url=url, test_int=number,
+    ...         test_date=datetime.date(2015, 1, 1), test_char='x',
+    ...         test_time=datetime.time(12), test_slug='x', test_text='x',
+    ...         test_email='x@example.com', test_float=1, test_bigint=1,
+    ...         test_positive_integer=1, test_decimal=1,
+    ...         test_comma_separated_int='1', test_small_int=1,
+    ...         test_positive_small_int=1)
+    >>> objects = [testme('http://a.example.com', n) for n in (1, 2, 2, 3, 3, 3)]
+    >>> value_counts(TestMe, 'test_int', limit=2)
+    ([(3, 3), (2, 2)], True)
+    >>> value_counts(TestMe, 'test_int', offset=2, limit=2)
+    ([(1, 1)], False)
+
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     value_counts(TestMe, 'test_int', limit=2)
+    ([(3, 3), (2, 2)], True)
+    >>> len(queries)
+    0
+
+    >>> objects[0].delete()
+    >>> value_counts(TestMe, 'test_int', limit=2)
+    ([(3, 3), (2, 2)], False)
+
+Clean up
+
+    >>> TestMe.objects.filter(pk__in=[obj.pk for obj in objects]).delete()
+
+"""
+import hashlib
+
+from django.contrib.admin.views.main import EMPTY_CHANGELIST_VALUE
+from django.core.cache import caches
+from django.db.models import Count
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.utils.encoding import force_text
+
+from .bulk import post_bulk_create
+from .bulk import post_bulk_update
+from .cache import bump_generation
+from .cache import get_generation
+from .routers import use_primary
+
+
+# model -> names of the fields whose counts are cached
+TRACKED = {}
+
+# the counts of every process must be dropped together
+CACHE_ALIAS = 'shared'
+
+FACET_TIMEOUT = 3600
+
+# values listed in the changelist sidebar, the rest are fetched on demand
+FACET_LIMIT = 10
+
+FACET_MAX_LIMIT = 100
+
+# parameters of a page of values, the others are those of the changelist
+OFFSET_VAR = '_offset'
+LIMIT_VAR = '_limit'
+QUERY_VAR = '_q'
+
+
+def track(model, *field_names):
+    """
+    Cache the value counts of ``field_names`` of ``model``, dropped
+    whenever an object of ``model`` is saved or deleted.
+    """
+    TRACKED.setdefault(model, [])
+    TRACKED[model].extend(f for f in field_names if f not in TRACKED[model])
+    uid = 'facets.%s.%s' % (model._meta.app_label, model._meta.model_name)
+    post_save.connect(changed, sender=model, dispatch_uid=uid)
+    post_delete.connect(changed, sender=model, dispatch_uid=uid)
+    post_bulk_create.connect(changed, sender=model, dispatch_uid=uid)
+    post_bulk_update.connect(changed, sender=model, dispatch_uid=uid)
+
+
+def is_tracked(model, field_name):
+    return field_name in TRACKED.get(model, ())
+
+
+def generation_key(model):
+    return 'facets:generation:%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+def generation(model):
+    return get_generation(caches[CACHE_ALIAS], generation_key(model))
+
+
+def invalidate(model):
+    bump_generation(caches[CACHE_ALIAS], generation_key(model))
+
+
+def changed(sender, **kwargs):
+    invalidate(sender)
+
+
+def make_key(model, field_name, offset, limit, query):
+    digest = hashlib.md5((query or '').encode('utf-8')).hexdigest()
+    return 'facets:%s.%s:%s:%s:%s:%s:%s' % (
+        model._meta.app_label, model._meta.model_name, field_name,
+        generation(model), offset, limit, digest)
+
+
+def count_values(model, field_name, offset, limit, query):
+    qs = model._default_manager.all()
+    if query:
+        qs = qs.filter(**{'%s__icontains' % field_name: query})
+    rows = qs.values_list(field_name).annotate(
+        count=Count('pk')).order_by('-count', field_name)
+    # one more than asked tells whether there are more
+    return [tuple(row) for row in rows[offset:offset + limit + 1]]
+
+
+def value_counts(model, field_name, offset=0, limit=FACET_LIMIT, query=None):
+    """
+    ``([(value, count)], more)`` for ``limit`` values of ``field_name``
+    from ``offset`` on, most common first, optionally only the values
+    containing ``query``. Counts of untracked fields are not cached.
+    """
+    if is_tracked(model, field_name):
+        cache = caches[CACHE_ALIAS]
+        key = make_key(model, field_name, offset, limit, query)
+        rows = cache.get(key)
+        if rows is None:
+            with use_primary():
+                rows = count_values(model, field_name, offset, limit, query)
+            cache.set(key, rows, FACET_TIMEOUT)
+    else:
+        rows = count_values(model, field_name, offset, limit, query)
+    return rows[:limit], len(rows) > limit
+
+
+def display_value(field, value):
+    if value is None:
+        return EMPTY_CHANGELIST_VALUE
+    return force_text(dict(field.flatchoices).get(value, value))
+
+
+def lookup_params(field_path, value):
+    """
+    The changelist parameters selecting ``value`` of ``field_path``.
+    """
+    if value is None:
+        return {'%s__isnull' % field_path: 'True'}
+    return {field_path: force_text(value)}
+
+
+def page_params(params):
+    """
+    ``(offset, limit, query)`` of a request for a page of values.
+    """
+    try:
+        offset = max(0, int(params.get(OFFSET_VAR, 0)))
+    except ValueError:
+        offset = 0
+    try:
+        limit = max(1, min(int(params.get(LIMIT_VAR, FACET_LIMIT)), FACET_MAX_LIMIT))
+    except ValueError:
+        limit = FACET_LIMIT
+    return offset, limit, params.get(QUERY_VAR) or None
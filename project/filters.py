@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+from django.contrib.admin.filters import DateFieldListFilter
+from django.contrib.admin.filters import FieldListFilter
+from django.contrib.admin.filters import SimpleListFilter
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.urlresolvers import reverse
+from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _
+
+from . import facets
+from . import rollups
+from .tags import tag_counts
+
+
+def parse_day(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is not None:
+        return rollups.bucket_day(parsed)
+    return parse_date(value)
+
+
+class RollupDateFieldListFilter(DateFieldListFilter):
+    """
+    DateFieldListFilter whose links show the number of objects they select,
+    read from the day buckets of :mod:`project.rollups`. The counts are
+    left out when other filters or a search narrow the changelist.
+    """
+
+    def uses_rollups(self, cl):
+        if cl.query or not rollups.is_tracked(cl.model, self.field_path):
+            return False
+        return not [
+            k for k in cl.get_filters_params()
+            if not k.startswith(self.field_generic)]
+
+    def counts(self, cl):
+        """
+        Map link titles to counts with two queries: the total and the days
+        from the earliest bounded link on.
+        """
+        spans = {}
+        for title, params in self.links:
+            spans[title] = (
+                parse_day(params.get(self.lookup_kwarg_since)),
+                parse_day(params.get(self.lookup_kwarg_until)))
+        starts = [since for since, until in spans.values() if since is not None]
+        days = list(rollups.day_counts(
+            cl.model, self.field_path, min(starts) if starts else None))
+        counts = {}
+        for title, (since, until) in spans.items():
+            if since is None and until is None:
+                counts[title] = rollups.count_between(cl.model, self.field_path)
+            else:
+                counts[title] = sum(
+                    count for day, count in days
+                    if (since is None or day >= since) and (until is None or day < until))
+        return counts
+
+    def choices(self, cl):
+        counts = self.counts(cl) if self.uses_rollups(cl) else None
+        for choice in super(RollupDateFieldListFilter, self).choices(cl):
+            if counts is not None:
+                choice['display'] = '%s (%s)' % (
+                    choice['display'], counts[choice['display']])
+            yield choice
+
+
+class TagListFilter(SimpleListFilter):
+    """
+    Filter on the most used tags of the model, counted once and cached by
+    :func:`project.tags.tag_counts`.
+    """
+    title = 'tag'
+    parameter_name = 'tag'
+    limit = 20
+
+    def lookups(self, request, model_admin):
+        return [
+            (tag, '%s (%s)' % (tag, count))
+            for tag, count in tag_counts(model_admin.model, self.limit)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(tags__tag=self.value())
+        return queryset
+
+
+class FacetListFilter(FieldListFilter):
+    """
+    Filter on the most common values of a field with their counts, read
+    from the cache of :mod:`project.facets` rather than a distinct query
+    over the table. The other values are fetched a page at a time from the
+    ``facets/<field>/`` view of :class:`project.admin.FacetMixin`. Counts
+    are of the whole table, they are left out when other filters or a
+    search narrow the changelist.
+    """
+    template = 'project/facet_filter.html'
+    limit = facets.FACET_LIMIT
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = field_path
+        self.lookup_kwarg_isnull = '%s__isnull' % field_path
+        self.lookup_val = request.GET.get(self.lookup_kwarg)
+        self.lookup_val_isnull = request.GET.get(self.lookup_kwarg_isnull)
+        self.values, self.more = facets.value_counts(model, field_path, limit=self.limit)
+        self.more_url = reverse('%s:%s_%s_facets' % (
+            model_admin.admin_site.name, model._meta.app_label, model._meta.model_name),
+            args=[field_path]) if self.more else None
+        super(FacetListFilter, self).__init__(
+            field, request, params, model, model_admin, field_path)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg, self.lookup_kwarg_isnull]
+
+    def shows_counts(self, cl):
+        if cl.query:
+            return False
+        return not [
+            k for k in cl.get_filters_params() if k not in self.expected_parameters()]
+
+    def choices(self, cl):
+        counts = self.shows_counts(cl)
+        yield {
+            'selected': self.lookup_val is None and self.lookup_val_isnull is None,
+            'query_string': cl.get_query_string({}, self.expected_parameters()),
+            'display': _('All'),
+            }
+        values = list(self.values)
+        listed = set(force_text(value) for value, count in values if value is not None)
+        if self.lookup_val is not None and self.lookup_val not in listed:
+            # the selected value is shown even when not among the most common
+            values.append((self.lookup_val, None))
+        if self.lookup_val_isnull and None not in [value for value, count in values]:
+            values.append((None, None))
+        for value, count in values:
+            display = facets.display_value(self.field, value)
+            if counts and count is not None:
+                display = '%s (%s)' % (display, count)
+            if value is None:
+                selected = bool(self.lookup_val_isnull)
+            else:
+                selected = self.lookup_val == force_text(value)
+            yield {
+                'selected': selected,
+                'query_string': cl.get_query_string(
+                    facets.lookup_params(self.field_path, value),
+                    self.expected_parameters()),
+                'display': display,
+                }
+        if self.more_url:
+            yield {
+                'selected': False,
+                'query_string': '%s%s' % (self.more_url, cl.get_query_string(
+                    {facets.OFFSET_VAR: len(self.values)},
+                    self.expected_parameters() + [PAGE_VAR])),
+                'display': _('More'),
+                'more': True,
+                }
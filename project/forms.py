@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import ManyToOneRel
 from django.db.models import ManyToManyRel
 from django.contrib.admin.widgets import RelatedFieldWidgetWrapper
@@ -9,9 +11,223 @@ from django_autocomplete.widgets import AutocompleteSelectMultipleWidget
 from .models import Town
 from .models import Country
 from .models import Documentation
+from . import ranking
+from .relations import sync_m2m
+from .relations import sync_reverse_fk
 
 
-class CountryForm(forms.ModelForm):
+class DiffSaveModelForm(forms.ModelForm):
+    """
+    ModelForm whose many to many fields are saved by difference with
+    :func:`project.relations.sync_m2m` instead of being cleared and added
+    back, all inside one transaction.
+    """
+
+    def save(self, commit=True):
+        instance = super(DiffSaveModelForm, self).save(commit=False)
+        self.save_m2m = self._save_relations
+        if commit:
+            instance.save()
+            self.save_m2m()
+        return instance
+
+    def _save_relations(self):
+        with transaction.atomic():
+            self.save_relations()
+
+    def save_relations(self):
+        opts = self._meta
+        for f in self.instance._meta.many_to_many:
+            if opts.fields and f.name not in opts.fields:
+                continue
+            if opts.exclude and f.name in opts.exclude:
+                continue
+            if f.name not in self.cleaned_data:
+                continue
+            if f.rel.through._meta.auto_created:
+                sync_m2m(self.instance, f.name, self.cleaned_data[f.name])
+            else:
+                f.save_form_data(self.instance, self.cleaned_data[f.name])
+
+
+class RankedModelForm(DiffSaveModelForm):
+    """
+    Inline form of a row ordered by a sparse position. The row's place in
+    the list is posted as its position, the position stored is assigned by
+    :class:`RankedInlineFormSet` and the row only counts as changed when
+    that one changes.
+    """
+    rank_field = 'position'
+
+    def __init__(self, *args, **kwargs):
+        super(RankedModelForm, self).__init__(*args, **kwargs)
+        self.rank = getattr(self.instance, self.rank_field)
+        self.new_rank = None
+
+    @property
+    def changed_data(self):
+        changed = super(RankedModelForm, self).changed_data
+        if self.instance.pk is None:
+            return changed
+        changed = [name for name in changed if name != self.rank_field]
+        if self.new_rank is not None and self.new_rank != self.rank:
+            changed.append(self.rank_field)
+        return changed
+
+
+class RankedInlineFormSet(forms.BaseInlineFormSet):
+    """
+    Inline formset of rows ordered by a sparse position, see
+    :mod:`project.ranking`. Rows are shown numbered in order and, when
+    saved in a new order, only the rows out of place get a new position:
+
+        >>> import datetime
+        >>> from django.db import connection
+        >>> from django.forms.models import inlineformset_factory
+        >>> from django.test.utils import CaptureQueriesContext
+        >>> from project.bulk import save_formset
+        >>> from project.models import TestMe
+        >>> from project.models import TestSortable
+        >>> testme = TestMe.objects.create(
+        ...     test_ip='127.0.0.1', test_url='http://example.com', test_int=1,
+        ...     test_date=datetime.date(2015, 1, 1), test_char='x',
+        ...     test_time=datetime.time(12), test_slug='x', test_text='x',
+        ...     test_email='x@example.com', test_float=1, test_bigint=1,
+        ...     test_positive_integer=1, test_decimal=1,
+        ...     test_comma_separated_int='1', test_small_int=1,
+        ...     test_positive_small_int=1)
+        >>> rows = [TestSortable.objects.create(that=testme, position=position, test_char=char)
+        ...         for position, char in zip(ranking.spread(4), 'abcd')]
+        >>> FormSet = inlineformset_factory(
+        ...     TestMe, TestSortable, form=RankedModelForm, formset=RankedInlineFormSet,
+        ...     fields=['position', 'test_char'], extra=0)
+        >>> formset = FormSet(instance=testme)
+        >>> [form.initial['position'] for form in formset]
+        [1, 2, 3, 4]
+
+    The last row dragged to the top is the only one written:
+
+        >>> data = {'testsortable_set-TOTAL_FORMS': '4', 'testsortable_set-INITIAL_FORMS': '4'}
+        >>> for i, (row, number) in enumerate(zip(rows, [2, 3, 4, 1])):
+        ...     data['testsortable_set-%d-id' % i] = row.pk
+        ...     data['testsortable_set-%d-position' % i] = number
+        ...     data['testsortable_set-%d-test_char' % i] = row.test_char
+        >>> formset = FormSet(data, instance=testme)
+        >>> formset.is_valid()
+        True
+        >>> with CaptureQueriesContext(connection) as queries:
+        ...     save_formset(formset)
+        >>> len([query for query in queries if 'UPDATE' in query['sql']])
+        1
+        >>> [(row.test_char, row.position) for row in testme.testsortable_set.all()]
+        [('d', 512), ('a', 1024), ('b', 2048), ('c', 3072)]
+        >>> testme.delete()
+    """
+
+    def _construct_form(self, i, **kwargs):
+        form = super(RankedInlineFormSet, self)._construct_form(i, **kwargs)
+        if i < self.initial_form_count():
+            form.initial[form.rank_field] = i + 1
+        return form
+
+    def clean(self):
+        super(RankedInlineFormSet, self).clean()
+        if any(self.errors):
+            return
+        rows = [
+            form for form in self.forms
+            if form not in self.deleted_forms
+            and (form.instance.pk is not None or form.has_changed())]
+
+        def number(item):
+            index, form = item
+            value = form.cleaned_data.get(form.rank_field)
+            # rows without a number go last, in the order shown
+            return (value is None, value or 0, index)
+
+        rows = [form for index, form in sorted(enumerate(rows), key=number)]
+        ranks = ranking.assign([
+            form.rank if form.instance.pk is not None else None for form in rows])
+        for form, rank in zip(rows, ranks):
+            form.new_rank = rank
+            setattr(form.instance, form.rank_field, rank)
+
+
+class SelectedChoiceIterator(forms.models.ModelChoiceIterator):
+    """
+    Choices limited to the selected objects of the field.
+    """
+
+    def __iter__(self):
+        if not self.field.selected:
+            return
+        qs = self.queryset.filter(pk__in=self.field.selected)
+        for obj in qs:
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.field.selected)
+
+
+class SelectedModelMultipleChoiceField(forms.ModelMultipleChoiceField):
+    """
+    Multiple choice field for autocomplete widgets. Other choices are
+    fetched by the widget so only the currently selected objects are loaded
+    to render it, and submitted values are validated with one ``pk__in``
+    query that does not build model instances.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.selected = []
+        super(SelectedModelMultipleChoiceField, self).__init__(*args, **kwargs)
+
+    def _get_choices(self):
+        return SelectedChoiceIterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField._set_choices)
+
+    def set_selected(self, values):
+        """
+        Set the primary keys to render, silently dropping invalid values
+        which are reported by validation instead.
+        """
+        pk_field = self.queryset.model._meta.pk
+        selected = []
+        for value in values or []:
+            try:
+                selected.append(pk_field.to_python(value))
+            except ValidationError:
+                continue
+        self.selected = selected
+
+    def _check_values(self, value):
+        try:
+            value = frozenset(value)
+        except TypeError:
+            raise ValidationError(self.error_messages['list'], code='list')
+        pk_field = self.queryset.model._meta.pk
+        pks = set()
+        for pk in value:
+            try:
+                pks.add(pk_field.to_python(pk))
+            except ValidationError:
+                raise ValidationError(
+                    self.error_messages['invalid_pk_value'],
+                    code='invalid_pk_value',
+                    params={'pk': pk},
+                    )
+        found = set(self.queryset.filter(pk__in=pks).values_list('pk', flat=True))
+        for pk in value:
+            if pk_field.to_python(pk) not in found:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice',
+                    params={'value': pk},
+                    )
+        return self.queryset.filter(pk__in=found)
+
+
+class CountryForm(DiffSaveModelForm):
     """
     Mostly lifted from
     http://stackoverflow.com/questions/2216974/django-modelform-for-many-to-many-fields
@@ -19,12 +235,12 @@ class CountryForm(forms.ModelForm):
 
     name = forms.CharField()
     # Representing the many to many related field `town_set`
-    towns = forms.ModelMultipleChoiceField(
+    towns = SelectedModelMultipleChoiceField(
         queryset=Town.objects.all(),
         widget=AutocompleteSelectMultipleWidget,
         required=False,
         )
-    documentation = forms.ModelMultipleChoiceField(
+    documentation = SelectedModelMultipleChoiceField(
         queryset=Documentation.objects.all(),
         widget=AutocompleteSelectMultipleWidget,
         required=False,
@@ -41,9 +257,10 @@ class CountryForm(forms.ModelForm):
         if 'instance' in kwargs:
             initial = kwargs.setdefault('initial', {})
 
+            # documentation is read by model_to_dict with values_list
             if kwargs['instance']:
-                initial['towns'] = [t.pk for t in kwargs['instance'].town_set.all()]
-                initial['documentation'] = [t.pk for t in kwargs['instance'].documentation.all()]
+                initial['towns'] = list(
+                    kwargs['instance'].town_set.values_list('pk', flat=True))
 
         forms.ModelForm.__init__(self, *args, **kwargs)
 
@@ -58,10 +275,10 @@ class CountryForm(forms.ModelForm):
         self.fields['towns'].widget = RelatedFieldWidgetWrapper(
             self.fields['towns'].widget, rel, self.admin_site)
 
-    def save(self, commit=True):
-        instance = forms.ModelForm.save(self, False)
-        instance.save()
-        instance.town_set = self.cleaned_data['towns']
-        instance.documentation = self.cleaned_data['documentation']
-        self.save_m2m()
-        return instance
+        # render only what is selected, the submitted values when bound
+        for name in ('towns', 'documentation'):
+            self.fields[name].set_selected(self[name].value())
+
+    def save_relations(self):
+        super(CountryForm, self).save_relations()
+        sync_reverse_fk(self.instance, 'town_set', self.cleaned_data['towns'])
@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+Full text search over model documents.
+
+Each registered model gets an inverted index of the normalized words of a
+document built from its fields, kept up to date from model signals. On
+SQLite with FTS5 the index is an FTS5 table ranked with ``bm25()``, other
+databases store postings in :class:`project.models.SearchPosting` and rank
+them with BM25 in Python:
+
+    >>> from project.models import Documentation
+    >>> index = get_index(Documentation)
+    >>> docs = [Documentation.objects.create(name=name, body=body) for name, body in [
+    ...     ('Floods', u'River floods in Christchurch and the Avon'),
+    ...     ('Quakes', u'Christchurch earthquakes, liquefaction and more earthquakes'),
+    ...     ('Rates', u'Council rates for Wellington')]]
+    >>> [Documentation.objects.get(pk=pk).name for pk, score in index.search('christchurch earthquake')]
+    ['Quakes']
+    >>> [Documentation.objects.get(pk=pk).name for pk, score in index.search('CHRIST')]
+    ['Quakes', 'Floods']
+    >>> docs[2].body = u'Rates for Christchurch'
+    >>> docs[2].save()
+    >>> len(index.search('christchurch'))
+    3
+
+The FTS5 table is created once per connection, not on every query:
+
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     hits = index.search('christchurch')
+    >>> [query for query in queries if 'CREATE' in query['sql']]
+    []
+
+The admin search narrows a queryset to every match with a subquery:
+
+    >>> index.filter(Documentation.objects.order_by('name'), 'christ').count()
+    3
+    >>> [doc.name for doc in index.filter(Documentation.objects.order_by('name'), 'rates christ')]
+    ['Rates']
+
+The fallback index gives the same answers:
+
+    >>> fallback = FullTextIndex('documentation_fallback', Documentation, index.document,
+    ...                          backend=PostingsBackend)
+    >>> fallback.update_many(docs)
+    >>> [Documentation.objects.get(pk=pk).name for pk, score in fallback.search('earthquakes christ')]
+    ['Quakes']
+    >>> fallback.remove(docs[1].pk)
+    >>> fallback.search('earthquakes')
+    []
+    >>> [doc.name for doc in fallback.filter(Documentation.objects.order_by('name'), 'christ')]
+    ['Floods', 'Rates']
+
+Towns are indexed with the names of their country, organisations, tags and
+documentation, and indexed again when those change, not when another field
+of them is saved:
+
+    >>> import datetime
+    >>> from project.models import Country
+    >>> from project.models import Organisation
+    >>> from project.models import OrganisationTown
+    >>> from project.models import Town
+    >>> towns = get_index(Town)
+    >>> nz = Country.objects.create(name='New Zealand')
+    >>> town = Town.objects.create(name='Lyttelton', country=nz)
+    >>> town.tags.create(tag='harbour').tag
+    'harbour'
+    >>> org = Organisation.objects.create(name='Port Company')
+    >>> join = OrganisationTown.objects.create(
+    ...     town=town, organisation=org, joined=datetime.date(2014, 1, 1))
+    >>> town.documentation.add(docs[0])
+    >>> [[Town.objects.get(pk=pk).name for pk, score in towns.search(query)]
+    ...  for query in ['zealand', 'harbour port', 'floods']]
+    [['Lyttelton'], ['Lyttelton'], ['Lyttelton']]
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     nz.save()
+    >>> [query for query in queries if 'project_town' in query['sql']]
+    []
+    >>> nz.name = 'Aotearoa'
+    >>> nz.save()
+    >>> len(towns.search('zealand')), len(towns.search('aotearoa'))
+    (0, 1)
+    >>> join.delete()
+    >>> towns.search('port')
+    []
+
+Clean up
+
+    >>> town.delete()
+    >>> org.delete()
+    >>> nz.delete()
+    >>> fallback.clear()
+    >>> for doc in docs:
+    ...     doc.delete()
+    >>> index.search('christchurch')
+    []
+
+"""
+import math
+import re
+from collections import Counter
+from collections import defaultdict
+
+from django.db import DatabaseError
+from django.db import connections
+from django.db import router
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Avg
+from django.db.models import Count
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .bulk import MAX_QUERY_PARAMS
+from .bulk import post_bulk_create
+from .bulk import post_bulk_update
+from .managers import PREFIX_UPPER_BOUND
+from .models import SearchDocument
+from .models import SearchPosting
+from .text import normalize
+
+
+# model -> FullTextIndex
+INDEXES = {}
+
+SEARCH_LIMIT = 1000
+REBUILD_CHUNK_SIZE = 1000
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# BM25 parameters, as FTS5 uses
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """
+    The normalized words of ``text``.
+
+        >>> tokenize(u'Curaçao, the ISLAND')
+        ['curacao', 'the', 'island']
+
+    """
+    return WORD_RE.findall(normalize(text or ''))
+
+
+def chunks(values, size=MAX_QUERY_PARAMS):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class PostingsBackend(object):
+    """
+    Inverted index stored in database tables and ranked in Python, for any
+    database.
+    """
+
+    def __init__(self, name, using):
+        self.name = name
+        self.using = using
+
+    def replace(self, documents):
+        """
+        Index ``documents``, ``(pk, words)`` pairs, in place of what was
+        indexed for those keys.
+        """
+        documents = list(documents)
+        self.remove([pk for pk, words in documents])
+        postings = []
+        lengths = []
+        for pk, words in documents:
+            lengths.append(SearchDocument(index=self.name, object_id=pk, length=len(words)))
+            postings.extend(
+                SearchPosting(index=self.name, term=term[:100], object_id=pk, frequency=count)
+                for term, count in Counter(words).items())
+        SearchDocument.objects.using(self.using).bulk_create(lengths)
+        SearchPosting.objects.using(self.using).bulk_create(postings)
+
+    def remove(self, pks):
+        for chunk in chunks(pks):
+            SearchPosting.objects.using(self.using).filter(
+                index=self.name, object_id__in=chunk).delete()
+            SearchDocument.objects.using(self.using).filter(
+                index=self.name, object_id__in=chunk).delete()
+
+    def clear(self):
+        SearchPosting.objects.using(self.using).filter(index=self.name).delete()
+        SearchDocument.objects.using(self.using).filter(index=self.name).delete()
+
+    def matching(self, word, prefix):
+        qs = SearchPosting.objects.using(self.using).filter(index=self.name)
+        if prefix:
+            return qs.filter(term__gte=word, term__lt=word + PREFIX_UPPER_BOUND)
+        return qs.filter(term=word)
+
+    def postings(self, word, prefix):
+        matches = defaultdict(int)
+        qs = self.matching(word, prefix)
+        for object_id, frequency in qs.values_list('object_id', 'frequency'):
+            matches[object_id] += frequency
+        return matches
+
+    def search(self, words, prefix, limit):
+        documents = SearchDocument.objects.using(self.using).filter(index=self.name)
+        stats = documents.aggregate(count=Count('pk'), length=Avg('length'))
+        if not stats['count']:
+            return []
+        total = stats['count']
+        average = stats['length'] or 1
+
+        matches = []
+        candidates = None
+        for i, word in enumerate(words):
+            found = self.postings(word, prefix and i == len(words) - 1)
+            matches.append(found)
+            candidates = set(found) if candidates is None else candidates & set(found)
+            if not candidates:
+                return []
+
+        lengths = {}
+        for chunk in chunks(candidates):
+            lengths.update(documents.filter(object_id__in=chunk).values_list(
+                'object_id', 'length'))
+        scores = defaultdict(float)
+        for found in matches:
+            idf = math.log(1 + (total - len(found) + 0.5) / (len(found) + 0.5))
+            for pk in candidates:
+                tf = found[pk]
+                norm = 1 - B + B * lengths.get(pk, average) / average
+                scores[pk] += idf * tf * (K1 + 1) / (tf + K1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+    def filter(self, queryset, words, prefix):
+        for i, word in enumerate(words):
+            postings = self.matching(word, prefix and i == len(words) - 1)
+            queryset = queryset.filter(pk__in=postings.values('object_id'))
+        return queryset
+
+
+class FTS5Backend(object):
+    """
+    SQLite FTS5 table holding the normalized words of every document with
+    the object's key as rowid.
+    """
+
+    def __init__(self, name, using):
+        self.name = name
+        self.using = using
+        self.table = 'project_fts_%s' % name
+
+    @classmethod
+    def available(cls, using):
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return False
+        try:
+            with transaction.atomic(using=using):
+                connection.cursor().execute(
+                    'CREATE VIRTUAL TABLE temp.project_fts_probe USING fts5(document)')
+                connection.cursor().execute('DROP TABLE temp.project_fts_probe')
+        except DatabaseError:
+            return False
+        return True
+
+    def create_table(self):
+        # created on demand, the table is not known to migrations, once per
+        # connection: forget_fts_tables resets the ones a new connection saw
+        connection = connections[self.using]
+        connection.ensure_connection()
+        created = connection.__dict__.setdefault('fts_tables', set())
+        if self.table not in created:
+            connection.cursor().execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(document)' % self.table)
+            created.add(self.table)
+
+    def cursor(self):
+        self.create_table()
+        return connections[self.using].cursor()
+
+    def replace(self, documents):
+        documents = list(documents)
+        self.remove([pk for pk, words in documents])
+        self.cursor().executemany(
+            'INSERT INTO %s (rowid, document) VALUES (%%s, %%s)' % self.table,
+            [(pk, ' '.join(words)) for pk, words in documents])
+
+    def remove(self, pks):
+        cursor = self.cursor()
+        for chunk in chunks(pks):
+            cursor.execute('DELETE FROM %s WHERE rowid IN (%s)' % (
+                self.table, ', '.join(['%s'] * len(chunk))), chunk)
+
+    def clear(self):
+        self.cursor().execute('DELETE FROM %s' % self.table)
+
+    def search(self, words, prefix, limit):
+        terms = ['"%s"' % word for word in words]
+        if prefix:
+            terms[-1] += '*'
+        cursor = self.cursor()
+        cursor.execute(
+            'SELECT rowid, -bm25(%s) FROM %s WHERE %s MATCH %%s '
+            'ORDER BY bm25(%s), rowid LIMIT %%s' % (
+                self.table, self.table, self.table, self.table),
+            [' '.join(terms), limit])
+        return cursor.fetchall()
+
+    def filter(self, queryset, words, prefix):
+        terms = ['"%s"' % word for word in words]
+        if prefix:
+            terms[-1] += '*'
+        self.create_table()
+        opts = queryset.model._meta
+        qn = connections[self.using].ops.quote_name
+        return queryset.extra(
+            where=['%s.%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+                qn(opts.db_table), qn(opts.pk.column), self.table, self.table)],
+            params=[' '.join(terms)])
+
+
+class FullTextIndex(object):
+    """
+    Inverted index of the text ``document(obj)`` returns for each object of
+    ``model``. The backend is FTS5 where the database has it.
+
+    Documents drawn from related objects can be given ``prepare``, called
+    with the objects to index and returning the ones to build documents
+    from, typically fresh copies with their relations prefetched.
+    """
+
+    def __init__(self, name, model, document, backend=None, prepare=None):
+        self.name = name
+        self.model = model
+        self.document = document
+        self.backend_class = backend
+        self.prepare = prepare
+        self.backends = {}
+
+    def backend(self, using=None):
+        using = using or router.db_for_write(self.model)
+        if using not in self.backends:
+            backend_class = self.backend_class
+            if backend_class is None:
+                backend_class = FTS5Backend if FTS5Backend.available(using) else PostingsBackend
+            self.backends[using] = backend_class(self.name, using)
+        return self.backends[using]
+
+    def update(self, obj):
+        self.update_many([obj])
+
+    def update_many(self, objs):
+        objs = [obj for obj in objs if obj.pk is not None]
+        if objs and self.prepare is not None:
+            objs = self.prepare(objs)
+        if objs:
+            self.backend().replace(
+                (obj.pk, tokenize(self.document(obj))) for obj in objs)
+
+    def reindex(self, pks):
+        """
+        Index again the objects with keys ``pks``, for changes to the
+        related objects their documents are drawn from.
+        """
+        pks = set(pk for pk in pks if pk is not None)
+        for chunk in chunks(sorted(pks)):
+            objs = list(self.model._default_manager.filter(pk__in=chunk))
+            missing = set(chunk) - set(obj.pk for obj in objs)
+            if missing:
+                self.backend().remove(sorted(missing))
+            self.update_many(objs)
+
+    def remove(self, pk):
+        self.backend().remove([pk])
+
+    def clear(self):
+        self.backend().clear()
+
+    def rebuild(self):
+        """
+        Index every object again, reading the table in chunks.
+        """
+        self.clear()
+        manager = self.model._default_manager
+        last = None
+        while True:
+            qs = manager.order_by('pk')
+            if last is not None:
+                qs = qs.filter(pk__gt=last)
+            objs = list(qs[:REBUILD_CHUNK_SIZE])
+            if not objs:
+                break
+            self.update_many(objs)
+            last = objs[-1].pk
+
+    def search(self, query, limit=SEARCH_LIMIT, prefix=True):
+        """
+        ``(pk, score)`` pairs of the objects holding every word of
+        ``query``, best first. With ``prefix`` the last word may be
+        incomplete.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        return self.backend(router.db_for_read(self.model)).search(words, prefix, limit)
+
+    def filter(self, queryset, query, limit=None, prefix=True):
+        """
+        Narrow ``queryset`` to the best ``limit`` matches of ``query``, or
+        without ``limit`` to every match with a subquery on the index.
+        """
+        if limit is not None:
+            return queryset.filter(pk__in=[
+                pk for pk, score in self.search(query, limit, prefix)])
+        words = tokenize(query)
+        if not words:
+            return queryset.none()
+        backend = self.backend(router.db_for_read(self.model))
+        return backend.filter(queryset, words, prefix)
+
+
+@receiver(connection_created)
+def forget_fts_tables(sender, connection, **kwargs):
+    connection.fts_tables = set()
+
+
+def get_index(model):
+    return INDEXES.get(model)
+
+
+def register(model, document, name=None, prepare=None):
+    """
+    Keep a :class:`FullTextIndex` of ``document(obj)`` for ``model``.
+    """
+    index = FullTextIndex(name or model._meta.model_name, model, document,
+                          prepare=prepare)
+    INDEXES[model] = index
+    uid = 'fulltext.%s.%s' % (model._meta.app_label, model._meta.model_name)
+    post_save.connect(saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, dispatch_uid=uid)
+    post_bulk_create.connect(bulk_saved, sender=model, dispatch_uid=uid)
+    post_bulk_update.connect(bulk_saved, sender=model, dispatch_uid=uid)
+    return index
+
+
+def saved(sender, instance, raw=False, **kwargs):
+    INDEXES[sender].update(instance)
+
+
+def deleted(sender, instance, **kwargs):
+    INDEXES[sender].remove(instance.pk)
+
+
+def bulk_saved(sender, instances, **kwargs):
+    INDEXES[sender].update_many(instances)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Per view latency and SQL statistics, cheap enough to leave on in
+production.
+
+:class:`InstrumentationMiddleware` times each request and, through the
+cursor wrapper installed on every database connection, counts its queries,
+their total time and the slowest of them. Requests are grouped by resolved
+view into bucketed histograms that are logged as JSON and started afresh
+every ``FLUSH_INTERVAL`` seconds.
+
+Statements are grouped by fingerprint, their text without literals:
+
+    >>> fingerprint("SELECT * FROM town WHERE name = 'Ashford' AND id IN (1, 2, 3)")
+    'SELECT * FROM town WHERE name = ? AND id IN (...)'
+
+Queries run inside :func:`recording` are counted:
+
+    >>> from django.db import connection
+    >>> from project.models import Town
+    >>> install(connection)
+    >>> with recording() as stats:
+    ...     Town.objects.filter(name__in=['Ashford', 'Ashby']).count()
+    0
+    >>> stats.queries
+    1
+    >>> stats.slowest_fingerprint()
+    'SELECT COUNT(*) FROM "project_town" WHERE "project_town"."name" IN (...)'
+
+The project settings log each flushed window at INFO:
+
+    >>> import logging.config
+    >>> from project.settings import LOGGING
+    >>> logging.config.dictConfig(LOGGING)
+    >>> records = []
+    >>> handler = logging.Handler()
+    >>> handler.emit = records.append
+    >>> logger.handlers = [handler]
+    >>> registry = Registry(interval=60)
+    >>> registry.add('project.views.autocomplete', 0.004, stats, 200)
+    >>> data = registry.flush()
+    >>> [(record.levelname, sorted(json.loads(record.getMessage())['views']))
+    ...  for record in records]
+    [('INFO', ['project.views.autocomplete'])]
+    >>> logger.handlers = []
+
+"""
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.backends.utils import CursorWrapper
+
+
+logger = logging.getLogger('project.instrumentation')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 60,
+    }
+
+# upper bounds of the histogram buckets, the last bucket is unbounded
+MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+SELECT_LIST_RE = re.compile(r'^SELECT (?:DISTINCT )?.+? FROM ', re.IGNORECASE)
+
+_local = threading.local()
+
+
+def fingerprint(sql):
+    """
+    ``sql`` with literals replaced by ``?``, ``IN`` lists collapsed and
+    long select lists elided, so that statements differing only in their
+    values look the same.
+    """
+    sql = sql.replace('%s', '?')
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    if len(sql) > 200:
+        sql = SELECT_LIST_RE.sub(lambda m: 'SELECT ... FROM ', sql, count=1)
+    return sql
+
+
+class Histogram(object):
+    """
+    Counts of values in fixed buckets, from which quantiles are estimated
+    as bucket upper bounds.
+
+        >>> histogram = Histogram(MS_BUCKETS)
+        >>> for value in [0.5, 3, 4, 7, 40]:
+        ...     histogram.add(value)
+        >>> histogram.count, histogram.quantile(0.5), histogram.quantile(0.99)
+        (5, 5, 50)
+
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def add(self, value):
+        i = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 3),
+            'buckets': dict(
+                ('le_%s' % bound if i < len(self.bounds) else 'inf', count)
+                for i, (bound, count) in enumerate(
+                    zip(self.bounds + (None,), self.counts)) if count),
+            }
+
+
+class RequestStats(object):
+    """
+    Queries of the request being handled by this thread.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+
+    def add(self, sql, duration):
+        self.queries += 1
+        self.sql_time += duration
+        if duration >= self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_sql = sql
+
+    def slowest_fingerprint(self):
+        # fingerprinted once per request rather than once per query
+        if self.slowest_sql is None:
+            return None
+        return fingerprint(self.slowest_sql)
+
+
+class TimedCursorWrapper(CursorWrapper):
+    """
+    Cursor adding the time of each statement to ``stats``.
+    """
+
+    def __init__(self, cursor, db, stats):
+        super(TimedCursorWrapper, self).__init__(cursor, db)
+        self.stats = stats
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            self.stats.add(sql, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.stats.add(sql, time.time() - started)
+
+
+def install(connection):
+    """
+    Time the statements run on ``connection`` while a request is recorded,
+    cursors are left alone otherwise.
+    """
+    if getattr(connection, '_instrumented', False):
+        return
+    cursor = connection.cursor
+
+    def timed_cursor():
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return cursor()
+        # wraps the debug cursor too, connection.queries keeps working
+        return TimedCursorWrapper(cursor(), connection, stats)
+
+    connection.cursor = timed_cursor
+    connection._instrumented = True
+
+
+def install_receiver(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def recording():
+    """
+    Record the queries run by this thread inside the block.
+    """
+    previous = getattr(_local, 'stats', None)
+    _local.stats = stats = RequestStats()
+    try:
+        yield stats
+    finally:
+        _local.stats = previous
+
+
+class ViewStats(object):
+
+    def __init__(self):
+        self.latency = Histogram(MS_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_time = Histogram(MS_BUCKETS)
+        self.errors = 0
+        self.slowest_ms = 0.0
+        self.slowest_fingerprint = None
+
+    def add(self, latency, stats, status):
+        self.latency.add(latency * 1000)
+        self.queries.add(stats.queries)
+        self.sql_time.add(stats.sql_time * 1000)
+        if status >= 500:
+            self.errors += 1
+        if stats.slowest_sql is not None and stats.slowest_time * 1000 >= self.slowest_ms:
+            self.slowest_ms = stats.slowest_time * 1000
+            self.slowest_fingerprint = stats.slowest_fingerprint()
+
+    def as_dict(self):
+        return {
+            'latency_ms': self.latency.as_dict(),
+            'queries': self.queries.as_dict(),
+            'sql_ms': self.sql_time.as_dict(),
+            'errors': self.errors,
+            'slowest_statement': {
+                'ms': round(self.slowest_ms, 3),
+                'fingerprint': self.slowest_fingerprint,
+                },
+            }
+
+
+class Registry(object):
+    """
+    Statistics of each view in this process since the last flush, which
+    happens every ``interval`` seconds.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.views = {}
+        self.started = time.time()
+        self.last = None
+
+    def add(self, view, latency, stats, status):
+        with self.lock:
+            if view not in self.views:
+                self.views[view] = ViewStats()
+            self.views[view].add(latency, stats, status)
+            due = time.time() - self.started >= self.interval
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'started': self.started,
+                'seconds': round(time.time() - self.started, 3),
+                'views': dict(
+                    (view, stats.as_dict()) for view, stats in self.views.items()),
+                }
+
+    def flush(self):
+        """
+        Log the current window as JSON and start a new one.
+        """
+        data = self.snapshot()
+        with self.lock:
+            self.views = {}
+            self.started = time.time()
+            self.last = data
+        if data['views']:
+            logger.info(json.dumps(data, sort_keys=True))
+        return data
+
+    def as_dict(self):
+        return {'current': self.snapshot(), 'last': self.last}
+
+
+_registry = None
+
+
+def get_registry():
+    """
+    Return the process wide registry configured by the ``INSTRUMENTATION``
+    setting.
+    """
+    global _registry
+    if _registry is None:
+        options = dict(DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {}))
+        _registry = Registry(options['FLUSH_INTERVAL'])
+    return _registry
+
+
+def enabled():
+    return dict(DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {}))['ENABLED']
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    if match.url_name:
+        return match.view_name
+    func = match.func
+    return '%s.%s' % (func.__module__, getattr(func, '__name__', func.__class__.__name__))
+
+
+class InstrumentationMiddleware(object):
+    """
+    Record latency and SQL statistics of every request by resolved view,
+    unresolved requests are grouped under ``<unresolved>``.
+    """
+
+    def __init__(self):
+        self.enabled = enabled()
+        if self.enabled:
+            connection_created.connect(install_receiver, dispatch_uid='instrumentation')
+            for connection in connections.all():
+                install(connection)
+
+    def process_request(self, request):
+        if self.enabled:
+            _local.stats = RequestStats()
+
+    def process_response(self, request, response):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return response
+        _local.stats = None
+        latency = time.time() - stats.started
+        view = view_name(request) or '<unresolved>'
+        get_registry().add(view, latency, stats, response.status_code)
+        return response
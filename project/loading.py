@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming bulk loading of fixtures.
+
+Fixtures are read one object at a time, from a JSON array as ``dumpdata``
+writes it or from JSON lines, so memory use does not grow with the size of
+the fixture:
+
+    >>> import io
+    >>> stream = io.StringIO(
+    ...     u'[{"model": "project.country", "pk": 1, "fields": {}},'
+    ...     u' {"model": "project.town", "pk": 2, "fields": {}}]')
+    >>> [d['pk'] for d in iter_json(stream, chunk_size=8)]
+    [1, 2]
+    >>> stream = io.StringIO(u'{"pk": 1}\\n\\n{"pk": 2}\\n')
+    >>> [d['pk'] for d in iter_jsonl(stream)]
+    [1, 2]
+
+Objects are buffered per model and inserted in batches with the raw field
+values, foreign key targets before the models pointing at them and many to
+many rows after both of their ends:
+
+    >>> from project.models import Country
+    >>> from project.models import Town
+    >>> loader = BulkLoader(batch_size=2)
+    >>> loader.load([
+    ...     {'model': 'project.town', 'pk': 901,
+    ...      'fields': {'name': 'Springfield', 'country': 901, 'sister_towns': [902]}},
+    ...     {'model': 'project.town', 'pk': 902,
+    ...      'fields': {'name': 'Shelbyville', 'country': 901, 'sister_towns': [901]}},
+    ...     {'model': 'project.country', 'pk': 901, 'fields': {'name': 'USA'}},
+    ... ])
+    >>> loader.finish()
+    >>> loader.objects, loader.links
+    (3, 2)
+    >>> town = Town.objects.get(pk=901)
+    >>> town.country, town.search_key, town.sister_towns.all()
+    (<Country: USA>, 'springfield', [<Town: Shelbyville>])
+
+Clean up
+
+    >>> Town.objects.filter(pk__in=[901, 902]).delete()
+    >>> Country.objects.filter(pk=901).delete()
+
+"""
+import gzip
+import io
+import json
+import time
+from collections import Counter
+from collections import OrderedDict
+
+from django.core.management.color import no_style
+from django.core.serializers import python
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db.models import AutoField
+
+from .bulk import post_bulk_create
+from .cache import get_cache
+from .models import Base
+from .models import TaggedItem
+from .models import Town
+from .models import update_search_key
+from . import clusters
+from . import counters
+from . import facets
+from . import fulltext
+from . import rollups
+from . import tags
+
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def next_element(decoder, buf, pos, started, eof):
+    """
+    ``(kind, element, pos)`` for what follows ``pos`` in ``buf``: ``start``
+    for the opening bracket, ``end`` for the closing one, ``element`` for
+    an element of the array and ``more`` when more of the stream is needed.
+    """
+    while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+        pos += 1
+    if pos == len(buf):
+        if eof:
+            raise ValueError("Unexpected end of the JSON fixture.")
+        return 'more', None, pos
+    if not started:
+        if buf[pos] != '[':
+            raise ValueError("A JSON fixture must hold an array.")
+        return 'start', None, pos + 1
+    if buf[pos] == ']':
+        return 'end', None, pos
+    try:
+        element, end = decoder.raw_decode(buf, pos)
+    except ValueError:
+        if eof:
+            raise
+        return 'more', None, pos
+    return 'element', element, end
+
+
+def iter_json(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of the JSON array in ``stream`` one by one.
+    """
+    decoder = json.JSONDecoder()
+    buf = u''
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        kind, element, pos = next_element(decoder, buf, pos, started, eof)
+        if kind == 'start':
+            started = True
+        elif kind == 'end':
+            return
+        elif kind == 'element':
+            yield element
+        else:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def iter_jsonl(stream):
+    """
+    Yield the JSON objects of ``stream``, one per line.
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def fixture_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith('.jsonl') else 'json'
+
+
+def read_fixture(path, format=None):
+    """
+    Yield the serialized objects of the fixture at ``path``, which may be
+    gzipped. The format is taken from the extension unless given.
+    """
+    format = format or fixture_format(path)
+    if path.endswith('.gz'):
+        stream = io.TextIOWrapper(gzip.open(path), encoding='utf-8')
+    else:
+        stream = io.open(path, encoding='utf-8')
+    with stream:
+        if format == 'jsonl':
+            for obj in iter_jsonl(stream):
+                yield obj
+        else:
+            for obj in iter_json(stream):
+                yield obj
+
+
+def dependency_order(models):
+    """
+    Order ``models`` so that every model follows the models its foreign
+    keys point at.
+    """
+    ordered = []
+    seen = set()
+
+    def visit(model):
+        if model in seen:
+            return
+        seen.add(model)
+        for field in model._meta.local_concrete_fields:
+            if field.rel and field.rel.to in models and field.rel.to is not model:
+                visit(field.rel.to)
+        ordered.append(model)
+
+    for model in models:
+        visit(model)
+    return ordered
+
+
+class BulkLoader(object):
+    """
+    Insert deserialized fixture objects in batches of at most
+    ``batch_size`` rows, holding no more than that in memory.
+
+    Objects are inserted with their raw values as ``loaddata`` saves them,
+    so primary keys and timestamps are kept, and the tables are expected
+    not to hold those keys yet. Many to many rows are inserted as listed,
+    ``dumpdata`` writes both directions of symmetrical relations.
+    :data:`project.bulk.post_bulk_create` is sent for every batch unless
+    ``send_signals`` is false, then :func:`rebuild_derived` should be run
+    once the load is done.
+
+    Foreign keys may point forward in the fixture, run the load in a
+    transaction with constraint checks disabled and :meth:`finish` checks
+    them once at the end.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=BATCH_SIZE, progress=None,
+                 send_signals=True):
+        self.using = using
+        self.batch_size = batch_size
+        self.progress = progress
+        self.send_signals = send_signals
+        self.pending = OrderedDict()
+        self.pending_count = 0
+        self.counts = Counter()
+        self.objects = 0
+        self.links = 0
+        self.started = time.time()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.started
+        return (self.objects + self.links) / elapsed if elapsed else 0
+
+    def load(self, objects):
+        """
+        Add the serialized ``objects`` (dictionaries as ``dumpdata``
+        writes them), inserting whenever a batch is full.
+        """
+        for deserialized in python.Deserializer(objects, using=self.using):
+            self.add(deserialized)
+
+    def add(self, deserialized):
+        obj = deserialized.object
+        model = obj.__class__
+        if isinstance(obj, Base):
+            update_search_key(model, obj)
+        if obj.pk is None and any(deserialized.m2m_data.values()):
+            # the relation rows need the key, which bulk inserts do not return
+            self.insert_one(model, obj)
+        self.pending.setdefault(model, []).append(obj)
+        self.pending_count += 1
+        for name, pks in deserialized.m2m_data.items():
+            field = model._meta.get_field(name)
+            through = field.rel.through
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            self.pending.setdefault(through, []).extend(
+                through(**{source: obj.pk, target: pk}) for pk in pks)
+            self.pending_count += len(pks)
+        if self.pending_count >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for model in dependency_order(list(self.pending)):
+            objs = self.pending.pop(model)
+            self.insert(model, objs)
+            self.counts[model] += len(objs)
+            if model._meta.auto_created:
+                self.links += len(objs)
+            else:
+                self.objects += len(objs)
+                if self.send_signals:
+                    post_bulk_create.send(sender=model, instances=objs, using=self.using)
+        self.pending_count = 0
+        if self.progress is not None:
+            self.progress(self)
+
+    def fill_timestamps(self, model, objs):
+        # timestamps missing from hand written fixtures
+        for field in model._meta.local_concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                for obj in objs:
+                    if getattr(obj, field.attname) is None:
+                        field.pre_save(obj, True)
+
+    def insert_one(self, model, obj):
+        self.fill_timestamps(model, [obj])
+        fields = [f for f in model._meta.local_concrete_fields if not isinstance(f, AutoField)]
+        obj.pk = model._base_manager.using(self.using)._insert(
+            [obj], fields=fields, return_id=True, raw=True, using=self.using)
+        obj._bulk_inserted = True
+
+    def insert(self, model, objs):
+        connection = connections[self.using]
+        manager = model._base_manager.using(self.using)
+        fields = model._meta.local_concrete_fields
+        objs = [obj for obj in objs if not getattr(obj, '_bulk_inserted', False)]
+        self.fill_timestamps(model, objs)
+        with_pk = [obj for obj in objs if obj.pk is not None]
+        without_pk = [obj for obj in objs if obj.pk is None]
+        for group, group_fields in (
+                (with_pk, fields),
+                (without_pk, [f for f in fields if not isinstance(f, AutoField)])):
+            size = max(connection.ops.bulk_batch_size(group_fields, group), 1)
+            for start in range(0, len(group), size):
+                manager._insert(
+                    group[start:start + size], fields=group_fields, raw=True,
+                    using=self.using)
+
+    def finish(self):
+        """
+        Insert what is left, check the foreign keys of the loaded tables
+        and move their sequences past the loaded keys.
+        """
+        self.flush()
+        connection = connections[self.using]
+        models = list(self.counts)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in models])
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            cursor = connection.cursor()
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def rebuild_derived(models):
+    """
+    Recompute, from the tables, what the receivers of
+    :data:`project.bulk.post_bulk_create` maintain for the loaded
+    ``models``, after a load that sent no signals.
+    """
+    if not models:
+        return
+    if Town.sister_towns.through in models:
+        clusters.rebuild()
+    for target in counters.targets(*models):
+        counters.rebuild(target)
+    for model in models:
+        if model in rollups.TRACKED:
+            rollups.rebuild(model)
+        if facets.TRACKED.get(model):
+            facets.invalidate(model)
+        if issubclass(model, Base):
+            get_cache().invalidate(model.autocomplete.name)
+    if TaggedItem in models:
+        tags.invalidate_tag_counts()
+    # documents draw from the names of related objects of any model
+    for index in fulltext.INDEXES.values():
+        index.rebuild()
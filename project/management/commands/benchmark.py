@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from project import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Time the admin changelist, search, change form and save paths "
+            "and the autocomplete API, write the results as JSON and compare "
+            "them with a baseline. Saves write to the database, run it "
+            "against generated data.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=benchmark.REPEAT,
+                    help='Times each path is requested.'),
+        make_option('--output', default='benchmark.json',
+                    help='File the results are written to.'),
+        make_option('--baseline',
+                    help='Results of an earlier run to compare with.'),
+        make_option('--tolerance', type='float', default=benchmark.TOLERANCE,
+                    help='Allowed growth of the median time, 0.25 is 25%.'),
+    )
+
+    def handle(self, *args, **options):
+        results = benchmark.Benchmark(repeat=options.get('repeat')).run()
+        with open(options.get('output'), 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+
+        for name, result in results['results'].items():
+            self.stdout.write('%-40s %8.1f ms %4d queries  %s' % (
+                name, result['median_ms'], result['median_queries'], result['status']))
+
+        if options.get('baseline'):
+            with open(options.get('baseline')) as baseline:
+                regressions = benchmark.compare(
+                    results, json.load(baseline), options.get('tolerance'))
+            if regressions:
+                raise CommandError('Regressions against %s:\n%s' % (
+                    options.get('baseline'), '\n'.join(regressions)))
+            self.stdout.write('No regressions against %s' % options.get('baseline'))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db import transaction
+from django.db.models import Max
+
+from project import clusters
+from project import fulltext
+from project import datagen
+from project import loading
+
+
+class Command(BaseCommand):
+    help = ("Add a deterministic synthetic dataset of countries, towns, "
+            "organisations, joins, tags and documentation.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--scale', type='float', default=1.0,
+                    help='Size relative to %s.' % ', '.join(
+                        '%d %s' % (count, model._meta.verbose_name_plural)
+                        for model, count in datagen.SIZES)),
+        make_option('--seed', type='int', default=0,
+                    help='Seed of the random choices.'),
+        make_option('--batch-size', type='int', default=loading.BATCH_SIZE,
+                    help='Rows held in memory between inserts.'),
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+                    help='Database to add to, defaults to "default".'),
+    )
+
+    def handle(self, *args, **options):
+        using = options.get('database')
+        connection = connections[using]
+        # keys follow the existing rows so the dataset can be added to any database
+        start = dict(
+            (model, (model._default_manager.using(using).aggregate(
+                last=Max('pk'))['last'] or 0) + 1)
+            for model, count in datagen.SIZES)
+
+        loader = loading.BulkLoader(using=using, batch_size=options.get('batch_size'))
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = False
+        try:
+            with transaction.atomic(using=using):
+                with connection.constraint_checks_disabled():
+                    loader.load(datagen.generate(
+                        options.get('scale'), options.get('seed'), start))
+                loader.finish()
+                clusters.rebuild()
+                # documents of the new towns, their relations came after them
+                for model, index in fulltext.INDEXES.items():
+                    if model in start:
+                        index.reindex(range(start[model], start[model] + loader.counts[model]))
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+
+        for model, count in loader.counts.items():
+            self.stdout.write('%s: %d' % (model._meta.db_table, count))
+        self.stdout.write('Generated %d objects and %d relation rows (%d rows/s)' % (
+            loader.objects, loader.links, loader.rate))
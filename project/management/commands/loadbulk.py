@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db import DatabaseError
+from django.db import IntegrityError
+from django.db import connections
+from django.db import transaction
+
+from project import loading
+
+
+class Command(BaseCommand):
+    help = ("Stream JSON or JSON lines fixtures into empty tables with "
+            "batched inserts, for dumps too large for loaddata.")
+    args = '<fixture fixture ...>'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+                    help='Database to load into, defaults to "default".'),
+        make_option('--batch-size', type='int', default=loading.BATCH_SIZE,
+                    help='Rows held in memory between inserts.'),
+        make_option('--format', choices=['json', 'jsonl'],
+                    help='Fixture format, taken from the extension by default.'),
+    )
+
+    def handle(self, *fixtures, **options):
+        if not fixtures:
+            raise CommandError("Enter at least one fixture path.")
+        self.verbosity = int(options.get('verbosity'))
+        using = options.get('database')
+        connection = connections[using]
+
+        # derived data is rebuilt once at the end rather than per batch
+        loader = loading.BulkLoader(
+            using=using, batch_size=options.get('batch_size'),
+            progress=self.progress, send_signals=False)
+        # the queries of a debug cursor would be kept for the whole load
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = False
+        try:
+            with transaction.atomic(using=using):
+                self.load(loader, connection, fixtures, options.get('format'))
+                loading.rebuild_derived(list(loader.counts))
+        except (DatabaseError, IntegrityError, ValueError) as e:
+            raise CommandError("Could not load fixtures: %s" % e)
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+
+        if self.verbosity >= 1:
+            for model, count in loader.counts.items():
+                self.stdout.write('%s: %d' % (model._meta.db_table, count))
+            self.stdout.write('Loaded %d objects and %d relation rows (%d rows/s)' % (
+                loader.objects, loader.links, loader.rate))
+
+    def load(self, loader, connection, fixtures, format):
+        with connection.constraint_checks_disabled():
+            for path in fixtures:
+                loader.load(loading.read_fixture(path, format))
+                loader.flush()
+        loader.finish()
+
+    def progress(self, loader):
+        if self.verbosity >= 2:
+            self.stdout.write('%d objects, %d relation rows (%d rows/s)' % (
+                loader.objects, loader.links, loader.rate))
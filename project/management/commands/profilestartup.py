@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+
+class Command(BaseCommand):
+    help = ("Start Django in fresh interpreters with the current settings and "
+            "break the startup time down by installed app and by module. "
+            "Fails when startup takes longer than --budget or the "
+            "STARTUP_BUDGET setting, in seconds.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=3,
+                    help='Interpreters started, the median run is reported.'),
+        make_option('--modules', type='int', default=15,
+                    help='Number of the slowest modules listed.'),
+        make_option('--budget', type='float',
+                    help='Longest acceptable startup, in seconds.'),
+        make_option('--output',
+                    help='File the report of the median run is written to as JSON.'),
+    )
+
+    def profile(self):
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+        try:
+            output = subprocess.check_output(
+                [sys.executable, '-m', 'project.startup'], env=env)
+        except subprocess.CalledProcessError as e:
+            raise CommandError('Startup failed with exit status %s' % e.returncode)
+        return json.loads(output.decode('utf-8'))
+
+    def handle(self, *args, **options):
+        runs = sorted((self.profile() for i in range(max(1, options['repeat']))),
+                      key=lambda run: run['total'])
+        run = runs[len(runs) // 2]
+        write = self.stdout.write
+
+        write('Startup with %s: %.3fs (median of %d, %.3fs to %.3fs)' % (
+            run['settings_module'], run['total'], len(runs),
+            runs[0]['total'], runs[-1]['total']))
+        write('  settings  %.3fs' % run['settings'])
+        write('  setup     %.3fs' % run['setup'])
+
+        write('\nApps                       import   models    ready')
+        for label, times in sorted(
+                run['apps'].items(), key=lambda item: -sum(item[1].values())):
+            write('  %-24s %7.3fs %7.3fs %7.3fs' % (
+                label, times['import'], times['models'], times['ready']))
+
+        # self times add up without counting a module twice
+        packages = defaultdict(float)
+        for name, times in run['modules'].items():
+            packages[name.split('.')[0]] += times['self']
+        write('\nPackages (imports)')
+        for name, seconds in sorted(packages.items(), key=lambda item: -item[1])[:options['modules']]:
+            write('  %-40s %7.3fs' % (name, seconds))
+
+        write('\nModules                                    total     self')
+        for name, times in sorted(
+                run['modules'].items(), key=lambda item: -item[1]['total'])[:options['modules']]:
+            write('  %-40s %7.3fs %7.3fs' % (name, times['total'], times['self']))
+
+        if options.get('output'):
+            with open(options['output'], 'w') as output:
+                json.dump(run, output, indent=2, sort_keys=True)
+
+        budget = options.get('budget') or getattr(settings, 'STARTUP_BUDGET', None)
+        if budget:
+            if run['total'] > budget:
+                raise CommandError('Startup took %.3fs, over the budget of %.3fs' % (
+                    run['total'], budget))
+            write('\nWithin the budget of %.3fs' % budget)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from project import ranking
+
+
+class Command(BaseCommand):
+    help = ("Spread out again the positions of ordered rows, such as the "
+            "sortable rows of each TestMe, that moves have crowded together. "
+            "Meant to be run from time to time in the background.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--min-gap', type='int', default=ranking.GAP // 64,
+                    help='Rebalance groups with positions closer than this.'),
+    )
+
+    def handle(self, *args, **options):
+        for model, (group_field, field_name) in ranking.RANKED.items():
+            groups = ranking.crowded(model, options.get('min_gap'))
+            for group in groups:
+                ranking.rebalance(
+                    model._default_manager.filter(**{group_field: group}), field_name)
+            self.stdout.write('Rebalanced %d groups of %s' % (
+                len(groups), model._meta.verbose_name_plural))
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from project import clusters
+
+
+class Command(BaseCommand):
+    help = "Recompute the sister town clusters from the sister town links."
+
+    def handle(self, *args, **options):
+        clusters.rebuild()
+        self.stdout.write('Rebuilt sister town clusters')
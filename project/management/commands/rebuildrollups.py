@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from project import rollups
+
+
+class Command(BaseCommand):
+    help = "Recount the date buckets used by the admin date hierarchies."
+
+    def handle(self, *args, **options):
+        for model in rollups.TRACKED:
+            rollups.rebuild(model)
+            self.stdout.write('Rebuilt %s' % model._meta.verbose_name)
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from project import fulltext
+
+
+class Command(BaseCommand):
+    help = "Index every object of the models with a full text index again."
+
+    def handle(self, *args, **options):
+        for model, index in fulltext.INDEXES.items():
+            index.rebuild()
+            self.stdout.write('Rebuilt %s' % model._meta.verbose_name)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand
+
+from project import counters
+
+
+class Command(BaseCommand):
+    help = ("Recount the related object counters, such as the towns of each "
+            "country, after changes made with update() or raw SQL.")
+
+    def handle(self, *args, **options):
+        for target in counters.targets(*counters.TRACKED):
+            counters.rebuild(target)
+            self.stdout.write('Recounted %s' % target._meta.verbose_name_plural)
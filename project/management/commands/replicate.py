@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from project.replication import replicate
+
+
+class Command(BaseCommand):
+    help = ("Copy the primary SQLite database to the DATABASE_REPLICAS, once "
+            "or every --interval seconds. A stand-in for replication when "
+            "trying read replicas locally.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', default='default',
+                    help='Alias of the primary database.'),
+        make_option('--interval', type='float',
+                    help='Seconds between copies, copy once without it.'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.time()
+            replicas = replicate(options.get('database'))
+            if int(options.get('verbosity')) > 1 or not options.get('interval'):
+                self.stdout.write('Copied %s to %s in %.3fs' % (
+                    options.get('database'), ', '.join(replicas) or 'no replicas',
+                    time.time() - started))
+            if not options.get('interval'):
+                break
+            time.sleep(options.get('interval'))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from django.db import models
+
+from .text import normalize
+
+
+# upper bound for prefix range scans, sorts after every other code point
+PREFIX_UPPER_BOUND = u'\U0010ffff'
+
+
+class AutocompleteQuerySet(models.QuerySet):
+    """
+    QuerySet for models with a normalized ``search_key`` column.
+
+    Prefix lookups are expressed as a range on the indexed key rather than a
+    case-insensitive ``LIKE`` so that the database can use the index.
+    """
+
+    def autocomplete(self, query):
+        key = normalize(query)
+        qs = self.order_by('search_key', 'pk')
+        if not key:
+            return qs
+        return qs.filter(
+            search_key__gte=key,
+            search_key__lt=key + PREFIX_UPPER_BOUND
+            )
+
+
+AutocompleteManager = models.Manager.from_queryset(AutocompleteQuerySet)
+
+
+class HasDocQuerySet(models.QuerySet):
+    """
+    QuerySet for models with ``documentation``, so that a page of objects
+    can show its documents without a query per row.
+    """
+
+    def with_doc_count(self):
+        return self.annotate(
+            doc_count=models.Count('documentation', distinct=True))
+
+    def with_documentation(self):
+        documentation = self.model._meta.get_field('documentation').rel.to
+        return self.prefetch_related(models.Prefetch(
+            'documentation',
+            queryset=documentation._default_manager.only('name').order_by('name')))
+
+
+class HasDocAutocompleteQuerySet(HasDocQuerySet, AutocompleteQuerySet):
+    pass
+
+
+HasDocManager = models.Manager.from_queryset(HasDocAutocompleteQuerySet)
+
+
+class OrganisationTownManager(models.Manager.from_queryset(HasDocQuerySet)):
+    """
+    Joins the town and organisation in the same query since both names are
+    needed whenever a join is displayed.
+    """
+    use_for_related_fields = True
+
+    def get_queryset(self):
+        qs = super(OrganisationTownManager, self).get_queryset()
+        return qs.select_related('town', 'organisation')
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 from django.db import models
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
+from django.dispatch import receiver
 
 from django_autocomplete.meta import AutocompleteMeta
 
+from .bulk import pre_bulk_create
+from .bulk import pre_bulk_update
+from .managers import AutocompleteManager
+from .managers import HasDocManager
+from .managers import OrganisationTownManager
+from .text import normalize
+
 
 API_FILTER_PATH = 'api/filter'
+# the indexed prefix lookups of project.views, next to the package's views
+API_LOOKUP_PATH = 'api/lookup'
 
 
 def get_autocomplete_meta(name):
@@ -24,8 +35,8 @@ class Timestamped(models.Model):
         >>> obj.created
 
     """
-    created = models.DateTimeField(auto_now_add=True)
-    modified = models.DateTimeField(auto_now=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         abstract = True
@@ -39,10 +50,30 @@ class Base(models.Model):
         >>> obj.name
         'base'
 
+    The normalized ``search_key`` is kept in sync on save and is what the
+    autocomplete lookups use:
+
+        >>> obj = Country.objects.create(name=u'Curaçao')
+        >>> obj.search_key
+        'curacao'
+        >>> Country.objects.autocomplete(u'CURAÇ')
+        [<Country: Curaçao>]
+        >>> Country.objects.autocomplete('acao')
+        []
+
+        >>> obj.delete()
+
     """
     name = models.CharField(
         max_length=30
         )
+    search_key = models.CharField(
+        max_length=30,
+        db_index=True,
+        editable=False
+        )
+
+    objects = AutocompleteManager()
 
     class Meta:
         abstract = True
@@ -53,6 +84,35 @@ class Base(models.Model):
     def __str__(self):
         return '%s' % (self.name)
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(['search_key'])
+        super(Base, self).save(*args, **kwargs)
+
+
+@receiver(models.signals.pre_save)
+def update_search_key(sender, instance, **kwargs):
+    # a receiver rather than in save() so that raw fixture loads are covered
+    if isinstance(instance, Base):
+        instance.search_key = normalize(instance.name)[:30]
+
+
+@receiver(pre_bulk_create)
+def create_search_keys(sender, instances, **kwargs):
+    if issubclass(sender, Base):
+        for instance in instances:
+            update_search_key(sender, instance)
+
+
+@receiver(pre_bulk_update)
+def update_search_keys(sender, instances, fields, **kwargs):
+    if issubclass(sender, Base) and 'name' in fields:
+        for instance in instances:
+            update_search_key(sender, instance)
+        if 'search_key' not in fields:
+            fields.append('search_key')
+
 
 class Documentation(Base, Timestamped):
     """
@@ -67,6 +127,8 @@ class Documentation(Base, Timestamped):
         >>> obj.delete()
 
     """
+    body = models.TextField(blank=True)
+
     autocomplete = get_autocomplete_meta('documentation')
 
     class Meta:
@@ -82,6 +144,25 @@ class HasDoc(models.Model):
         class ModelHasDocs(HasDocumentation)
             pass
 
+    Their managers use :class:`project.managers.HasDocQuerySet` to count and
+    fetch the documents of many objects at once:
+
+        >>> usa = Country.objects.create(name='usa')
+        >>> usa.documentation.add(*[
+        ...     Documentation.objects.create(name=name) for name in 'ba'])
+        >>> from django.db import connection
+        >>> from django.test.utils import CaptureQueriesContext
+        >>> with CaptureQueriesContext(connection) as queries:
+        ...     countries = Country.objects.filter(pk=usa.pk)
+        ...     [(c.doc_count, [d.name for d in c.documentation.all()])
+        ...      for c in countries.with_doc_count().with_documentation()]
+        [(2, ['a', 'b'])]
+        >>> len(queries)
+        2
+
+        >>> usa.documentation.all().delete()
+        >>> usa.delete()
+
     """
     documentation = models.ManyToManyField(
         Documentation,
@@ -93,7 +174,18 @@ class HasDoc(models.Model):
         abstract = True
 
 
-class Country(Base, HasDoc, Timestamped):
+class HasTags(models.Model):
+    """
+    Abstract model class giving tagged models a ``tags`` relation, so that
+    tags can be prefetched and are deleted with the object.
+    """
+    tags = GenericRelation('project.TaggedItem')
+
+    class Meta:
+        abstract = True
+
+
+class Country(Base, HasDoc, HasTags, Timestamped):
     """
     The Country model. Each town has a ForeignKey to its Country.
 
@@ -106,14 +198,20 @@ class Country(Base, HasDoc, Timestamped):
         >>> obj.delete()
 
     """
+    # towns of the country, maintained by project.counters
+    town_count = models.PositiveIntegerField(
+        'Towns', default=0, db_index=True, editable=False)
+
     autocomplete = get_autocomplete_meta('country')
 
+    objects = HasDocManager()
+
     class Meta:
         verbose_name = 'Country'
         verbose_name_plural = 'Countries'
 
 
-class Organisation(Base, HasDoc, Timestamped):
+class Organisation(Base, HasDoc, HasTags, Timestamped):
     """
     The Organisation model. It has a many to many relationship with Towns.
 
@@ -131,13 +229,19 @@ class Organisation(Base, HasDoc, Timestamped):
         >>> obj.delete()
 
     """
+    # towns joined, maintained by project.counters
+    town_count = models.PositiveIntegerField(
+        'Towns', default=0, db_index=True, editable=False)
+
     autocomplete = get_autocomplete_meta('organisation')
 
+    objects = HasDocManager()
+
     class Meta:
         verbose_name = 'Organisation'
 
 
-class Town(Base, HasDoc, Timestamped):
+class Town(Base, HasDoc, HasTags, Timestamped):
     """
     The Town model.
 
@@ -177,12 +281,18 @@ class Town(Base, HasDoc, Timestamped):
         related_name='towns'
         )
     sister_towns = models.ManyToManyField('self', blank=True)
+    # smallest key of the towns reachable through sister_towns, maintained
+    # by project.clusters
+    cluster = models.PositiveIntegerField(
+        null=True, blank=True, db_index=True, editable=False)
 
     autocomplete = AutocompleteMeta(
         name='town',
         path='%s/town' % API_FILTER_PATH
         )
 
+    objects = HasDocManager()
+
     class Meta:
         verbose_name = 'Town'
 
@@ -203,6 +313,16 @@ class OrganisationTown(HasDoc, Timestamped):
         ...     joined=datetime.date(2014, 7, 10), town=town,
         ...     organisation=org)
 
+    The names shown by ``__str__`` come with the join in a single query:
+
+        >>> from django.db import connection
+        >>> from django.test.utils import CaptureQueriesContext
+        >>> with CaptureQueriesContext(connection) as queries:
+        ...     str(OrganisationTown.objects.get(pk=join.pk))
+        'redmond microsoft'
+        >>> len(queries)
+        1
+
     Clean up
 
         >>> usa.delete()
@@ -215,6 +335,8 @@ class OrganisationTown(HasDoc, Timestamped):
     town = models.ForeignKey(Town)
     joined = models.DateField()
 
+    objects = OrganisationTownManager()
+
     autocomplete = AutocompleteMeta(
         name='organisationtown',
         path='%s/organisationtown' % API_FILTER_PATH
@@ -251,6 +373,12 @@ class TaggedItem(Timestamped, models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
 
+    class Meta:
+        index_together = [
+            ('content_type', 'object_id'),
+            ('tag', 'content_type'),
+            ]
+
     def __str__(self):
         return self.tag
 
@@ -284,8 +412,73 @@ class TestMe(models.Model):
 
 class TestSortable(models.Model):
     that = models.ForeignKey(TestMe)
-    position = models.PositiveSmallIntegerField("Position")
+    # spread apart by project.ranking so that a move writes one row
+    position = models.PositiveIntegerField("Position")
     test_char = models.CharField(max_length=5)
 
     class Meta:
         ordering = ('position', )
+        index_together = [('that', 'position')]
+
+
+class DateBucket(models.Model):
+    """
+    The number of objects of a model per day of one of its date fields,
+    maintained by :mod:`project.rollups` so that admin date drill-downs and
+    date filters do not scan the model's table.
+
+        >>> from project.rollups import bucket_day
+        >>> town = Town.objects.create(name='Twin Peaks')
+        >>> bucket = DateBucket.objects.get(
+        ...     content_type=ContentType.objects.get_for_model(Town),
+        ...     field_name='created', day=bucket_day(town.created))
+        >>> count = bucket.count
+        >>> town.delete()
+        >>> DateBucket.objects.get(pk=bucket.pk).count == count - 1
+        True
+
+    """
+    content_type = models.ForeignKey(ContentType)
+    field_name = models.CharField(max_length=50)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('content_type', 'field_name', 'day')]
+
+    def __str__(self):
+        return '%s.%s %s: %s' % (
+            self.content_type.model, self.field_name, self.day, self.count)
+
+
+class SearchDocument(models.Model):
+    """
+    The number of words of a document in a :mod:`project.fulltext` index
+    stored in the database, for ranking.
+    """
+    index = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('index', 'object_id')]
+
+    def __str__(self):
+        return '%s %s' % (self.index, self.object_id)
+
+
+class SearchPosting(models.Model):
+    """
+    How often a normalized word occurs in a document of a
+    :mod:`project.fulltext` index stored in the database.
+    """
+    index = models.CharField(max_length=50)
+    term = models.CharField(max_length=100)
+    object_id = models.PositiveIntegerField()
+    frequency = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        index_together = [('index', 'term'), ('index', 'object_id')]
+
+    def __str__(self):
+        return '%s %s %s' % (self.index, self.term, self.object_id)
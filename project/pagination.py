@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Admin changelist pages read by their ordering key.
+
+The links to the next and previous pages carry the key of the last or
+first row shown, so that the page they lead to is read by seeking on the
+key instead of skipping rows with an ``OFFSET``, whichever page it is:
+
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> from project.models import Town
+    >>> towns = [Town.objects.create(name='town %s' % i) for i in range(5)]
+    >>> queryset = Town.objects.filter(pk__in=[t.pk for t in towns]).order_by('name', 'pk')
+    >>> paginator = KeysetPaginator(queryset, 2)
+    >>> page = paginator.page(2)
+    >>> [town.name for town in page]
+    ['town 2', 'town 3']
+    >>> after = decode_key(encode_key(page.last_key), paginator)
+    >>> before = decode_key(encode_key(page.first_key), paginator)
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     [town.name for town in paginator.page(3, after=after)]
+    ...     [town.name for town in paginator.page(1, before=before)]
+    ['town 4']
+    ['town 0', 'town 1']
+    >>> [query for query in queries if 'OFFSET' in query['sql']]
+    []
+
+A key that does not match the ordering is ignored:
+
+    >>> decode_key('["town 2"]', paginator) is None
+    True
+
+Clean up
+
+    >>> for town in towns:
+    ...     town.delete()
+
+"""
+import hashlib
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.views.main import PAGE_VAR
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage
+from django.core.paginator import InvalidPage
+from django.core.paginator import PageNotAnInteger
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import six
+from django.utils.encoding import force_text
+
+
+COUNT_TIMEOUT = 300
+
+# the key of the row a page starts after or ends before
+AFTER_VAR = '_after'
+BEFORE_VAR = '_before'
+
+
+def query_digest(queryset):
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return None
+    return hashlib.md5(('%s:%s' % (queryset.db, sql)).encode('utf-8')).hexdigest()
+
+
+def estimate_count(queryset, timeout=COUNT_TIMEOUT):
+    """
+    Approximate number of rows of ``queryset``. PostgreSQL table statistics
+    are used for unfiltered querysets, otherwise an exact count is cached
+    for ``timeout`` seconds.
+    """
+    digest = query_digest(queryset)
+    if digest is None:
+        return 0
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+    key = 'estimate_count:%s' % digest
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def keyset_ordering(queryset):
+    """
+    Return the ordering of ``queryset`` as ``(attname, descending)`` pairs
+    ending with the primary key, or None when it cannot be used to seek:
+    ordering on related, nullable or unknown fields.
+    """
+    opts = queryset.model._meta
+    fields = dict((f.name, f) for f in opts.concrete_fields)
+    key = []
+    for name in queryset.query.order_by:
+        if not isinstance(name, six.string_types) or name == '?':
+            return None
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        field = opts.pk if name == 'pk' else fields.get(name)
+        if field is None or field.rel or field.null:
+            return None
+        key.append((field.attname, descending))
+        if field.primary_key:
+            return key
+    return None
+
+
+def encode_key(values):
+    return json.dumps([force_text(value) for value in values])
+
+
+def decode_key(text, paginator):
+    """
+    The values of the ordering key of ``paginator`` encoded in ``text``,
+    or None when they cannot be used.
+    """
+    if not text or paginator.key is None:
+        return None
+    fields = dict((f.attname, f) for f in paginator.object_list.model._meta.concrete_fields)
+    try:
+        values = json.loads(text)
+        if not isinstance(values, list) or len(values) != len(paginator.key):
+            return None
+        return [fields[attname].to_python(value)
+                for (attname, descending), value in zip(paginator.key, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator that estimates its count and pages by the ordering key.
+
+    A page is read by seeking after the key of the last row of the page
+    before it, or before the key of the first row of the page after it,
+    when one is given, otherwise with ``OFFSET``. Orphans are not
+    supported.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True):
+        super(KeysetPaginator, self).__init__(
+            object_list, per_page, 0, allow_empty_first_page)
+        self.key = keyset_ordering(object_list)
+        # may be set to the rows without annotations, cheaper to count
+        self.count_queryset = object_list
+
+    def _get_count(self):
+        if self._count is None:
+            self._count = estimate_count(self.count_queryset)
+        return self._count
+    count = property(_get_count)
+
+    def validate_number(self, number):
+        # the count is an estimate so pages past it may still hold rows
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def seek(self, values, backwards=False):
+        """
+        The rows after ``values`` of the key, or before them in reverse
+        order.
+        """
+        condition = Q()
+        for i, (attname, descending) in enumerate(self.key):
+            lookups = dict(
+                (name, value) for (name, d), value in zip(self.key[:i], values))
+            lookups['%s__%s' % (attname, 'lt' if descending != backwards else 'gt')] = values[i]
+            condition |= Q(**lookups)
+        object_list = self.object_list.filter(condition)
+        return object_list.reverse() if backwards else object_list
+
+    def page(self, number, after=None, before=None):
+        number = self.validate_number(number)
+        if self.key is not None and after is not None:
+            object_list = self.seek(after)[:self.per_page]
+        elif self.key is not None and before is not None:
+            pks = list(self.seek(before, backwards=True).values_list('pk', flat=True)[:self.per_page])
+            object_list = self.object_list.filter(pk__in=pks)
+        else:
+            bottom = (number - 1) * self.per_page
+            object_list = self.object_list[bottom:bottom + self.per_page]
+
+        # evaluate now, the result cache is reused by the changelist
+        rows = list(object_list)
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        page = self._get_page(object_list, number, self)
+        page.first_key = page.last_key = None
+        if self.key is not None and rows:
+            page.first_key = [getattr(rows[0], attname) for attname, descending in self.key]
+            page.last_key = [getattr(rows[-1], attname) for attname, descending in self.key]
+        return page
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList for a :class:`KeysetPaginator` that also estimates the
+    unfiltered total rather than counting it. The rows shown get the
+    annotations of the model admin's ``get_changelist_queryset()``, which
+    other admin views and the counts go without. The links to the pages
+    next to the one shown carry its first or last key.
+    """
+    page_keys = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super(KeysetChangeList, self).get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        new_params = dict(new_params or {})
+        remove = list(remove or []) + [AFTER_VAR, BEFORE_VAR]
+        page_num = new_params.get(PAGE_VAR)
+        if self.page_keys is not None and page_num is not None:
+            first_key, last_key = self.page_keys
+            if page_num == self.page_num + 1:
+                new_params[AFTER_VAR] = encode_key(last_key)
+            elif page_num == self.page_num - 1:
+                new_params[BEFORE_VAR] = encode_key(first_key)
+        return super(KeysetChangeList, self).get_query_string(new_params, remove)
+
+    def get_queryset(self, request):
+        queryset = super(KeysetChangeList, self).get_queryset(request)
+        # the same rows without the annotations or the ordering
+        self.plain_queryset = queryset.order_by()
+        annotate = getattr(self.model_admin, 'get_changelist_queryset', None)
+        if annotate is not None:
+            queryset = annotate(request, queryset)
+        return queryset
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        paginator.count_queryset = self.plain_queryset
+        result_count = paginator.count
+        if self.get_filters_params() or self.params.get(SEARCH_VAR):
+            full_result_count = estimate_count(self.root_queryset)
+        else:
+            full_result_count = result_count
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        # bounded, a stale estimate must not render the whole table
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()[:self.list_max_show_all]
+        else:
+            try:
+                page = paginator.page(
+                    self.page_num + 1,
+                    after=decode_key(request.GET.get(AFTER_VAR), paginator),
+                    before=decode_key(request.GET.get(BEFORE_VAR), paginator))
+            except InvalidPage:
+                raise IncorrectLookupParameters
+            result_list = page.object_list
+            if page.first_key is not None:
+                self.page_keys = page.first_key, page.last_key
+
+        self.result_count = result_count
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
+
+
+class KeysetPaginationMixin(object):
+    """
+    ModelAdmin mixin paging changelists with :class:`KeysetPaginator`.
+    """
+    paginator = KeysetPaginator
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
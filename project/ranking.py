@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse positions for manually ordered rows.
+
+Positions are spread ``GAP`` apart so that a row moved between two others
+takes a position between theirs and no other row is written. A new order
+keeps the positions of the longest run of rows already in order and only
+the others are given new ones:
+
+    >>> assign([1024, 2048, 3072, 4096])
+    [1024, 2048, 3072, 4096]
+    >>> assign([4096, 1024, 2048, 3072])
+    [512, 1024, 2048, 3072]
+    >>> assign([1024, None, 2048, None])
+    [1024, 1536, 2048, 3072]
+
+When there is no room left between two positions the rows are spread out
+again:
+
+    >>> assign([2, 1, 3])
+    [1024, 2048, 3072]
+
+Rows are reordered with one ``UPDATE ... CASE`` statement for the rows
+whose positions change:
+
+    >>> import datetime
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> from project.models import TestMe
+    >>> from project.models import TestSortable
+    >>> testme = TestMe.objects.create(
+    ...     test_ip='127.0.0.1', test_url='http://example.com', test_int=1,
+    ...     test_date=datetime.date(2015, 1, 1), test_char='x',
+    ...     test_time=datetime.time(12), test_slug='x', test_text='x',
+    ...     test_email='x@example.com', test_float=1, test_bigint=1,
+    ...     test_positive_integer=1, test_decimal=1,
+    ...     test_comma_separated_int='1', test_small_int=1,
+    ...     test_positive_small_int=1)
+    >>> rows = [TestSortable.objects.create(that=testme, position=position, test_char=char)
+    ...         for position, char in zip(spread(4), 'abcd')]
+    >>> group = TestSortable.objects.filter(that=testme)
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     sorted(reorder(group, [rows[3].pk]).values())
+    [512]
+    >>> [query['sql'] for query in queries if 'UPDATE' in query['sql']]
+    [...UPDATE "project_testsortable" SET "position" = CASE "id" WHEN %s THEN %s END...]
+    >>> [row.test_char for row in group.all()]
+    ['d', 'a', 'b', 'c']
+    >>> sorted(reorder(group, [row.pk for row in rows]).values())
+    [4096]
+    >>> [row.test_char for row in group.all()]
+    ['a', 'b', 'c', 'd']
+
+Clean up
+
+    >>> testme.delete()
+
+"""
+from bisect import bisect_left
+
+from django.db import transaction
+
+from .bulk import bulk_update
+
+
+GAP = 1024
+
+# model -> (group foreign key name, position field name)
+RANKED = {}
+
+
+def register(model, group_field, field_name='position'):
+    """
+    Let the ``rebalancepositions`` command spread out the positions of
+    ``model``, ordered within each value of ``group_field``.
+    """
+    RANKED[model] = (group_field, field_name)
+
+
+def spread(count, gap=GAP):
+    return [gap * (i + 1) for i in range(count)]
+
+
+def kept(ranks):
+    """
+    Indexes of the longest strictly increasing run of ``ranks``, ignoring
+    ``None``.
+    """
+    tails = []
+    tail_indexes = []
+    previous = {}
+    for index, rank in enumerate(ranks):
+        if rank is None:
+            continue
+        at = bisect_left(tails, rank)
+        previous[index] = tail_indexes[at - 1] if at else None
+        if at == len(tails):
+            tails.append(rank)
+            tail_indexes.append(index)
+        else:
+            tails[at] = rank
+            tail_indexes[at] = index
+    indexes = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        indexes.append(index)
+        index = previous[index]
+    return set(indexes)
+
+
+def assign(ranks, gap=GAP):
+    """
+    New positions for rows now in the order of their current ``ranks``,
+    ``None`` for rows without one, changing as few as possible.
+    """
+    keep = kept(ranks)
+    result = list(ranks)
+    lower = 0
+    pending = []
+    for index, rank in enumerate(ranks + [None]):
+        if index in keep or index == len(ranks):
+            if index in keep:
+                upper = rank
+                if pending and upper - lower <= len(pending):
+                    return spread(len(ranks), gap)
+                step = upper - lower
+            else:
+                step = gap * (len(pending) + 1)
+            for n, moved in enumerate(pending):
+                result[moved] = lower + step * (n + 1) // (len(pending) + 1)
+            lower = rank
+            pending = []
+        else:
+            pending.append(index)
+    return result
+
+
+def write(queryset, positions, field_name='position'):
+    """
+    Save the ``{pk: position}`` changes of ``queryset``'s rows with
+    :func:`project.bulk.bulk_update`.
+    """
+    objs = []
+    for pk, position in sorted(positions.items()):
+        obj = queryset.model(pk=pk)
+        setattr(obj, field_name, position)
+        objs.append(obj)
+    bulk_update(objs, [field_name], using=queryset.db)
+
+
+def reorder(queryset, pks, field_name='position'):
+    """
+    Put the rows of ``queryset`` in the order of ``pks``, followed by the
+    rows not listed in their current order, and return the ``{pk:
+    position}`` changes written.
+    """
+    with transaction.atomic(using=queryset.db):
+        current = list(queryset.order_by(field_name, 'pk').values_list('pk', field_name))
+        ranks = dict(current)
+        order = [pk for pk in pks if pk in ranks]
+        listed = set(order)
+        order.extend(pk for pk, rank in current if pk not in listed)
+        positions = dict(
+            (pk, position)
+            for pk, position in zip(order, assign([ranks[pk] for pk in order]))
+            if position != ranks[pk])
+        write(queryset, positions, field_name)
+    return positions
+
+
+def crowded(model, min_gap):
+    """
+    The groups of ``model`` with two positions less than ``min_gap`` apart.
+    """
+    group_field, field_name = RANKED[model]
+    attname = model._meta.get_field(group_field).attname
+    rows = model._default_manager.order_by(attname, field_name).values_list(
+        attname, field_name)
+    groups = set()
+    last_group = last_rank = None
+    for group, rank in rows.iterator():
+        if group == last_group and rank - last_rank < min_gap:
+            groups.add(group)
+        last_group, last_rank = group, rank
+    return sorted(groups)
+
+
+def rebalance(queryset, field_name='position'):
+    """
+    Spread the positions of the rows of ``queryset`` ``GAP`` apart again.
+    """
+    with transaction.atomic(using=queryset.db):
+        current = list(queryset.order_by(field_name, 'pk').values_list('pk', field_name))
+        positions = dict(
+            (pk, position) for (pk, rank), position in zip(current, spread(len(current)))
+            if position != rank)
+        write(queryset, positions, field_name)
+    return positions
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Saving of relation sets by difference.
+
+Rather than clearing a relation and adding every object back, the current
+primary keys are compared with the wanted ones and only the difference is
+written: one bulk INSERT and one DELETE for a many to many relation, one
+UPDATE per direction for a reverse foreign key.
+
+    >>> from project.models import Town
+    >>> a = Town.objects.create(name='a')
+    >>> b = Town.objects.create(name='b')
+    >>> c = Town.objects.create(name='c')
+
+Sister towns are symmetrical, both directions are written:
+
+    >>> added, removed = sync_m2m(a, 'sister_towns', [b.pk, c.pk])
+    >>> added == set([b.pk, c.pk]), removed
+    (True, set())
+    >>> [t.name for t in c.sister_towns.all()]
+    ['a']
+    >>> added, removed = sync_m2m(a, 'sister_towns', [c.pk])
+    >>> removed == set([b.pk])
+    True
+    >>> b.sister_towns.all()
+    []
+
+The town counters and search documents are kept up to date for towns
+moved to another country:
+
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> from project.models import Country
+    >>> usa = Country.objects.create(name='usa')
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     added, removed = sync_reverse_fk(usa, 'town_set', [a.pk, b.pk])
+    >>> len([query for query in queries if 'UPDATE "project_town"' in query['sql']])
+    1
+    >>> Country.objects.get(pk=usa.pk).town_count
+    2
+    >>> added, removed = sync_reverse_fk(usa, 'town_set', [b.pk])
+    >>> Country.objects.get(pk=usa.pk).town_count
+    1
+    >>> from project import fulltext
+    >>> [pk for pk, score in fulltext.get_index(Town).search('usa')] == [b.pk]
+    True
+
+Clean up
+
+    >>> for town in (a, b, c):
+    ...     town.delete()
+    >>> usa.delete()
+
+"""
+from django.db import models
+from django.db import router
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+
+from .cache import get_cache
+from . import counters
+from . import fulltext
+
+
+def primary_keys(value):
+    """
+    Primary keys of a queryset, an iterable of objects or of keys.
+    """
+    if isinstance(value, models.query.QuerySet):
+        return set(value.values_list('pk', flat=True))
+    return set(getattr(obj, 'pk', obj) for obj in value or [])
+
+
+def sync_m2m(instance, field_name, value):
+    """
+    Make the many to many relation ``field_name`` of ``instance`` hold
+    exactly ``value``, returning the sets of added and removed keys.
+
+    ``m2m_changed`` is sent for the difference as ``add()`` and
+    ``remove()`` would.
+    """
+    field = instance._meta.get_field(field_name)
+    through = field.rel.through
+    if not through._meta.auto_created:
+        raise ValueError(
+            "Cannot sync %s, it uses an intermediary model." % field_name)
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    symmetrical = field.rel.symmetrical and field.rel.to == instance.__class__
+    db = router.db_for_write(through, instance=instance)
+    manager = through._default_manager.using(db)
+
+    current = set(manager.filter(
+        **{source: instance.pk}).values_list(target, flat=True))
+    wanted = primary_keys(value)
+    added = wanted - current
+    removed = current - wanted
+
+    def send(action, pk_set):
+        m2m_changed.send(
+            sender=through, action=action, instance=instance, reverse=False,
+            model=field.rel.to, pk_set=pk_set, using=db)
+
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            send('pre_remove', removed)
+            condition = models.Q(**{source: instance.pk, '%s__in' % target: removed})
+            if symmetrical:
+                condition |= models.Q(**{'%s__in' % source: removed, target: instance.pk})
+            manager.filter(condition).delete()
+            send('post_remove', removed)
+        if added:
+            send('pre_add', added)
+            rows = [through(**{source: instance.pk, target: pk}) for pk in added]
+            if symmetrical:
+                # guard against a reverse row left behind by an earlier add
+                existing = set(manager.filter(**{
+                    '%s__in' % source: added, target: instance.pk
+                    }).values_list(source, flat=True))
+                rows.extend(
+                    through(**{source: pk, target: instance.pk})
+                    for pk in added if pk != instance.pk and pk not in existing)
+            manager.bulk_create(rows)
+            send('post_add', added)
+
+    return added, removed
+
+
+def sync_reverse_fk(instance, accessor, value):
+    """
+    Make the reverse foreign key ``accessor`` of ``instance`` (for example
+    ``town_set``) hold exactly ``value``, returning the sets of added and
+    removed keys. Removed objects have the foreign key set to null.
+
+    ``update()`` sends no signals, so the counters kept through the foreign
+    key are adjusted and the moved objects indexed again here.
+    """
+    related = getattr(instance.__class__, accessor).related
+    model = related.model
+    fk = related.field
+    db = router.db_for_write(model, instance=instance)
+    manager = model._default_manager.using(db)
+
+    current = set(manager.filter(
+        **{fk.name: instance}).values_list('pk', flat=True))
+    wanted = primary_keys(value)
+    added = wanted - current
+    removed = current - wanted
+
+    if removed and not fk.null:
+        raise ValueError(
+            "Cannot remove from %s, %s is not nullable." % (accessor, fk.name))
+
+    with transaction.atomic(using=db, savepoint=False):
+        if removed:
+            counters.adjust_moves(fk, manager.filter(pk__in=removed), None)
+            manager.filter(pk__in=removed).update(**{fk.name: None})
+        if added:
+            counters.adjust_moves(fk, manager.filter(pk__in=added), instance.pk)
+            manager.filter(pk__in=added).update(**{fk.name: instance})
+        index = fulltext.get_index(model)
+        if index is not None and (added or removed):
+            index.reindex(added | removed)
+            # lookups are answered from the index
+            get_cache().invalidate(model.autocomplete.name)
+
+    return added, removed
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Replication stand-in for SQLite: replicas are refreshed with a consistent
+copy of the primary file.
+
+    >>> import os
+    >>> import sqlite3
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> primary = os.path.join(directory, 'primary.sqlite3')
+    >>> replica = os.path.join(directory, 'replica.sqlite3')
+    >>> db = sqlite3.connect(primary)
+    >>> with db:
+    ...     cursor = db.execute('CREATE TABLE town (name text)')
+    ...     cursor = db.execute("INSERT INTO town VALUES ('Ashford')")
+    >>> copy_database(primary, replica)
+    >>> sqlite3.connect(replica).execute('SELECT name FROM town').fetchall()
+    [('Ashford',)]
+
+Clean up
+
+    >>> db.close()
+    >>> import shutil
+    >>> shutil.rmtree(directory)
+
+"""
+import os
+import shutil
+import sqlite3
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+
+def copy_database(source, target):
+    """
+    Copy the SQLite database ``source`` to ``target`` as of one moment,
+    replacing ``target`` at once so that its readers never see part of a
+    copy.
+    """
+    temporary = '%s.copy' % target
+    db = sqlite3.connect(source)
+    try:
+        if hasattr(db, 'backup'):
+            copy = sqlite3.connect(temporary)
+            try:
+                db.backup(copy)
+            finally:
+                copy.close()
+        else:
+            # the reserved lock keeps writers out while the file is copied
+            db.isolation_level = None
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                shutil.copyfile(source, temporary)
+            finally:
+                db.execute('ROLLBACK')
+    finally:
+        db.close()
+    os.rename(temporary, target)
+
+
+def database_file(alias):
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        raise ImproperlyConfigured(
+            "Only SQLite databases can be replicated by copying, '%s' is %s." % (
+                alias, connection.vendor))
+    return connection.settings_dict['NAME']
+
+
+def replicate(primary=None, replicas=None):
+    """
+    Copy the ``primary`` database to each of ``replicas``, by default the
+    ``DATABASE_REPLICAS`` setting. Returns the replicas refreshed.
+    """
+    source = database_file(primary or 'default')
+    if replicas is None:
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    for alias in replicas:
+        copy_database(source, database_file(alias))
+        # connections still open read the replaced file
+        connections[alias].close()
+    return list(replicas)
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Per day counts of the date fields of tracked models, stored in
+:class:`project.models.DateBucket` and maintained incrementally from model
+signals.
+
+Updates made with ``QuerySet.update()`` or raw SQL are not seen, run the
+``rebuildrollups`` management command after those.
+"""
+import datetime
+from collections import Counter
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError
+from django.db import transaction
+from django.db.models import F
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import Sum
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .bulk import MAX_QUERY_PARAMS
+from .bulk import post_bulk_create
+from .bulk import post_bulk_update
+from .models import DateBucket
+
+
+# model -> names of the tracked date fields
+TRACKED = {}
+
+REBUILD_CHUNK_SIZE = 2000
+
+
+def bucket_day(value):
+    """
+    The day a date or datetime is counted on, in the default time zone as
+    the admin shows it.
+    """
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value, timezone.get_default_timezone())
+        return value.date()
+    return value
+
+
+def track(model, *field_names):
+    """
+    Maintain day counts of ``field_names`` of ``model``.
+    """
+    TRACKED.setdefault(model, [])
+    TRACKED[model].extend(f for f in field_names if f not in TRACKED[model])
+    uid = 'rollups.%s.%s' % (model._meta.app_label, model._meta.model_name)
+    post_init.connect(remember_days, sender=model, dispatch_uid=uid)
+    post_save.connect(saved, sender=model, dispatch_uid=uid)
+    post_delete.connect(deleted, sender=model, dispatch_uid=uid)
+    post_bulk_create.connect(bulk_created, sender=model, dispatch_uid=uid)
+    post_bulk_update.connect(bulk_updated, sender=model, dispatch_uid=uid)
+
+
+def is_tracked(model, field_name):
+    return field_name in TRACKED.get(model, ())
+
+
+def current_days(instance):
+    return dict(
+        (name, bucket_day(getattr(instance, name)))
+        for name in TRACKED[instance.__class__])
+
+
+def adjust(model, field_name, deltas):
+    """
+    Add the ``{day: delta}`` changes to the buckets of ``field_name``, with
+    one UPDATE per distinct delta and one INSERT for the new days.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    deltas = dict((day, delta) for day, delta in deltas.items()
+                  if day is not None and delta)
+    if not deltas:
+        return
+    buckets = DateBucket.objects.filter(content_type=content_type, field_name=field_name)
+    existing = {}
+    days = sorted(deltas)
+    for start in range(0, len(days), MAX_QUERY_PARAMS):
+        existing.update(buckets.filter(
+            day__in=days[start:start + MAX_QUERY_PARAMS]).values_list('day', 'pk'))
+    by_delta = defaultdict(list)
+    for day, pk in existing.items():
+        by_delta[deltas[day]].append(pk)
+    for delta, pks in by_delta.items():
+        for start in range(0, len(pks), MAX_QUERY_PARAMS):
+            DateBucket.objects.filter(pk__in=pks[start:start + MAX_QUERY_PARAMS]).update(
+                count=F('count') + delta)
+    missing = [day for day in days if day not in existing]
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            DateBucket.objects.bulk_create([
+                DateBucket(content_type=content_type, field_name=field_name,
+                           day=day, count=deltas[day])
+                for day in missing])
+    except IntegrityError:
+        # some were created concurrently
+        for day in missing:
+            adjust_day(buckets, content_type, field_name, day, deltas[day])
+
+
+def adjust_day(buckets, content_type, field_name, day, delta):
+    if buckets.filter(day=day).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            DateBucket.objects.create(
+                content_type=content_type, field_name=field_name,
+                day=day, count=delta)
+    except IntegrityError:
+        buckets.filter(day=day).update(count=F('count') + delta)
+
+
+def move(model, instance, field_names, created):
+    old_days = previous_days(instance)
+    new_days = current_days(instance)
+    for name in field_names:
+        new = new_days[name]
+        old = None if created else old_days.get(name, new)
+        if old != new:
+            adjust(model, name, {new: 1, old: -1})
+    remember_days(model, instance)
+
+
+def previous_days(instance):
+    # days are worked out from the loaded values only when needed
+    values = getattr(instance, '_rollup_values', {})
+    return dict((name, bucket_day(value)) for name, value in values.items())
+
+
+def remember_days(sender, instance, **kwargs):
+    instance._rollup_values = dict(
+        (name, getattr(instance, name)) for name in TRACKED[instance.__class__])
+
+
+def saved(sender, instance, created, **kwargs):
+    move(sender, instance, TRACKED[sender], created)
+
+
+def deleted(sender, instance, **kwargs):
+    days = previous_days(instance) or current_days(instance)
+    for name in TRACKED[sender]:
+        adjust(sender, name, {days[name]: -1})
+
+
+def bulk_created(sender, instances, **kwargs):
+    for name in TRACKED[sender]:
+        adjust(sender, name, Counter(
+            bucket_day(getattr(obj, name)) for obj in instances))
+    for obj in instances:
+        remember_days(sender, obj)
+
+
+def bulk_updated(sender, instances, fields, **kwargs):
+    names = [name for name in TRACKED[sender] if name in fields]
+    for name in names:
+        deltas = Counter()
+        for obj in instances:
+            values = getattr(obj, '_rollup_values', {})
+            old = bucket_day(values[name]) if name in values else None
+            new = bucket_day(getattr(obj, name))
+            if old != new:
+                deltas[new] += 1
+                deltas[old] -= 1
+        adjust(sender, name, deltas)
+    for obj in instances:
+        remember_days(sender, obj)
+
+
+def rebuild(model):
+    """
+    Recount every tracked field of ``model`` from its table.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    manager = model._default_manager
+    for name in TRACKED[model]:
+        counts = Counter()
+        last = None
+        while True:
+            rows = manager.order_by('pk').values_list('pk', name)
+            if last is not None:
+                rows = rows.filter(pk__gt=last)
+            rows = list(rows[:REBUILD_CHUNK_SIZE])
+            if not rows:
+                break
+            counts.update(bucket_day(value) for pk, value in rows)
+            last = rows[-1][0]
+        with transaction.atomic():
+            DateBucket.objects.filter(
+                content_type=content_type, field_name=name).delete()
+            DateBucket.objects.bulk_create([
+                DateBucket(content_type=content_type, field_name=name,
+                           day=day, count=count)
+                for day, count in counts.items() if day is not None])
+
+
+def buckets(model, field_name):
+    return DateBucket.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        field_name=field_name, count__gt=0)
+
+
+def date_range(model, field_name):
+    """
+    The first and last day with objects.
+    """
+    span = buckets(model, field_name).aggregate(first=Min('day'), last=Max('day'))
+    return span['first'], span['last']
+
+
+def dates(model, field_name, kind, year=None, month=None):
+    """
+    Like ``QuerySet.dates()``: the distinct years, months or days holding
+    objects, optionally within ``year`` and ``month``.
+    """
+    qs = buckets(model, field_name)
+    if year is not None:
+        qs = qs.filter(day__year=year)
+    if month is not None:
+        qs = qs.filter(day__month=month)
+    return qs.dates('day', kind)
+
+
+def count_between(model, field_name, since=None, until=None):
+    """
+    Number of objects from day ``since`` up to but excluding ``until``.
+    """
+    qs = buckets(model, field_name)
+    if since is not None:
+        qs = qs.filter(day__gte=since)
+    if until is not None:
+        qs = qs.filter(day__lt=until)
+    return qs.aggregate(total=Sum('count'))['total'] or 0
+
+
+def day_counts(model, field_name, since=None):
+    """
+    ``(day, count)`` pairs from day ``since`` on.
+    """
+    qs = buckets(model, field_name)
+    if since is not None:
+        qs = qs.filter(day__gte=since)
+    return qs.values_list('day', 'count')
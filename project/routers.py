@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Primary and replica database routing.
+
+Writes go to the primary database. Reads of a request go to one of the
+``DATABASE_REPLICAS`` aliases until the request writes, then to the primary
+for the rest of the request so that it reads its own writes. The browser is
+also pinned to the primary for ``REPLICATION_LAG`` seconds by a cookie, so
+the page shown after a redirect does not miss the change either. Outside
+requests, in management commands and shells, everything uses the primary:
+
+    >>> from project.models import Town
+    >>> router = PrimaryReplicaRouter(primary='default', replicas=['replica'])
+    >>> router.db_for_read(Town)
+    'default'
+    >>> start_request()
+    >>> router.db_for_read(Town)
+    'replica'
+    >>> router.db_for_write(Town)
+    'default'
+    >>> router.db_for_read(Town), pinned()
+    ('default', True)
+    >>> end_request()
+    >>> router.db_for_read(Town)
+    'default'
+
+Results cached until a write bumps a generation number, such as
+autocomplete results and facet or tag counts, are read from the primary
+inside :func:`use_primary`: read from a lagging replica they would be kept
+under the new generation until they expire.
+
+    >>> start_request()
+    >>> with use_primary():
+    ...     router.db_for_read(Town)
+    'default'
+    >>> router.db_for_read(Town)
+    'replica'
+    >>> end_request()
+
+"""
+import itertools
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_COOKIE = 'pin_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# a session is read on every request, just after it was written by the last
+PRIMARY_APPS = ('sessions',)
+
+# seconds the replicas may lag behind the primary
+REPLICATION_LAG = 5
+
+_local = threading.local()
+
+
+def start_request(pin=False):
+    _local.request = True
+    _local.pinned = pin
+    _local.wrote = False
+
+
+def end_request():
+    _local.request = False
+    _local.pinned = False
+    _local.wrote = False
+
+
+def pin():
+    _local.pinned = True
+
+
+def pinned():
+    return getattr(_local, 'pinned', False)
+
+
+def wrote():
+    return getattr(_local, 'wrote', False)
+
+
+def in_request():
+    return getattr(_local, 'request', False)
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block.
+    """
+    previous = pinned()
+    pin()
+    try:
+        yield
+    finally:
+        _local.pinned = previous
+
+
+@contextmanager
+def use_database(alias):
+    """
+    Read from ``alias`` inside the block.
+    """
+    previous = getattr(_local, 'database', None)
+    _local.database = alias
+    try:
+        yield
+    finally:
+        _local.database = previous
+
+
+class PrimaryReplicaRouter(object):
+    """
+    Send writes to ``primary`` and the reads of unpinned requests to the
+    ``replicas`` in turn. Defaults to the ``default`` alias and the
+    ``DATABASE_REPLICAS`` setting.
+    """
+
+    def __init__(self, primary=None, replicas=None):
+        self.primary = primary or DEFAULT_DB_ALIAS
+        if replicas is None:
+            replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        self.replicas = list(replicas)
+        self.cycle = itertools.cycle(self.replicas)
+        self.lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        if getattr(_local, 'database', None):
+            return _local.database
+        if not self.replicas or not in_request() or pinned():
+            return self.primary
+        if model._meta.app_label in PRIMARY_APPS:
+            return self.primary
+        with self.lock:
+            return next(self.cycle)
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        pin()
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [self.primary] + self.replicas
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, model):
+        # replicas get the schema with the data
+        if db in self.replicas:
+            return False
+        return None
+
+
+class PrimaryPinningMiddleware(object):
+    """
+    Mark the requests whose reads may go to a replica. Unsafe requests, and
+    requests of a browser that wrote in the last ``REPLICATION_LAG``
+    seconds, read from the primary.
+    """
+
+    def process_request(self, request):
+        start_request(pin=(request.method not in SAFE_METHODS
+                           or PIN_COOKIE in request.COOKIES))
+
+    def process_response(self, request, response):
+        if wrote() and request.method not in SAFE_METHODS:
+            lag = getattr(settings, 'REPLICATION_LAG', REPLICATION_LAG)
+            response.set_cookie(PIN_COOKIE, '1', max_age=lag, httponly=True)
+        end_request()
+        return response
@@ -50,6 +50,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'project.instrumentation.InstrumentationMiddleware',
+    'project.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,6 +80,39 @@ DATABASES = {
     }
 }
 
+# Reads of requests that have not written go to the replica aliases listed in
+# DATABASE_REPLICAS, with none every query uses the default database. To try
+# it locally add a second SQLite file:
+#
+#   DATABASES['replica'] = {
+#       'ENGINE': 'django.db.backends.sqlite3',
+#       'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#       'TEST': {'MIRROR': 'default'},
+#       }
+#   DATABASE_REPLICAS = ('replica',)
+#
+# and keep it refreshed with ``python manage.py replicate --interval 2``.
+DATABASE_ROUTERS = ['project.routers.PrimaryReplicaRouter']
+
+DATABASE_REPLICAS = ()
+
+# seconds a browser reads from the primary after writing
+REPLICATION_LAG = 5
+
+# Cached filter counts and tag counts, and the generation numbers dropping
+# them when their rows change, are kept in the 'shared' cache. Every process
+# serving the site must see the same one, a single runserver process can use
+# local memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+        },
+    }
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -109,3 +144,61 @@ BOOTSTRAP3 = {
     'javascript_in_head': False,
     'include_jquery': True,
     }
+
+# Autocomplete result cache, shared through the cache named by CACHE_ALIAS so
+# that every process sees the same entries and invalidations. Set BACKEND to
+# 'local' to keep up to MAX_SIZE entries in process instead.
+AUTOCOMPLETE_CACHE = {
+    'BACKEND': 'django',
+    'CACHE_ALIAS': 'shared',
+    'TIMEOUT': 300,
+    }
+
+# Autocomplete lookups served by project.asgi: seconds a lookup waits for a
+# newer one from the same browser, and threads for queries and for the WSGI
+# application serving everything else.
+ASYNC_AUTOCOMPLETE = {
+    'DEBOUNCE': 0.05,
+    'QUERY_THREADS': 4,
+    'WSGI_THREADS': 8,
+    }
+
+# Per view latency and SQL histograms, logged as JSON to the
+# project.instrumentation logger every FLUSH_INTERVAL seconds and served
+# to staff at /_instrumentation/.
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 60,
+    }
+
+# The JSON statistics of project.instrumentation and the step timings of
+# project.warmup are logged at INFO, which Django's default logging drops for
+# loggers outside django.*
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '%(asctime)s %(name)s %(levelname)s %(message)s',
+            },
+        },
+    'handlers': {
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+            },
+        },
+    'loggers': {
+        'project.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+            },
+        'project.warmup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+            },
+        },
+    }
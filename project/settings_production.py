@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Production settings, the development settings without the apps only used
+while developing and with compiled templates kept in memory.
+
+Use them with ``DJANGO_SETTINGS_MODULE=project.settings_production``.
+"""
+import os
+
+from .settings import *  # noqa
+from .settings import INSTALLED_APPS
+
+
+DEBUG = False
+
+TEMPLATE_DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+
+# shell_plus, runserver_plus and the toolbar are not used in production, the
+# packages need not be installed
+DEVELOPMENT_APPS = (
+    'django_extensions',
+    'debug_toolbar.apps.DebugToolbarConfig',
+    )
+
+INSTALLED_APPS = tuple(app for app in INSTALLED_APPS if app not in DEVELOPMENT_APPS)
+
+TEMPLATE_LOADERS = (
+    ('django.template.loaders.cached.Loader', (
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+        )),
+    )
+
+# every worker process must see the same shared cache, for the generation
+# numbers invalidating cached counts and autocomplete results to reach all of
+# them; use memcached when serving from more than one host
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_DIR', '/var/tmp/project_cache'),
+        },
+    }
+
+AUTOCOMPLETE_CACHE = {
+    'BACKEND': 'django',
+    'CACHE_ALIAS': 'shared',
+    'TIMEOUT': 300,
+    }
+
+# seconds, checked by ``manage.py profilestartup``
+STARTUP_BUDGET = 1.0
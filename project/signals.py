@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .bulk import post_bulk_create
+from .bulk import post_bulk_update
+from .cache import get_cache
+from .models import Base
+from .models import Country
+from .models import Documentation
+from .models import Organisation
+from .models import OrganisationTown
+from .models import TaggedItem
+from .models import TestMe
+from .models import TestSortable
+from .models import Town
+from . import clusters
+from . import counters
+from . import facets
+from . import fulltext
+from . import ranking
+from . import rollups
+from . import tags
+
+
+def invalidate_autocomplete(model):
+    if isinstance(model, type) and issubclass(model, Base):
+        get_cache().invalidate(model.autocomplete.name)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(post_bulk_create)
+@receiver(post_bulk_update)
+def autocomplete_changed(sender, **kwargs):
+    invalidate_autocomplete(sender)
+
+
+@receiver(m2m_changed)
+def autocomplete_relation_changed(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        invalidate_autocomplete(instance.__class__)
+        invalidate_autocomplete(model)
+
+
+@receiver(m2m_changed, sender=Town.sister_towns.through)
+def sister_towns_changed(sender, instance, action, pk_set, **kwargs):
+    if action == 'post_add':
+        clusters.merge(set(pk_set) | set([instance.pk]))
+    elif action in ('post_remove', 'post_clear'):
+        clusters.split(clusters.cluster_of(instance))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+@receiver(post_bulk_create, sender=TaggedItem)
+@receiver(post_bulk_update, sender=TaggedItem)
+def tags_changed(sender, **kwargs):
+    tags.invalidate_tag_counts()
+
+
+@receiver(pre_delete, sender=Town)
+def town_deleting(sender, instance, **kwargs):
+    # clusters are written with UPDATE, the instance may not have its own
+    instance._deleted_cluster = Town.objects.filter(
+        pk=instance.pk).values_list('cluster', flat=True).first()
+
+
+@receiver(post_delete, sender=Town)
+def town_deleted(sender, instance, **kwargs):
+    # the links went with the town
+    clusters.split(getattr(instance, '_deleted_cluster', instance.cluster))
+
+
+counters.track(Town, 'country', 'town_count')
+counters.track(OrganisationTown, 'organisation', 'town_count')
+
+for model in (Country, Documentation, Organisation, OrganisationTown, Town):
+    rollups.track(model, 'created', 'modified')
+rollups.track(TestMe, 'test_date')
+facets.track(TestMe, 'test_ip', 'test_url', 'test_int')
+ranking.register(TestSortable, 'that')
+
+
+def documentation_text(doc):
+    return '%s %s' % (doc.name, doc.body)
+
+
+fulltext.register(Documentation, documentation_text)
+
+
+def town_document(town):
+    """
+    The town with the names of its country, organisations, tags and
+    documentation, so that searching any of them finds the town.
+    """
+    names = [town.name]
+    if town.country is not None:
+        names.append(town.country.name)
+    names.extend(org.name for org in town.organisations.all())
+    names.extend(item.tag for item in town.tags.all())
+    names.extend(doc.name for doc in town.documentation.all())
+    return ' '.join(names)
+
+
+def prepare_towns(towns):
+    # fresh copies, leaving the caches of the saved instances alone, with
+    # the related names of all of them fetched in a few queries
+    prepared = []
+    for chunk in fulltext.chunks([town.pk for town in towns]):
+        prepared.extend(Town.objects.filter(pk__in=chunk).select_related(
+            'country').prefetch_related('organisations', 'documentation'))
+    tags.prefetch_tags(prepared)
+    return prepared
+
+
+fulltext.register(Town, town_document, prepare=prepare_towns)
+
+# related model -> lookup from Town
+TOWN_DOCUMENT_LOOKUPS = {
+    Country: 'country__in',
+    Organisation: 'organisations__in',
+    Documentation: 'documentation__in',
+    }
+
+
+def reindex_towns(pks):
+    fulltext.get_index(Town).reindex(pks)
+    # town lookups match the related names too
+    invalidate_autocomplete(Town)
+
+
+def towns_of(model, pks):
+    return Town.objects.filter(
+        **{TOWN_DOCUMENT_LOOKUPS[model]: pks}).values_list('pk', flat=True).distinct()
+
+
+@receiver(pre_save, sender=Country)
+@receiver(pre_save, sender=Organisation)
+@receiver(pre_save, sender=Documentation)
+def remember_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    # the stored name, read only when it may be overwritten
+    if raw or instance.pk is None or (update_fields is not None and 'name' not in update_fields):
+        instance._indexed_name = instance.name
+    else:
+        instance._indexed_name = sender._default_manager.filter(
+            pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=Organisation)
+@receiver(post_save, sender=Documentation)
+def town_document_name_saved(sender, instance, created, **kwargs):
+    # only the name is part of the town documents
+    if not created and instance.name != getattr(instance, '_indexed_name', instance.name):
+        reindex_towns(towns_of(sender, [instance.pk]))
+
+
+@receiver(post_bulk_update, sender=Country)
+@receiver(post_bulk_update, sender=Organisation)
+@receiver(post_bulk_update, sender=Documentation)
+def town_document_names_updated(sender, instances, fields, **kwargs):
+    if 'name' in fields:
+        for chunk in fulltext.chunks([obj.pk for obj in instances]):
+            reindex_towns(towns_of(sender, chunk))
+
+
+@receiver(pre_delete, sender=Documentation)
+def town_documentation_deleting(sender, instance, **kwargs):
+    # the links are gone by post_delete
+    instance._town_pks = list(towns_of(Documentation, [instance.pk]))
+
+
+@receiver(post_delete, sender=Documentation)
+def town_documentation_deleted(sender, instance, **kwargs):
+    reindex_towns(getattr(instance, '_town_pks', []))
+
+
+@receiver(m2m_changed, sender=Town.documentation.through)
+def town_documentation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            reindex_towns([instance.pk])
+    elif action == 'pre_clear':
+        instance._town_pks = list(towns_of(Documentation, [instance.pk]))
+    elif action == 'post_clear':
+        reindex_towns(getattr(instance, '_town_pks', []))
+    elif action.startswith('post_'):
+        reindex_towns(pk_set)
+
+
+@receiver(post_init, sender=OrganisationTown)
+def remember_town(sender, instance, **kwargs):
+    instance._indexed_town_id = instance.town_id
+
+
+def joined_towns(instances):
+    pks = set()
+    for join in instances:
+        pks.add(join.town_id)
+        pks.add(getattr(join, '_indexed_town_id', None))
+        join._indexed_town_id = join.town_id
+    return pks
+
+
+@receiver(post_save, sender=OrganisationTown)
+@receiver(post_delete, sender=OrganisationTown)
+def town_joins_changed(sender, instance, **kwargs):
+    reindex_towns(joined_towns([instance]))
+
+
+@receiver(post_bulk_create, sender=OrganisationTown)
+@receiver(post_bulk_update, sender=OrganisationTown)
+def town_joins_bulk_changed(sender, instances, **kwargs):
+    reindex_towns(joined_towns(instances))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def town_tags_changed(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Town).pk:
+        reindex_towns([instance.object_id])
+
+
+@receiver(post_bulk_create, sender=TaggedItem)
+@receiver(post_bulk_update, sender=TaggedItem)
+def town_tags_bulk_changed(sender, instances, **kwargs):
+    content_type = ContentType.objects.get_for_model(Town).pk
+    reindex_towns(item.object_id for item in instances
+                  if item.content_type_id == content_type)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Where the time goes when Django starts.
+
+Run as a script, in a fresh interpreter, this module times the settings
+import, then ``django.setup()`` broken down by installed app into the import
+of the app module, of its models and ``AppConfig.ready()``, and by module
+into the time spent importing each one. It prints the report as JSON, which
+the ``profilestartup`` command reads:
+
+    $ python -m project.startup
+
+Module times are inclusive of the modules they import, ``self`` excludes
+them. Modules imported by ``importlib.import_module`` are counted in the
+app figures but not in the module list.
+"""
+import json
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    import builtins
+except ImportError:  # Python 2
+    import __builtin__ as builtins
+
+
+def absolute_name(name, globals, level):
+    if not level:
+        return name
+    package = (globals or {}).get('__package__')
+    if not package:
+        return None
+    base = package.rsplit('.', level - 1)[0]
+    return '%s.%s' % (base, name) if name else base
+
+
+class ImportTimer(object):
+    """
+    Time every module first imported through the ``import`` statement.
+
+        >>> module = sys.modules.pop('colorsys', None)
+        >>> timer = ImportTimer()
+        >>> with timer:
+        ...     import colorsys
+        >>> sorted(timer.modules), sorted(timer.modules['colorsys'])
+        (['colorsys'], ['self', 'total'])
+
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.stack = []
+
+    def __enter__(self):
+        self.original = builtins.__import__
+        builtins.__import__ = self.timed_import
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self.original
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        module = absolute_name(name, globals, level)
+        if module is None or module in sys.modules:
+            return self.original(name, globals, locals, fromlist, level)
+        self.stack.append(0.0)
+        started = time.time()
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - started
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            if module in sys.modules:
+                self.modules[module] = {'total': elapsed, 'self': elapsed - children}
+
+
+class AppTimer(object):
+    """
+    Time the import, models import and ``ready()`` of each app config while
+    ``django.setup()`` runs.
+    """
+
+    def __init__(self):
+        self.apps = OrderedDict()
+
+    def record(self, label, step, elapsed):
+        self.apps.setdefault(label, {'import': 0.0, 'models': 0.0, 'ready': 0.0})
+        self.apps[label][step] += elapsed
+
+    def __enter__(self):
+        from django.apps import AppConfig
+
+        timer = self
+        self.create = AppConfig.__dict__['create']
+        self.import_models = AppConfig.import_models
+        create = self.create.__func__
+        import_models = self.import_models
+
+        def timed_create(cls, entry):
+            started = time.time()
+            app_config = create(cls, entry)
+            timer.record(app_config.label, 'import', time.time() - started)
+            return app_config
+
+        def timed_import_models(app_config, all_models):
+            started = time.time()
+            import_models(app_config, all_models)
+            timer.record(app_config.label, 'models', time.time() - started)
+            ready = app_config.ready
+
+            def timed_ready():
+                started = time.time()
+                ready()
+                timer.record(app_config.label, 'ready', time.time() - started)
+
+            # ready() follows once every app has its models
+            app_config.ready = timed_ready
+
+        AppConfig.create = classmethod(timed_create)
+        AppConfig.import_models = timed_import_models
+        return self
+
+    def __exit__(self, *exc_info):
+        from django.apps import AppConfig
+
+        AppConfig.create = self.create
+        AppConfig.import_models = self.import_models
+
+
+def profile():
+    """
+    Set Django up and return the timings, this is only meaningful in an
+    interpreter that has not imported Django yet.
+    """
+    started = time.time()
+    modules = ImportTimer()
+    with modules:
+        import django
+        from django.conf import settings
+
+        settings_started = time.time()
+        settings.INSTALLED_APPS
+        settings_time = time.time() - settings_started
+
+        apps = AppTimer()
+        setup_started = time.time()
+        with apps:
+            django.setup()
+        setup_time = time.time() - setup_started
+    return {
+        'total': time.time() - started,
+        'settings_module': settings.SETTINGS_MODULE,
+        'settings': settings_time,
+        'setup': setup_time,
+        'apps': apps.apps,
+        'modules': modules.modules,
+        }
+
+
+if __name__ == '__main__':
+    json.dump(profile(), sys.stdout)
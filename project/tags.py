@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Batched tag lookups.
+
+Tags of a page of objects of several models are fetched with one query per
+model and tag frequencies per model are cached until a tag changes:
+
+    >>> from project.models import Country
+    >>> from project.models import Town
+    >>> usa = Country.objects.create(name='usa')
+    >>> town = Town.objects.create(name='Twin Peaks', country=usa)
+    >>> for obj, tag in [(town, 'lynch'), (town, 'owls'), (usa, 'lynch')]:
+    ...     item = obj.tags.create(tag=tag)
+
+    >>> from django.db import connection
+    >>> from django.test.utils import CaptureQueriesContext
+    >>> objects = [Town.objects.get(pk=town.pk), Country.objects.get(pk=usa.pk)]
+    >>> with CaptureQueriesContext(connection) as queries:
+    ...     prefetch_tags(objects)
+    ...     [[str(item) for item in obj.tags.all()] for obj in objects]
+    [['lynch', 'owls'], ['lynch']]
+    >>> len(queries)
+    2
+
+    >>> counts = dict(tag_counts(Town))
+    >>> town.tags.create(tag='owls').tag
+    'owls'
+    >>> dict(tag_counts(Town))['owls'] - counts['owls']
+    1
+
+Clean up
+
+    >>> town.delete()
+    >>> usa.delete()
+
+"""
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.db.models import Count
+
+from .bulk import MAX_QUERY_PARAMS
+from .cache import bump_generation
+from .cache import get_generation
+from .models import TaggedItem
+from .routers import use_primary
+
+
+# the counts of every process must be dropped together
+CACHE_ALIAS = 'shared'
+
+TAG_COUNTS_TIMEOUT = 3600
+
+GENERATION_KEY = 'tag_counts:generation'
+
+
+def prefetch_tags(objects):
+    """
+    Fill the ``tags`` of every object in ``objects``, which may be of
+    several models, with one query per model.
+    """
+    by_model = defaultdict(list)
+    for obj in objects:
+        by_model[obj.__class__].append(obj)
+    for model, objs in by_model.items():
+        content_type = ContentType.objects.get_for_model(model)
+        pks = sorted(set(obj.pk for obj in objs))
+        tags = defaultdict(list)
+        for start in range(0, len(pks), MAX_QUERY_PARAMS):
+            items = TaggedItem.objects.filter(
+                content_type=content_type,
+                object_id__in=pks[start:start + MAX_QUERY_PARAMS]).order_by('tag', 'pk')
+            for item in items:
+                tags[item.object_id].append(item)
+        for obj in objs:
+            for item in tags[obj.pk]:
+                setattr(item, TaggedItem.content_object.cache_attr, obj)
+            queryset = obj.tags.get_queryset()
+            queryset._result_cache = tags[obj.pk]
+            queryset._prefetch_done = True
+            if not hasattr(obj, '_prefetched_objects_cache'):
+                obj._prefetched_objects_cache = {}
+            obj._prefetched_objects_cache['tags'] = queryset
+
+
+def generation():
+    return get_generation(caches[CACHE_ALIAS], GENERATION_KEY)
+
+
+def invalidate_tag_counts():
+    bump_generation(caches[CACHE_ALIAS], GENERATION_KEY)
+
+
+def tag_counts(model, limit=None):
+    """
+    ``(tag, count)`` pairs for the objects of ``model``, most used first.
+    """
+    cache = caches[CACHE_ALIAS]
+    content_type = ContentType.objects.get_for_model(model)
+    key = 'tag_counts:%s:%s' % (content_type.pk, generation())
+    counts = cache.get(key)
+    if counts is None:
+        with use_primary():
+            counts = list(TaggedItem.objects.filter(
+                content_type=content_type).values('tag').annotate(
+                count=Count('pk')).order_by('-count', 'tag').values_list('tag', 'count'))
+        cache.set(key, counts, TAG_COUNTS_TIMEOUT)
+    return counts[:limit] if limit else counts
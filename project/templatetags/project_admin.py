@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import copy
+import datetime
+
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.utils import formats
+from django.utils.text import capfirst
+from django.utils.translation import ugettext as _
+
+from project import rollups
+
+
+register = template.Library()
+
+
+def uses_rollups(cl):
+    """
+    Whether the date hierarchy of the changelist can be read from the day
+    buckets: the field is tracked and nothing but the hierarchy itself
+    filters the changelist.
+    """
+    if not cl.date_hierarchy or cl.query:
+        return False
+    if not rollups.is_tracked(cl.model, cl.date_hierarchy):
+        return False
+    field_generic = '%s__' % cl.date_hierarchy
+    return not [
+        k for k in cl.get_filters_params() if not k.startswith(field_generic)]
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def rollup_date_hierarchy(cl):
+    """
+    The admin ``date_hierarchy`` tag rendered from the day buckets of
+    :mod:`project.rollups` instead of distinct date queries over the table.
+    """
+    if not uses_rollups(cl):
+        if hasattr(cl, 'plain_queryset'):
+            # the dates do not need the annotations of the rows shown
+            cl = copy.copy(cl)
+            cl.queryset = cl.plain_queryset
+        return date_hierarchy(cl)
+
+    field_name = cl.date_hierarchy
+    year_field = '%s__year' % field_name
+    month_field = '%s__month' % field_name
+    day_field = '%s__day' % field_name
+    field_generic = '%s__' % field_name
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [field_generic])
+
+    if not (year_lookup or month_lookup or day_lookup):
+        # select appropriate start level
+        first, last = rollups.date_range(cl.model, field_name)
+        if first and last and first.year == last.year:
+            year_lookup = first.year
+            if first.month == last.month:
+                month_lookup = first.month
+
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT'))
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}]
+        }
+    elif year_lookup and month_lookup:
+        days = rollups.dates(cl.model, field_name, 'day', year_lookup, month_lookup)
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup}),
+                'title': str(year_lookup)
+            },
+            'choices': [{
+                'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day.day}),
+                'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))
+            } for day in days]
+        }
+    elif year_lookup:
+        months = rollups.dates(cl.model, field_name, 'month', year_lookup)
+        return {
+            'show': True,
+            'back': {
+                'link': link({}),
+                'title': _('All dates')
+            },
+            'choices': [{
+                'link': link({year_field: year_lookup, month_field: month.month}),
+                'title': capfirst(formats.date_format(month, 'YEAR_MONTH_FORMAT'))
+            } for month in months]
+        }
+    else:
+        years = rollups.dates(cl.model, field_name, 'year')
+        return {
+            'show': True,
+            'choices': [{
+                'link': link({year_field: str(year.year)}),
+                'title': str(year.year),
+            } for year in years]
+        }
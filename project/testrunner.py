@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Test runner sharing the tests of a suite among processes.
+
+The test database is created once, with any ``fixtures`` loaded, and kept
+as a SQLite file. Each worker process copies that snapshot and takes the
+next test as soon as it is free, so slow tests do not hold up a fixed
+shard. The tests of a class with ``setUpClass`` or ``tearDownClass``, or of
+a module with ``setUpModule`` or ``tearDownModule``, are sent to a worker
+together and run as one suite so that those fixtures run. The time of
+every test is reported and the slowest are listed at the end of the run.
+
+The workers inherit the grouped tests by forking. Databases other than
+SQLite cannot be copied and platforms without ``fork`` cannot share the
+tests this way, the suite then runs serially.
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from django.core.management import call_command
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+SLOWEST = 10
+
+# the tests of the running suite grouped as they must run, inherited by
+# forked workers, see fork_context
+_units = []
+
+
+def iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for inner in iter_tests(test):
+                yield inner
+        else:
+            yield test
+
+
+def has_fixtures(cls, *names):
+    return any(
+        getattr(getattr(cls, name, None), '__func__', None)
+        is not getattr(unittest.TestCase, name).__func__
+        for name in names)
+
+
+def fixture_key(test):
+    """
+    What the tests that must run together with ``test`` share: its module
+    when that has module fixtures, its class when that has class fixtures,
+    otherwise nothing.
+    """
+    cls = test.__class__
+    module = sys.modules.get(cls.__module__)
+    if hasattr(module, 'setUpModule') or hasattr(module, 'tearDownModule'):
+        return cls.__module__
+    if has_fixtures(cls, 'setUpClass', 'tearDownClass'):
+        return cls
+    return None
+
+
+def group_tests(tests):
+    """
+    Split ``tests`` into the lists of tests each worker runs as one suite.
+    """
+    units = []
+    groups = {}
+    for test in tests:
+        key = fixture_key(test)
+        if key is None:
+            units.append([test])
+        elif key in groups:
+            groups[key].append(test)
+        else:
+            groups[key] = [test]
+            units.append(groups[key])
+    return units
+
+
+def fork_context():
+    """
+    The multiprocessing context starting workers with ``fork``, or ``None``
+    where the platform cannot fork.
+    """
+    if not hasattr(multiprocessing, 'get_context'):
+        # Python 2 forks wherever it can
+        return multiprocessing if hasattr(os, 'fork') else None
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+class TimedResult(unittest.TestResult):
+    """
+    Result keeping ``(test id, outcome, seconds, traceback)`` for each test,
+    which can be sent back from a worker.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(TimedResult, self).__init__(*args, **kwargs)
+        self.outcomes = []
+
+    def startTest(self, test):
+        super(TimedResult, self).startTest(test)
+        self.started = time.time()
+        self.outcome = ('ok', None)
+
+    def stopTest(self, test):
+        super(TimedResult, self).stopTest(test)
+        status, detail = self.outcome
+        self.outcomes.append((test.id(), status, time.time() - self.started, detail))
+
+    def addError(self, test, err):
+        super(TimedResult, self).addError(test, err)
+        self.outcome = ('error', self.errors[-1][1])
+        if not isinstance(test, unittest.TestCase):
+            # a class or module fixture failed, outside any test
+            self.outcomes.append((test.id(), 'error', 0.0, self.errors[-1][1]))
+
+    def addFailure(self, test, err):
+        super(TimedResult, self).addFailure(test, err)
+        self.outcome = ('fail', self.failures[-1][1])
+
+    def addSkip(self, test, reason):
+        super(TimedResult, self).addSkip(test, reason)
+        self.outcome = ('skip', reason)
+
+    def addExpectedFailure(self, test, err):
+        super(TimedResult, self).addExpectedFailure(test, err)
+        self.outcome = ('expected failure', None)
+
+    def addUnexpectedSuccess(self, test):
+        super(TimedResult, self).addUnexpectedSuccess(test)
+        self.outcome = ('unexpected success', None)
+
+
+def init_worker(snapshots, directory):
+    """
+    Point every connection of this worker at its own copy of the snapshot.
+    """
+    for alias, snapshot in snapshots.items():
+        connection = connections[alias]
+        connection.close()
+        name = os.path.join(directory, '%s-%s.sqlite3' % (alias, os.getpid()))
+        shutil.copyfile(snapshot, name)
+        connection.settings_dict['NAME'] = name
+
+
+def run_tests(index):
+    result = TimedResult()
+    unittest.TestSuite(_units[index]).run(result)
+    return result.outcomes
+
+
+class ParallelDiscoverRunner(DiscoverRunner):
+    """
+    :class:`DiscoverRunner` running the tests in ``processes`` workers, one
+    per CPU by default, each with a copy of the test database.
+    """
+
+    def __init__(self, processes=None, fixtures=(), slowest=SLOWEST, **kwargs):
+        super(ParallelDiscoverRunner, self).__init__(**kwargs)
+        self.processes = processes or multiprocessing.cpu_count()
+        self.fixtures = fixtures
+        self.slowest = slowest
+
+    def can_snapshot(self):
+        return all(connection.vendor == 'sqlite' for connection in connections.all())
+
+    def setup_snapshots(self, directory):
+        for connection in connections.all():
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory, '%s.sqlite3' % connection.alias)
+        old_config = self.setup_databases()
+        if self.fixtures:
+            call_command('loaddata', *self.fixtures, verbosity=0)
+        close_connections()
+        return old_config, dict(
+            (connection.alias, connection.settings_dict['NAME'])
+            for connection in connections.all())
+
+    def run_tests(self, test_labels, extra_tests=None, **kwargs):
+        context = fork_context()
+        if context is None or not self.can_snapshot():
+            sys.stderr.write('Running the tests serially, the workers need fork and SQLite.\n')
+            return super(ParallelDiscoverRunner, self).run_tests(
+                test_labels, extra_tests, **kwargs)
+        self.setup_test_environment()
+        suite = self.build_suite(test_labels, extra_tests)
+        _units[:] = group_tests(iter_tests(suite))
+        directory = tempfile.mkdtemp(prefix='test-snapshot-')
+        started = time.time()
+        try:
+            old_config, snapshots = self.setup_snapshots(directory)
+            pool = context.Pool(
+                self.processes, init_worker, (snapshots, directory))
+            try:
+                outcomes = []
+                for found in pool.imap_unordered(run_tests, range(len(_units))):
+                    outcomes.extend(found)
+                    self.report_progress(found)
+            finally:
+                pool.close()
+                pool.join()
+            self.teardown_databases(old_config)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.teardown_test_environment()
+        return self.report(outcomes, time.time() - started)
+
+    def report_progress(self, outcomes):
+        for test_id, status, seconds, detail in outcomes:
+            if self.verbosity >= 2:
+                sys.stderr.write('%s ... %s (%.3fs)\n' % (test_id, status, seconds))
+            elif self.verbosity == 1:
+                sys.stderr.write('.' if status == 'ok' else status[0].upper())
+        sys.stderr.flush()
+
+    def report(self, outcomes, elapsed):
+        """
+        Write failures, the slowest tests and a summary, and return the
+        number of failed tests.
+        """
+        write = sys.stderr.write
+        if self.verbosity == 1:
+            write('\n')
+        failed = [outcome for outcome in outcomes if outcome[1] in ('error', 'fail')]
+        for test_id, status, seconds, detail in failed:
+            write('=' * 70 + '\n%s: %s\n' % (status.upper(), test_id))
+            write('-' * 70 + '\n%s\n' % detail)
+        if self.slowest:
+            write('Slowest tests:\n')
+            for test_id, status, seconds, detail in sorted(
+                    outcomes, key=lambda outcome: -outcome[2])[:self.slowest]:
+                write('  %8.3fs  %s\n' % (seconds, test_id))
+        write('-' * 70 + '\n')
+        write('Ran %d tests in %.3fs on %d processes\n\n' % (
+            len(outcomes), elapsed, self.processes))
+        if failed:
+            counts = dict((status, len([o for o in failed if o[1] == status]))
+                          for status in ('fail', 'error'))
+            write('FAILED (failures=%(fail)d, errors=%(error)d)\n' % counts)
+        else:
+            write('OK\n')
+        return len(failed)
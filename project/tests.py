@@ -14,6 +14,28 @@ def tearDown(test):
 def load_tests(loader, tests, ignore):
     list_of_doctests = []
     list_of_doctests.append('project.models')
+    list_of_doctests.append('project.text')
+    list_of_doctests.append('project.cache')
+    list_of_doctests.append('project.relations')
+    list_of_doctests.append('project.bulk')
+    list_of_doctests.append('project.loading')
+    list_of_doctests.append('project.export')
+    list_of_doctests.append('project.clusters')
+    list_of_doctests.append('project.tags')
+    list_of_doctests.append('project.fulltext')
+    list_of_doctests.append('project.datagen')
+    list_of_doctests.append('project.benchmark')
+    list_of_doctests.append('project.instrumentation')
+    list_of_doctests.append('project.warmup')
+    list_of_doctests.append('project.startup')
+    list_of_doctests.append('project.routers')
+    list_of_doctests.append('project.replication')
+    list_of_doctests.append('project.counters')
+    list_of_doctests.append('project.facets')
+    list_of_doctests.append('project.ranking')
+    list_of_doctests.append('project.pagination')
+    list_of_doctests.append('project.forms')
+    list_of_doctests.append('project.admin')
 
     suite = unittest.TestSuite()
     for t in list_of_doctests:
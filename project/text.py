@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import unicodedata
+
+
+def normalize(value):
+    """
+    Fold a value to the key used for indexed lookups: accents are stripped
+    and the result is lower-cased.
+
+        >>> normalize(u'Zürich')
+        'zurich'
+        >>> normalize(u'  Łódź ')
+        'łodz'
+        >>> normalize(None)
+        ''
+
+    """
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', u'%s' % value)
+    folded = u''.join(c for c in decomposed if not unicodedata.combining(c))
+    return folded.strip().lower()
@@ -2,11 +2,25 @@
 from django.conf.urls import patterns, include, url
 from django.contrib import admin
 
+from .models import API_LOOKUP_PATH
+from .views import autocomplete_models
+
 
 admin.autodiscover()
 
 urlpatterns = patterns(
     '',
+    # indexed prefix lookups for models with a normalized search key, the
+    # widgets keep using the package's views below
+    url(r'^%s/(?P<name>%s)/?$' % (
+        API_LOOKUP_PATH, '|'.join(sorted(autocomplete_models()))),
+        'project.views.autocomplete', name='autocomplete'),
+    url(r'^%s/_cache/$' % API_LOOKUP_PATH,
+        'project.views.autocomplete_cache_stats',
+        name='autocomplete-cache-stats'),
+    url(r'^_instrumentation/$', 'project.views.instrumentation_stats',
+        name='instrumentation-stats'),
+
     # the models must define path to autocomplete view
     url(r'', include('django_autocomplete.urls')),
 
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.apps import apps
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.http import HttpResponse
+
+from .cache import get_cache
+from . import fulltext
+from .instrumentation import get_registry
+from .text import normalize
+
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 100
+
+
+def autocomplete_models():
+    """
+    Map the autocomplete name of each model with a ``search_key`` to the
+    model.
+    """
+    models = {}
+    for model in apps.get_app_config('project').get_models():
+        field_names = [f.name for f in model._meta.fields]
+        if hasattr(model, 'autocomplete') and 'search_key' in field_names:
+            models[model.autocomplete.name] = model
+    return models
+
+
+def autocomplete_results(name, query, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Return ``(pk, name)`` pairs for objects whose normalized name starts
+    with ``query``, or for models with a full text index the best matches
+    of ``query``, served from the autocomplete cache when possible.
+    """
+    model = autocomplete_models().get(name)
+    if model is None:
+        raise LookupError(name)
+    index = fulltext.get_index(model)
+
+    def compute():
+        if index is not None and normalize(query):
+            pks = [pk for pk, score in index.search(query, limit)]
+            names = dict(model.objects.filter(pk__in=pks).values_list('pk', 'name'))
+            return [(pk, names[pk]) for pk in pks if pk in names]
+        qs = model.objects.autocomplete(query).values_list('pk', 'name')
+        return list(qs[:limit])
+
+    return get_cache().get_or_compute(name, query, limit, compute)
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = AUTOCOMPLETE_LIMIT
+    return max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+
+
+def autocomplete(request, name):
+    """
+    JSON prefix lookup for the ``api/lookup/<name>`` paths.
+    """
+    query = request.GET.get('q', request.GET.get('term', ''))
+    try:
+        results = autocomplete_results(name, query, get_limit(request))
+    except LookupError:
+        raise Http404
+    data = [{'pk': pk, 'name': value} for pk, value in results]
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@staff_member_required
+def autocomplete_cache_stats(request):
+    """
+    JSON hit and miss counters of the autocomplete cache in this process.
+    """
+    data = get_cache().stats()
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@staff_member_required
+def instrumentation_stats(request):
+    """
+    JSON latency and SQL histograms per view of this process, for the
+    current window and the last flushed one.
+    """
+    data = get_registry().as_dict()
+    return HttpResponse(json.dumps(data, sort_keys=True), content_type='application/json')
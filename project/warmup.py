@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Work done once, before the server forks its workers, that every worker
+would otherwise repeat on its first requests.
+
+:func:`warm_up` imports the URLconf and the views it names, reverses the
+admin URLs, compiles the admin templates, fills the ContentType cache and
+the autocomplete cache, and reports how long each step took. Workers forked
+afterwards share the loaded modules copy on write.
+
+A step that fails is logged and the others still run:
+
+    >>> import logging.config
+    >>> from project.settings import LOGGING
+    >>> logging.config.dictConfig(LOGGING)
+    >>> records = []
+    >>> handler = logging.Handler()
+    >>> handler.emit = records.append
+    >>> logger.handlers = [handler]
+    >>> def migrate_first():
+    ...     raise ValueError('no such table')
+    >>> timings = warm_up(steps=[
+    ...     ('content types', prime_content_types), ('broken', migrate_first)])
+    >>> [(name, result is None) for name, result, seconds in timings]
+    [('content types', False), ('broken', True), ('freeze', False)]
+    >>> [(record.levelname, record.getMessage().split(':')[0]) for record in records]
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('INFO', 'warm up content types'), ('ERROR', 'warm up broken failed'),
+     ('INFO', 'warm up broken'), ('INFO', 'warm up freeze'), ('INFO', 'warm up')]
+    >>> logger.handlers = []
+
+"""
+import gc
+import logging
+import time
+
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import NoReverseMatch
+from django.core.urlresolvers import RegexURLResolver
+from django.core.urlresolvers import get_resolver
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.template import Context
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.template.loader import select_template
+from django.template.loader_tags import ExtendsNode
+from django.template.loader_tags import IncludeNode
+from django.utils import six
+
+
+logger = logging.getLogger('project.warmup')
+
+ADMIN_TEMPLATES = [
+    'admin/index.html',
+    'admin/login.html',
+    'admin/app_index.html',
+    'admin/base_site.html',
+    ]
+
+MODEL_ADMIN_TEMPLATES = [
+    'change_list_template',
+    'change_form_template',
+    'delete_confirmation_template',
+    'object_history_template',
+    ]
+
+
+def iter_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, RegexURLResolver):
+            for inner in iter_patterns(pattern.url_patterns):
+                yield inner
+        else:
+            yield pattern
+
+
+def resolve_urls():
+    """
+    Import the URLconf, which runs ``admin.autodiscover()``, and every view
+    it names, and reverse the admin URLs of each model.
+    """
+    resolver = get_resolver(None)
+    count = 0
+    for pattern in iter_patterns(resolver.url_patterns):
+        # imports the view
+        pattern.callback
+        count += 1
+    for model in admin.site._registry:
+        info = model._meta.app_label, model._meta.model_name
+        for view in ('changelist', 'add'):
+            try:
+                reverse('admin:%s_%s_%s' % (info + (view,)))
+            except NoReverseMatch:
+                pass
+    return count
+
+
+def load_template(names, loaded):
+    """
+    Compile the first of ``names`` found and the templates it extends or
+    includes by a constant name.
+    """
+    try:
+        template = select_template(names) if isinstance(names, list) else get_template(names)
+    except TemplateDoesNotExist:
+        return
+    loaded.add(getattr(template, 'name', None))
+    nodelist = getattr(template, 'nodelist', [])
+    for node in nodelist.get_nodes_by_type(ExtendsNode) if nodelist else []:
+        try:
+            name = node.parent_name.resolve(Context())
+        except (AttributeError, TemplateDoesNotExist):
+            continue
+        if isinstance(name, six.string_types) and name not in loaded:
+            load_template(name, loaded)
+    for node in nodelist.get_nodes_by_type(IncludeNode) if nodelist else []:
+        name = getattr(getattr(node, 'template', None), 'var', None)
+        if isinstance(name, six.string_types) and name not in loaded:
+            load_template(name, loaded)
+
+
+def compile_templates():
+    """
+    Compile the admin templates, by the names each model admin looks up,
+    so that the cached template loader holds them.
+    """
+    loaded = set()
+    for name in ADMIN_TEMPLATES:
+        load_template(name, loaded)
+    for model, model_admin in admin.site._registry.items():
+        opts = model._meta
+        for attribute in MODEL_ADMIN_TEMPLATES:
+            template = getattr(model_admin, attribute, None)
+            base = attribute[:-len('_template')]
+            load_template(template or [
+                'admin/%s/%s/%s.html' % (opts.app_label, opts.model_name, base),
+                'admin/%s/%s.html' % (opts.app_label, base),
+                'admin/%s.html' % base,
+                ], loaded)
+    return len(loaded)
+
+
+def prime_content_types():
+    return len(ContentType.objects.get_for_models(*apps.get_models()))
+
+
+def prime_autocomplete():
+    """
+    Cache the empty query of each autocomplete, the one sent when a widget
+    opens, and pick the full text backend of each index.
+    """
+    from . import fulltext
+    from .views import autocomplete_models
+    from .views import autocomplete_results
+
+    names = autocomplete_models()
+    for name in names:
+        autocomplete_results(name, '')
+    for index in fulltext.INDEXES.values():
+        index.backend()
+    return len(names)
+
+
+def freeze():
+    """
+    Collect garbage now and, where Python can, keep the survivors out of
+    later collections so that workers do not copy their pages.
+    """
+    collected = gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    return collected
+
+
+STEPS = [
+    ('urls', resolve_urls),
+    ('templates', compile_templates),
+    ('content types', prime_content_types),
+    ('autocomplete', prime_autocomplete),
+    ]
+
+
+def warm_up(application=None, steps=None):
+    """
+    Run each of ``steps`` and log its time, then close the database
+    connections, which must not be shared with forked workers. Warming up
+    is best effort: a step that fails, for example before the database is
+    migrated, is logged and skipped. Returns ``(name, result, seconds)``
+    for each step, the result of a failed step is ``None``.
+    """
+    timings = []
+    steps = list(steps or STEPS)
+    if application is not None and hasattr(application, 'load_middleware'):
+        steps.insert(0, ('middleware', application.load_middleware))
+    steps.append(('freeze', freeze))
+    started = time.time()
+    try:
+        for name, step in steps:
+            step_started = time.time()
+            try:
+                result = step()
+            except Exception:
+                logger.exception('warm up %s failed', name)
+                result = None
+            seconds = time.time() - step_started
+            timings.append((name, result, seconds))
+            logger.info('warm up %s: %.3fs (%s)', name, seconds, result)
+    finally:
+        for connection in connections.all():
+            connection.close()
+    logger.info('warm up: %.3fs', time.time() - started)
+    return timings
@@ -13,3 +13,10 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# set DJANGO_WARMUP=1 when a preforking server's master loads the application
+# (gunicorn --preload, uwsgi without lazy-apps), it then runs once and
+# workers start warm
+if os.environ.get('DJANGO_WARMUP', '0') == '1':
+    from project.warmup import warm_up
+    warm_up(application)
+
@@ -18,6 +18,15 @@ DEFAULT_SETTINGS = dict(
             "ENGINE": "django.db.backends.sqlite3"
             }
         },
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+            },
+        "shared": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "shared"
+            }
+        },
     SECRET_KEY='#',
     STATIC_URL = '/static/',
     MIDDLEWARE_CLASSES=(
@@ -28,6 +37,21 @@ DEFAULT_SETTINGS = dict(
     )
 
 
+def parse_args(argv, runner_class):
+    """
+    ``(runner_class, runner_options, do_coverage)`` for the command line
+    ``argv``: ``coverage`` or ``parallel [processes]``.
+    """
+    runner_options = {}
+    do_coverage = len(argv) > 1 and argv[1] == 'coverage'
+    if len(argv) > 1 and argv[1] == 'parallel':
+        from project.testrunner import ParallelDiscoverRunner
+        runner_class = ParallelDiscoverRunner
+        if len(argv) > 2:
+            runner_options['processes'] = int(argv[2])
+    return runner_class, runner_options, do_coverage
+
+
 def runtests():
     if not settings.configured:
         settings.configure(**DEFAULT_SETTINGS)
@@ -48,10 +72,7 @@ def runtests():
         runner_class = DjangoTestSuiteRunner
         test_args = ['tests']
 
-    do_coverage = False
-    if len(sys.argv) > 1:
-        if sys.argv[1] == 'coverage':
-            do_coverage = True
+    runner_class, runner_options, do_coverage = parse_args(sys.argv, runner_class)
 
     if do_coverage:
         from coverage import coverage
@@ -59,7 +80,8 @@ def runtests():
         cov.start()
 
     failures = runner_class(
-        verbosity=1, interactive=True, failfast=False).run_tests(test_args)
+        verbosity=1, interactive=True, failfast=False,
+        **runner_options).run_tests(test_args)
 
     if do_coverage:
         cov.stop()